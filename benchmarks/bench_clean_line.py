@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mide el rendimiento de Parser._clean_line con sentencias de varios megas.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el):
+
+    python ../benchmarks/bench_clean_line.py --conf ../conf/config.conf --sizes 1 4 16
+
+Escribe un json por cada tamaño con el numero de literales enmascarados, el tiempo y los MB/s.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rosqltta.parser import Parser  # noqa: E402
+
+# Fragmento que se repite hasta alcanzar el tamaño pedido: columnas, variables hive, literales y constantes
+_CHUNK = "t1.col_a = '2013-06-01' AND col_b IN (1, 22, 'x,y') AND col_c = ${hivevar:valor} OR col_d > 1000 "
+
+
+def build_statement(size):
+    """Construye una sentencia de aproximadamente size bytes."""
+    repeat = max(1, size // len(_CHUNK))
+    return 'SELECT col_a FROM t1 WHERE ' + _CHUNK * repeat + 'AND 1 = 1'
+
+
+def run(parser, size, repeat):
+    line = build_statement(size)
+    best = None
+    words = 0
+    for _ in range(repeat):
+        parser._Parser__words = []
+        start = time.perf_counter()
+        parser._clean_line(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        words = len(parser.get_words())
+
+    return {'bytes': len(line), 'words': words, 'seconds': round(best, 4),
+            'mb_per_second': round(len(line) / best / 2 ** 20, 2)}
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser.')
+    args.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 16], help='Tamaños de las sentencias, en MB.')
+    args.add_argument('--repeat', type=int, default=3, help='Repeticiones por tamaño; se toma la mejor.')
+    args = args.parse_args()
+
+    parser = Parser(args.conf)
+    for size in args.sizes:
+        print(json.dumps(dict(size_mb=size, **run(parser, int(size * 2 ** 20), args.repeat))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mide la conversion de un excel de mapeos a json de rosqltta.parse_excel con un excel sintetico.
+
+Uso:
+
+    python benchmarks/bench_parse_excel.py --rows 10000 100000 500000 --baseline-rows 20000
+
+Genera un excel con el formato de parse_excel (Tabla Origen, Tabla, columnaLegacy, Code), en el que una parte de las
+filas hace referencia a varias tablas y algunas columnas se repiten en la misma tabla. Para cada tamaño escribe un json
+con el tiempo de build_jsons y, si el tamaño no supera --baseline-rows, el tiempo del procesamiento fila a fila que se
+usaba antes y si los dos generan los mismos json. Con --excel tambien mide process_all completo, leyendo el excel.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rosqltta.parse_excel import build_jsons, process_all  # noqa: E402
+
+
+def generate(rows, tables, columns, multi, seed):
+    """Genera las filas del excel.
+
+    Parameters
+    ----------
+    rows: int
+        Numero de filas.
+    tables: int
+        Numero de tablas origen distintas.
+    columns: int
+        Numero de columnas distintas de cada tabla. Si hay mas filas que columnas, se repiten.
+    multi: float
+        Proporcion de filas que hacen referencia a dos o tres tablas.
+    seed: int
+        Semilla del generador.
+
+    Returns
+    -------
+    pd.DataFrame
+        Filas del excel.
+    """
+    rand = random.Random(seed)
+    origin, names, legacy, codes = [], [], [], []
+    for i in range(rows):
+        count = rand.choice((2, 3)) if rand.random() < multi else 1
+        table = rand.sample(range(tables), count)
+        origin.append(';'.join('t_legacy_{}'.format(t) for t in table))
+        names.append('t_new_{}'.format(table[0]))
+        column = rand.randrange(columns)
+        legacy.append('col_{}'.format(column) if rand.random() < 0.5 else 'COL_{}'.format(column))
+        codes.append('c{}_{}'.format(column, i))
+    return pd.DataFrame({'Tabla Origen': origin, 'Tabla': names, 'columnaLegacy': legacy, 'Code': codes},
+                        columns=['Tabla Origen', 'Tabla', 'columnaLegacy', 'Code'])
+
+
+def row_by_row(df, sep):
+    """Procesamiento fila a fila que se usaba antes de build_jsons, con pd.concat en lugar de Series.append."""
+    all_json = {}
+
+    def process_table(table, e):
+        new = pd.concat([pd.Series([table]), e.iloc[1:]])
+        new.index = e.index
+        entry = all_json.get(new['Tabla Origen'], {'old_name': new['Tabla Origen'], 'new_name': new['Tabla'],
+                                                   'fields': {}})
+        entry['fields'].setdefault(new['columnaLegacy'].upper(), new['Code'])
+        all_json[new['Tabla Origen']] = entry
+
+    def process_row(e):
+        for table in e.iloc[0].split(sep):
+            process_table(table, e)
+
+    df.apply(process_row, axis=1)
+    return all_json
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, round(time.perf_counter() - start, 3)
+
+
+def run(rows, args):
+    df = generate(rows, args.tables, args.columns, args.multi, args.seed)
+    result = {'rows': rows}
+    jsons, result['build_jsons_seconds'] = measure(build_jsons, df, ';')
+    result['tables'] = len(jsons)
+    if rows <= args.baseline_rows:
+        baseline, result['row_by_row_seconds'] = measure(row_by_row, df, ';')
+        result['same_output'] = json.dumps(baseline) == json.dumps(jsons)
+    if args.excel:
+        with tempfile.TemporaryDirectory() as path:
+            excel = os.path.join(path, 'mapping.xlsx')
+            df.to_excel(excel, index=False)
+            os.mkdir(os.path.join(path, 'mapping'))
+            _, result['process_all_seconds'] = measure(process_all, excel, ';', os.path.join(path, 'mapping'))
+    return result
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000], help='Filas de cada excel.')
+    args.add_argument('--tables', type=int, default=5000, help='Tablas origen distintas.')
+    args.add_argument('--columns', type=int, default=200, help='Columnas distintas de cada tabla.')
+    args.add_argument('--multi', type=float, default=0.1, help='Proporcion de filas con varias tablas.')
+    args.add_argument('--baseline-rows', type=int, default=20000,
+                      help='Tamaño maximo con el que se mide tambien el procesamiento fila a fila, que es muy lento.')
+    args.add_argument('--excel', action='store_true', help='Mide tambien process_all escribiendo y leyendo el excel.')
+    args.add_argument('--seed', type=int, default=0, help='Semilla del generador.')
+    args = args.parse_args()
+
+    for rows in args.rows:
+        print(json.dumps(run(rows, args)))
+
+
+if __name__ == '__main__':
+    main()
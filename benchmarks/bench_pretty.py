@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compara el formateador a partir del arbol con sqlparse en Parser.rebuild_query.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el):
+
+    python ../benchmarks/bench_pretty.py --conf ../conf/config.conf --repeat 200
+
+Escribe un json por cada formateador y query con el tiempo medio de rebuild_query en milisegundos.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rosqltta.parser import Parser  # noqa: E402
+
+QUERIES = {
+    'simple': "SELECT t1.a, b FROM t1 WHERE (a = 'x' AND b = 2) OR c = 4",
+    'subqueries': ("SELECT t.a, s.b FROM t1 t, (SELECT a, b FROM (SELECT a, b FROM t2 WHERE a > 1) AS u "
+                   "WHERE b < 10) AS s WHERE t.a = s.a AND t.b = 3"),
+    'wide': 'SELECT ' + ', '.join('a AS c{}'.format(i) for i in range(200)) + ' FROM t1 WHERE a = 1',
+    'union': ' UNION ALL '.join('SELECT a, b FROM t1 WHERE a = {} AND b > 0'.format(i) for i in range(20)),
+}
+
+
+def run(conf, query, repeat):
+    parser = Parser(conf, backend='earley')
+    parser.parse_query(query).rename_tree()
+    words = list(parser.get_words())
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser._Parser__words = list(words)
+        parser.rebuild_query(comments=False)
+
+    return round((time.perf_counter() - start) / repeat * 1000, 3)
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser.')
+    args.add_argument('--repeat', type=int, default=200, help='Repeticiones de rebuild_query por query.')
+    args = args.parse_args()
+
+    with open(args.conf) as f:
+        config = json.load(f)
+
+    with tempfile.TemporaryDirectory() as path:
+        for printer in Parser.PRETTY_PRINTERS:
+            conf = os.path.join(path, printer + '.json')
+            with open(conf, 'w') as f:
+                json.dump(dict(config, pretty_printer=printer), f)
+            for name, query in QUERIES.items():
+                print(json.dumps({'printer': printer, 'query': name, 'ms': run(conf, query, args.repeat)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compara la codificacion binaria de arboles de rosqltta.tree con pickle.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el):
+
+    python ../benchmarks/bench_tree_encoding.py --conf ../conf/config.conf --statements 20
+
+Parsea las sentencias de cada carga de workload.py y, para cada arbol, mide el tamaño y el tiempo de codificar y
+decodificar con encode/decode (a nltk.Tree y a CompactTree) y con pickle (del nltk.Tree y del CompactTree). Escribe un
+json por carga con el tamaño medio en KB y los tiempos medios en milisegundos. Con pickle, los arboles mas profundos
+que el limite de recursividad de Python no se pueden serializar; se indican en 'pickle_errors'.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rosqltta.parser import Parser  # noqa: E402
+from rosqltta.tree import compact, decode, encode  # noqa: E402
+from workload import WORKLOADS, generate, write_mapping_dir  # noqa: E402
+
+
+def measure(function, argument, repeat):
+    """Ejecuta la funcion repeat veces y devuelve el resultado y el mejor tiempo, en milisegundos."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def compare(tree, repeat):
+    """Mide cada codificacion de un arbol.
+
+    Returns
+    -------
+    dict
+        Tamaño en bytes y tiempos de codificar y decodificar de cada metodo, o None si pickle falla.
+    """
+    tree_compact = compact(tree)
+    result = {}
+    data, result['encode_ms'] = measure(encode, tree, repeat)
+    result['encode_bytes'] = len(data)
+    _, result['decode_nltk_ms'] = measure(decode, data, repeat)
+    _, result['decode_compact_ms'] = measure(lambda value: decode(value, 'compact'), data, repeat)
+    for name, value in (('pickle_nltk', tree), ('pickle_compact', tree_compact)):
+        try:
+            data, result[name + '_dumps_ms'] = measure(lambda item: pickle.dumps(item, pickle.HIGHEST_PROTOCOL),
+                                                       value, repeat)
+        except RecursionError:
+            result[name + '_bytes'] = None
+            continue
+        result[name + '_bytes'] = len(data)
+        _, result[name + '_loads_ms'] = measure(pickle.loads, data, repeat)
+    return result
+
+
+def run(parser, workload, args):
+    statements = generate(workload, args.statements, args.tables, args.columns, args.size.get(workload), args.seed)
+    results = []
+    for query in statements:
+        try:
+            results.append(compare(parser.parse_query(query).tree, args.repeat))
+        except Exception:
+            continue
+
+    summary = {'workload': workload, 'size': args.size.get(workload, WORKLOADS[workload][1]), 'trees': len(results),
+               'pickle_errors': sum(1 for result in results if result['pickle_nltk_bytes'] is None)}
+    for key in sorted({key for result in results for key in result}):
+        values = [result[key] for result in results if result.get(key) is not None]
+        if values:
+            mean = sum(values) / len(values)
+            summary[key.replace('_bytes', '_kb')] = round(mean / 1024 if key.endswith('_bytes') else mean, 3)
+    return summary
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser, del que se '
+                                                                    'toma la gramatica.')
+    args.add_argument('--backend', choices=Parser.BACKENDS, default='earley', help='Backend del parser.')
+    args.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS), default=sorted(WORKLOADS),
+                      help='Cargas que se miden.')
+    args.add_argument('--size', nargs='*', default=[], metavar='CARGA=TAMAÑO',
+                      help='Tamaño de las sentencias de una carga, por ejemplo wide_select=500.')
+    args.add_argument('--statements', type=int, default=20, help='Sentencias por carga.')
+    args.add_argument('--tables', type=int, default=100, help='Tablas del directorio de mapeos.')
+    args.add_argument('--columns', type=int, default=20, help='Columnas de cada tabla.')
+    args.add_argument('--repeat', type=int, default=5, help='Repeticiones de cada medida, se toma la mejor.')
+    args.add_argument('--seed', type=int, default=0, help='Semilla del generador.')
+    args = args.parse_args()
+    args.size = {workload: int(size) for workload, size in (item.split('=', 1) for item in args.size)}
+    logging.getLogger('rosqltta').setLevel(logging.CRITICAL)
+
+    with open(args.conf) as f:
+        config = json.load(f)
+
+    with tempfile.TemporaryDirectory() as path:
+        write_mapping_dir(os.path.join(path, 'mapping'), args.tables, args.columns)
+        conf = os.path.join(path, 'config.json')
+        with open(conf, 'w') as f:
+            json.dump(dict(config, mapping_dir=os.path.join(path, 'mapping')), f)
+        parser = Parser(conf, backend=args.backend)
+        for workload in args.workloads:
+            print(json.dumps(run(parser, workload, args)))
+
+
+if __name__ == '__main__':
+    main()
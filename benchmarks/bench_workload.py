@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Mide el rendimiento del parser con las cargas sinteticas de workload.py.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el):
+
+    python ../benchmarks/bench_workload.py --conf ../conf/config.conf --tables 10000 --statements 20
+
+Genera un directorio de mapeos con --tables tablas y, para cada carga, mide por separado parse_query, rename_tree y
+rebuild_query de cada sentencia y save_renamed de todas ellas. Escribe un json por carga con las sentencias por
+segundo, los percentiles de latencia en milisegundos y el pico de memoria en MB. Las sentencias que no se pueden
+renombrar (por ejemplo INSERT ... VALUES) solo cuentan en el parseo y se indican en 'errors'.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rosqltta.parser import Parser  # noqa: E402
+from rosqltta.instrumentation import Aggregator  # noqa: E402
+from workload import WORKLOADS, generate, write_mapping_dir  # noqa: E402
+
+PHASES = ('parse_query', 'rename_tree', 'rebuild_query')
+
+
+def process(parser, statements, aggregator=None):
+    """Parsea, renombra y reconstruye cada sentencia y, si se indica, envia sus tiempos al agregador.
+
+    Returns
+    -------
+    list(str)
+        Sentencias que se han podido renombrar.
+    """
+    renamed = []
+    for query in statements:
+        start = time.perf_counter()
+        parser.parse_query(query)
+        parsed = time.perf_counter()
+        seconds = {'parse_query': parsed - start}
+        try:
+            parser.rename_tree()
+            seconds['rename_tree'] = time.perf_counter() - parsed
+            rebuilt = time.perf_counter()
+            parser.rebuild_query(comments=False)
+            seconds['rebuild_query'] = time.perf_counter() - rebuilt
+            renamed.append(query)
+        except Exception as err:
+            error = type(err).__name__
+        else:
+            error = None
+
+        if aggregator is not None:
+            record = {'stage': 'statement', 'seconds': dict(seconds, total=sum(seconds.values()))}
+            aggregator.emit(dict(record, error=error) if error else record)
+
+    return renamed
+
+
+def save_renamed(parser, statements, path, workers):
+    """Guarda las sentencias en ficheros de 10 sentencias y mide save_renamed sobre ellos."""
+    input_path = os.path.join(path, 'input')
+    output_path = os.path.join(path, 'output')
+    os.makedirs(input_path)
+    os.makedirs(output_path)
+    for i in range(0, len(statements), 10):
+        with open(os.path.join(input_path, 'file{:05d}.hql'.format(i // 10)), 'w') as f:
+            f.write(''.join(query + ';\n' for query in statements[i:i + 10]))
+
+    start = time.perf_counter()
+    parser.save_renamed(parser.load_queries(input_path, stream=True), output_path, workers=workers)
+    return time.perf_counter() - start
+
+
+def peak_memory(parser, statements):
+    """Pico de memoria reservada por Python, en MB, al procesar las sentencias."""
+    tracemalloc.start()
+    try:
+        process(parser, statements)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def run(conf, workload, args, path):
+    statements = generate(workload, args.statements, args.tables, args.columns, args.size.get(workload), args.seed)
+    parser = Parser(conf, backend=args.backend)
+    process(parser, statements[:1])
+
+    aggregator = Aggregator()
+    start = time.perf_counter()
+    renamed = process(parser, statements, aggregator)
+    elapsed = time.perf_counter() - start
+
+    summary = aggregator.summary()
+    result = {'workload': workload, 'size': args.size.get(workload, WORKLOADS[workload][1]),
+              'statements': len(statements), 'errors': summary.get('statement.errors', {}).get('count', 0),
+              'statements_per_second': round(len(statements) / elapsed, 2)}
+    for phase in PHASES + ('total',):
+        if 'statement.' + phase in summary:
+            result[phase + '_ms'] = {key: round(value * 1000, 3) for key, value in summary['statement.' + phase].items()
+                                     if key not in ('count', 'total')}
+
+    if renamed:
+        seconds = save_renamed(parser, renamed, os.path.join(path, workload), args.workers)
+        result['save_renamed'] = {'statements': len(renamed), 'seconds': round(seconds, 3),
+                                  'statements_per_second': round(len(renamed) / seconds, 2)}
+    if not args.no_memory:
+        result['peak_memory_mb'] = round(peak_memory(parser, statements), 2)
+    return result
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser, del que se '
+                                                                    'toma la gramatica.')
+    args.add_argument('--backend', choices=Parser.BACKENDS, default='earley', help='Backend del parser.')
+    args.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS), default=sorted(WORKLOADS),
+                      help='Cargas que se miden.')
+    args.add_argument('--size', nargs='*', default=[], metavar='CARGA=TAMAÑO',
+                      help='Tamaño de las sentencias de una carga, por ejemplo wide_select=500.')
+    args.add_argument('--statements', type=int, default=20, help='Sentencias por carga.')
+    args.add_argument('--tables', type=int, default=10000, help='Tablas del directorio de mapeos.')
+    args.add_argument('--columns', type=int, default=20, help='Columnas de cada tabla.')
+    args.add_argument('--tree-format', choices=Parser.TREE_FORMATS, default='nltk', help='Formato de los arboles.')
+    args.add_argument('--workers', type=int, help='Procesos de save_renamed.')
+    args.add_argument('--seed', type=int, default=0, help='Semilla del generador.')
+    args.add_argument('--no-memory', action='store_true', help='No medir el pico de memoria.')
+    args = args.parse_args()
+    args.size = {workload: int(size) for workload, size in (item.split('=', 1) for item in args.size)}
+    # Los errores se cuentan en el resultado de cada carga
+    logging.getLogger('rosqltta').setLevel(logging.CRITICAL)
+
+    with open(args.conf) as f:
+        config = json.load(f)
+
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        write_mapping_dir(os.path.join(path, 'mapping'), args.tables, args.columns)
+        conf = os.path.join(path, 'config.json')
+        with open(conf, 'w') as f:
+            json.dump(dict(config, mapping_dir=os.path.join(path, 'mapping'), tree_format=args.tree_format), f)
+        print(json.dumps({'mapping_tables': args.tables, 'seconds': round(time.perf_counter() - start, 3)}))
+
+        for workload in args.workloads:
+            print(json.dumps(run(conf, workload, args, path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Generador de cargas sinteticas de HQL para los benchmarks: sentencias parametrizadas que acepta la gramatica y
+directorios de mapeos con tantas tablas como se quiera.
+
+Las tablas se llaman T0, T1... y sus columnas C0, C1..., de forma que todas las sentencias se pueden renombrar con los
+mapeos generados por write_mapping_dir.
+"""
+
+import json
+import os
+import random
+
+
+def _table(rng, tables):
+    return 'T{}'.format(rng.randrange(tables))
+
+
+def _column(rng, columns):
+    return 'C{}'.format(rng.randrange(columns))
+
+
+def wide_select(rng, tables, columns, size):
+    """SELECT con size columnas de una tabla, con alias y literales en el WHERE."""
+    table = _table(rng, tables)
+    select = ', '.join('{}.{} AS X{}'.format(table, _column(rng, columns), i) for i in range(size))
+    return "SELECT {} FROM {} WHERE {}.{} = 'valor' AND {}.{} > 10".format(select, table, table, _column(rng, columns),
+                                                                           table, _column(rng, columns))
+
+
+def nested_subqueries(rng, tables, columns, size):
+    """size subqueries anidadas, cada una con su alias, sobre una tabla."""
+    table = _table(rng, tables)
+    first, second = _column(rng, columns), _column(rng, columns)
+    query = 'SELECT {0}.{1}, {0}.{2} FROM {0} WHERE {0}.{1} > 0'.format(table, first, second)
+    for level in range(size):
+        alias = 'S{}'.format(level)
+        query = 'SELECT {0}.{1}, {0}.{2} FROM ({3}) {0} WHERE {0}.{2} IS NOT NULL'.format(alias, first, second, query)
+    return query
+
+
+def union_chain(rng, tables, columns, size):
+    """Cadena de size SELECT unidos con UNION ALL."""
+    selects = []
+    for _ in range(size):
+        table = _table(rng, tables)
+        selects.append('SELECT {0}.{1}, {0}.{2} FROM {0} WHERE {0}.{1} = {3}'.format(
+            table, _column(rng, columns), _column(rng, columns), rng.randrange(1000)))
+    return ' UNION ALL '.join(selects)
+
+
+def joins(rng, tables, columns, size):
+    """SELECT con size JOIN encadenados, cada tabla con su alias."""
+    column = _column(rng, columns)
+    select = ['A0.{}'.format(_column(rng, columns))]
+    query = ' FROM {} A0'.format(_table(rng, tables))
+    for i in range(1, size + 1):
+        kind = rng.choice(['JOIN', 'LEFT JOIN', 'INNER JOIN'])
+        query += ' {} {} A{} ON A{}.{} = A{}.{}'.format(kind, _table(rng, tables), i, i - 1, column, i, column)
+        select.append('A{}.{}'.format(i, _column(rng, columns)))
+    return 'SELECT ' + ', '.join(select) + query
+
+
+def window_functions(rng, tables, columns, size):
+    """SELECT con size funciones de ventana sobre una tabla."""
+    table = _table(rng, tables)
+    windows = []
+    for i in range(size):
+        function = rng.choice(['ROW_NUMBER()', 'SUM({}.{})'.format(table, _column(rng, columns)),
+                               'COUNT({}.{})'.format(table, _column(rng, columns))])
+        windows.append('{} OVER (PARTITION BY {}.{} ORDER BY {}.{} DESC) AS W{}'.format(
+            function, table, _column(rng, columns), table, _column(rng, columns), i))
+    return 'SELECT {}.{}, {} FROM {}'.format(table, _column(rng, columns), ', '.join(windows), table)
+
+
+def insert_values(rng, tables, columns, size):
+    """INSERT ... VALUES con size filas."""
+    rows = ("({}, 'texto {}', {})".format(rng.randrange(10 ** 6), i, rng.randrange(100)) for i in range(size))
+    return 'INSERT INTO TABLE {} VALUES {}'.format(_table(rng, tables), ', '.join(rows))
+
+
+# Generador y tamaño por defecto de cada carga
+WORKLOADS = {
+    'wide_select': (wide_select, 100),
+    'nested_subqueries': (nested_subqueries, 20),
+    'union_chain': (union_chain, 30),
+    'joins': (joins, 10),
+    'window_functions': (window_functions, 20),
+    'insert_values': (insert_values, 100),
+}
+
+
+def generate(workload, statements, tables, columns, size=None, seed=0):
+    """Genera las sentencias de una carga.
+
+    Parameters
+    ----------
+    workload: str
+        Nombre de la carga, ver WORKLOADS.
+    statements: int
+        Numero de sentencias.
+    tables: int
+        Numero de tablas mapeadas, ver write_mapping_dir.
+    columns: int
+        Numero de columnas de cada tabla.
+    size: int
+        Tamaño de cada sentencia (columnas, niveles, SELECT, JOIN, ventanas o filas). Por defecto, el de WORKLOADS.
+    seed: int
+        Semilla, para que la carga sea reproducible.
+
+    Returns
+    -------
+    list(str)
+        Sentencias.
+    """
+    generator, default = WORKLOADS[workload]
+    rng = random.Random(seed)
+    return [generator(rng, tables, columns, size or default) for _ in range(statements)]
+
+
+def write_mapping_dir(path, tables, columns):
+    """Escribe un directorio de mapeos con las tablas T0...T<tables-1>, cada una con las columnas C0...C<columns-1>.
+
+    Parameters
+    ----------
+    path: str
+        Directorio, que se crea si no existe.
+    tables: int
+        Numero de tablas.
+    columns: int
+        Numero de columnas de cada tabla.
+    """
+    os.makedirs(path, exist_ok=True)
+    for i in range(tables):
+        table = 'T{}'.format(i)
+        entry = {'old_name': table, 'new_name': 'nueva_t{}'.format(i),
+                 'fields': {'C{}'.format(j): 'nueva_c{}_t{}'.format(j, i) for j in range(columns)}}
+        with open(os.path.join(path, table + '.json'), 'w') as f:
+            json.dump(entry, f)
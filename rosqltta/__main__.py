@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Renombra ficheros de queries desde la linea de comandos.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el) y con el directorio del
+repositorio en el PYTHONPATH:
+
+    python -m rosqltta --conf ../conf/config.conf data/query_input data/query_output --workers 4
+    cat queries.hql | python -m rosqltta --conf ../conf/config.conf > renombradas.hql
+
+Si la entrada es un directorio, se renombran todos sus ficheros con Parser.save_renamed y se guardan en el directorio
+de salida. Si es '-' (la entrada estandar) o un fichero, las sentencias se renombran a medida que se leen con
+Parser.stream_renamed y se escriben en la salida, '-' para la salida estandar. Al terminar se persisten los mapeos y se
+escribe un resumen de rendimiento en la salida de error.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from rosqltta.parser import Parser
+from rosqltta.instrumentation import JsonLinesSink
+
+
+def parse_args(argv=None):
+    arguments = argparse.ArgumentParser(prog='python -m rosqltta', description=__doc__.splitlines()[0])
+    arguments.add_argument('input', nargs='?', default='-',
+                           help="Directorio o fichero de queries, o '-' para la entrada estandar.")
+    arguments.add_argument('output', nargs='?', default='-',
+                           help="Directorio o fichero de salida, o '-' para la salida estandar.")
+    arguments.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser.')
+    arguments.add_argument('--workers', type=int, help='Procesos en paralelo, solo si la entrada es un directorio.')
+    arguments.add_argument('--cache-dir', help='Directorio de la cache de arboles.')
+    arguments.add_argument('--incremental', action='store_true',
+                           help='Solo se renombran las sentencias que han cambiado, si la entrada es un directorio.')
+    arguments.add_argument('--udf', nargs='*', default=[], help='Funciones definidas por el usuario.')
+    arguments.add_argument('--hivevar', nargs='*', default=[], help='Variables hive, como variable=valor.')
+    arguments.add_argument('--backend', choices=Parser.BACKENDS, help='Backend del parser.')
+    arguments.add_argument('--summary', choices=['text', 'json', 'none'], default='text',
+                           help='Formato del resumen de rendimiento.')
+    arguments.add_argument('--metrics', help='Fichero en el que se agregan las metricas de cada sentencia, en json '
+                                             'lines. Ver rosqltta.instrumentation.')
+    arguments.add_argument('--log-level', default='INFO', help='Nivel de los mensajes.')
+    args = arguments.parse_args(argv)
+
+    if os.path.isdir(args.input) != (args.output != '-' and os.path.isdir(args.output)):
+        arguments.error('La entrada y la salida tienen que ser las dos directorios o las dos ficheros')
+    if not os.path.isdir(args.input) and (args.workers or args.incremental):
+        arguments.error('--workers e --incremental solo se pueden usar si la entrada es un directorio')
+    return args
+
+
+def summary(timings, seconds):
+    """Resumen de rendimiento: sentencias parseadas por segundo y segundos acumulados en cada fase. Con varios procesos,
+    las fases suman el tiempo de todos ellos.
+
+    Parameters
+    ----------
+    timings: collections.Counter
+        Tiempos acumulados por el parser, ver Parser.timings.
+    seconds: float
+        Duracion total.
+
+    Returns
+    -------
+    dict
+        Resumen.
+    """
+    statements = timings['statements']
+    return {'statements': statements, 'seconds': round(seconds, 3),
+            'statements_per_second': round(statements / seconds, 2) if seconds else 0.0,
+            'parse_seconds': round(timings['parse'], 3), 'rename_seconds': round(timings['rename'], 3),
+            'format_seconds': round(timings['format'], 3)}
+
+
+def _stream(parser, source, target):
+    lines = sys.stdin if source == '-' else open(source, 'r')
+    output = sys.stdout if target == '-' else open(target, 'w')
+    try:
+        for query in parser.stream_renamed(lines, '<stdin>' if source == '-' else os.path.basename(source)):
+            output.write(query + Parser.STATEMENT_END)
+            output.flush()
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    hive_var = dict(var.split('=', 1) for var in args.hivevar)
+    metrics = JsonLinesSink(args.metrics) if args.metrics else None
+    parser = Parser(args.conf, udfs=args.udf or None, hive_var=hive_var, backend=args.backend,
+                    cache_dir=args.cache_dir, log_level=getattr(logging, args.log_level.upper()),
+                    instrumentation=metrics)
+
+    start = time.perf_counter()
+    try:
+        if os.path.isdir(args.input):
+            parser.save_renamed(parser.load_queries(args.input, stream=True), args.output, workers=args.workers,
+                                incremental=args.incremental)
+        else:
+            _stream(parser, args.input, args.output)
+    except BrokenPipeError:
+        # El siguiente comando del pipe ha dejado de leer. Se redirige la salida para que no falle al cerrarla
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        parser.flush_mappings()
+        if metrics is not None:
+            metrics.close()
+        print_summary(summary(parser.timings, time.perf_counter() - start), args.summary)
+
+    return 0
+
+
+def print_summary(result, style):
+    """Escribe el resumen de rendimiento en la salida de error, en texto o en json."""
+    if style == 'json':
+        print(json.dumps(result), file=sys.stderr)
+    elif style == 'text':
+        print('{statements} sentencias en {seconds} s ({statements_per_second} sentencias/s). Parseo: '
+              '{parse_seconds} s, renombrado: {rename_seconds} s, formateo: {format_seconds} s'.format(**result),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from rosqltta.tree import ENCODING_VERSION, decode, encode
+
+
+def fingerprint(*parts):
+    """Calcula la huella de un conjunto de cadenas o bytes, por ejemplo el contenido de la gramatica y las UDFs.
+
+    Returns
+    -------
+    str
+        Huella en hexadecimal.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    """Cache persistente de arboles sintacticos en una base de datos SQLite. Cada arbol se indexa por la huella de la
+    linea preprocesada (ver Parser._clean_line) junto con la de la gramatica, de forma que parsear una sentencia que no
+    ha cambiado entre ejecuciones se reduce a una consulta.
+
+    Los arboles se guardan codificados con rosqltta.tree.encode. Cuando cambia el fichero de la gramatica o la version
+    de la codificacion se vacia la cache. Si se supera el numero maximo de arboles, se eliminan los usados hace mas
+    tiempo. Tambien se guardan las sentencias que no pertenecen a la gramatica, con arbol None.
+
+    Se puede compartir entre procesos e hilos: la conexion se abre en cada proceso e hilo la primera vez que se usa.
+
+    Parameters
+    ----------
+    path: str
+        Directorio de la cache. Se crea si no existe.
+    grammar: str
+        Huella del fichero de la gramatica. Si cambia, se invalidan todos los arboles.
+    key: str
+        Huella del resto de elementos que afectan al arbol, como las UDFs o el backend del parser.
+    max_entries: int
+        Numero maximo de arboles guardados.
+    tree_format: str
+        Formato de los arboles que devuelve get: 'nltk' o 'compact'. Ver rosqltta.tree.decode.
+    """
+    FILE_NAME = 'parse_cache.sqlite'
+
+    def __init__(self, path, grammar, key='', max_entries=100000, tree_format='nltk'):
+        self._path = path
+        self._grammar = grammar
+        self._key = fingerprint(grammar, key)
+        self._max_entries = max_entries
+        self._tree_format = tree_format
+        self._local = threading.local()
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connect(self):
+        """Abre la base de datos, creando las tablas si no existen y vaciandola si ha cambiado la gramatica o la
+        codificacion de los arboles."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            return connection
+
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+
+        connection = sqlite3.connect(os.path.join(self._path, self.FILE_NAME), timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS trees (key TEXT PRIMARY KEY, tree BLOB, accessed REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS trees_accessed ON trees (accessed)')
+            meta = dict(connection.execute("SELECT name, value FROM meta WHERE name IN ('grammar', 'encoding')"))
+            if meta != {'grammar': self._grammar, 'encoding': str(ENCODING_VERSION)}:
+                connection.execute('DELETE FROM trees')
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('grammar', ?)", (self._grammar,))
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('encoding', ?)", (str(ENCODING_VERSION),))
+
+        self._entries = connection.execute('SELECT COUNT(*) FROM trees').fetchone()[0]
+        self._local.connection = connection
+        return connection
+
+    def _hash(self, line):
+        return fingerprint(self._key, line)
+
+    def get(self, line):
+        """Busca el arbol de una linea preprocesada.
+
+        Parameters
+        ----------
+        line: str
+            Linea preprocesada.
+
+        Returns
+        -------
+        (bool, nltk.Tree or rosqltta.tree.CompactNode)
+            Si la linea esta en la cache y su arbol, que es None si no pertenece a la gramatica. Cada llamada devuelve
+            un arbol nuevo, que se puede modificar.
+        """
+        connection = self._connect()
+        key = self._hash(line)
+        row = connection.execute('SELECT tree FROM trees WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        with connection:
+            connection.execute('UPDATE trees SET accessed = ? WHERE key = ?', (time.time(), key))
+
+        return True, decode(row[0], self._tree_format) if row[0] is not None else None
+
+    def put(self, line, tree):
+        """Guarda el arbol de una linea preprocesada.
+
+        Parameters
+        ----------
+        line: str
+            Linea preprocesada.
+        tree: nltk.Tree or rosqltta.tree.CompactNode
+            Arbol de la linea, o None si no pertenece a la gramatica.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO trees VALUES (?, ?, ?)',
+                               (self._hash(line), encode(tree) if tree is not None else None, time.time()))
+
+        self._entries += 1
+        if self._entries > self._max_entries:
+            self._evict()
+
+    def _evict(self):
+        """Elimina los arboles usados hace mas tiempo hasta dejar la cache al 90% de su capacidad, para no tener que
+        hacerlo en cada insercion."""
+        connection = self._connect()
+        with connection:
+            self._entries = connection.execute('SELECT COUNT(*) FROM trees').fetchone()[0]
+            excess = self._entries - int(self._max_entries * 0.9)
+            if excess > 0:
+                connection.execute('DELETE FROM trees WHERE key IN (SELECT key FROM trees ORDER BY accessed LIMIT ?)',
+                                   (excess,))
+                self._entries -= excess
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM trees').fetchone()[0]
+
+    def clear(self):
+        """Elimina todos los arboles."""
+        with self._connect() as connection:
+            connection.execute('DELETE FROM trees')
+        self._entries = 0
+
+    def close(self):
+        """Cierra la conexion del hilo actual con la base de datos. Se vuelve a abrir si se usa de nuevo."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+
+from rosqltta.instrumentation import NULL_TIMER
+
+
+class StatementContext(object):
+    """Estado de la sentencia que esta procesando un parser: arbol, queries y subqueries encontradas, variables y
+    comentarios eliminados y tabla que crea. El parser guarda un contexto por hilo (ver Parser.translate), de forma que
+    la gramatica, el lexer y los mapeos se comparten entre todas las sentencias que se procesan a la vez.
+
+    Parameters
+    ----------
+    mapping: collections.abc.MutableMapping
+        Mapeos de las tablas. Las tablas que crea la sentencia se agregan aqui.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.tree = None
+        self.queries = {}
+        self.reverse_tree = []
+        self.queries_elements = []
+        self.words = []
+        self.comments = []
+        self.creating_table = None
+        self.all_tables = False
+        # Cronometro de la etapa actual, para los contadores de instrumentacion
+        self.timer = NULL_TIMER
+
+
+class Result(namedtuple('Result', ['query', 'tree', 'target', 'sources', 'mapping'])):
+    """Resultado de renombrar una sentencia con Parser.translate.
+
+    Attributes
+    ----------
+    query: str
+        Sentencia renombrada, con los comentarios al principio.
+    tree: nltk.Tree
+        Arbol de la sentencia renombrada.
+    target: str
+        Tabla que crea o en la que inserta la sentencia, si la hay.
+    sources: set(str)
+        Tablas que lee la sentencia.
+    mapping: dict
+        Mapeo de la tabla que crea o en la que inserta la sentencia, si la hay.
+    """
+    __slots__ = ()
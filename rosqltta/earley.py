@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import nltk
+from nltk.grammar import is_nonterminal
+
+
+class EarleyParser(object):
+    """Parser de Earley especifico para la gramatica de hive. Se diferencia del nltk.ChartParser en que:
+        1. Las tablas de prediccion (simbolos anulables y primeros terminales de cada regla) se calculan una sola vez.
+        2. Solo se predicen las reglas que pueden empezar por el siguiente token de la query.
+        3. Para cada item se guarda unicamente la primera derivacion encontrada, de forma que el arbol se reconstruye
+           directamente sin enumerar el resto de arboles posibles. Si un constituyente se puede derivar con varias
+           reglas, se elige la que tiene menos simbolos, igual que hace el nltk.ChartParser con la gramatica de hive.
+
+    Genera arboles nltk.Tree con la misma forma que el nltk.ChartParser: las etiquetas son los simbolos no terminales
+    y las reglas vacias generan nodos sin hijos. La gramatica no puede tener ciclos de reglas unitarias (A -> B -> A).
+    """
+
+    def __init__(self, grammar):
+        self._grammar = grammar
+        self._start = grammar.start()
+        self._rules = [(prod.lhs(), prod.rhs()) for prod in grammar.productions()]
+        self._by_lhs = {}
+        for pid, (lhs, _) in enumerate(self._rules):
+            self._by_lhs.setdefault(lhs, []).append(pid)
+
+        self._null_rule = self._calculate_nullable()
+        self._first = self._calculate_first()
+        self._predictions = {}
+
+    def _calculate_nullable(self):
+        """Calcula los simbolos anulables. Para cada uno se guarda la primera regla que lo hace anulable, con la que
+        se construye su arbol vacio."""
+        null_rule = {}
+        changed = True
+        while changed:
+            changed = False
+            for pid, (lhs, rhs) in enumerate(self._rules):
+                if lhs not in null_rule and all(is_nonterminal(s) and s in null_rule for s in rhs):
+                    null_rule[lhs] = pid
+                    changed = True
+
+        return null_rule
+
+    def _calculate_first(self):
+        """Calcula, para cada regla, los terminales por los que puede empezar, saltando los simbolos anulables."""
+        first = {lhs: set() for lhs in self._by_lhs}
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self._rules:
+                for terminals in self._iter_prefix(rhs, first):
+                    size = len(first[lhs])
+                    first[lhs] |= terminals
+                    changed = changed or size != len(first[lhs])
+
+        return [set().union(*self._iter_prefix(rhs, first)) for _, rhs in self._rules]
+
+    def _iter_prefix(self, rhs, first):
+        """Recorre los simbolos de la parte derecha de una regla mientras sean anulables."""
+        for symbol in rhs:
+            if not is_nonterminal(symbol):
+                yield {symbol}
+                return
+
+            yield first.get(symbol, set())
+            if symbol not in self._null_rule:
+                return
+
+    def _predict(self, category, token):
+        """Devuelve las reglas de la categoria indicada que pueden empezar por el token."""
+        key = (category, token)
+        if key not in self._predictions:
+            self._predictions[key] = tuple(pid for pid in self._by_lhs.get(category, ()) if token in self._first[pid])
+        return self._predictions[key]
+
+    def _null_tree(self, category):
+        """Construye el arbol de la derivacion vacia de un simbolo anulable."""
+        root = nltk.Tree(category.symbol(), [])
+        stack = [(root, category)]
+        while stack:
+            tree, symbol = stack.pop()
+            for child_symbol in self._rules[self._null_rule[symbol]][1]:
+                child = nltk.Tree(child_symbol.symbol(), [])
+                tree.append(child)
+                stack.append((child, child_symbol))
+
+        return root
+
+    def chart(self, tokens):
+        """Reconoce la secuencia de tokens y construye la tabla de Earley.
+
+        Parameters
+        ----------
+        tokens: list(str)
+            Tokens de la query.
+
+        Returns
+        -------
+        list(dict), list(dict)
+            Conjuntos de Earley y constituyentes completados en cada conjunto. En los conjuntos, las claves son los
+            items (regla, punto, origen) y el valor es el conjunto donde empieza el ultimo simbolo reconocido por el
+            item, segun la primera derivacion encontrada. Los constituyentes completados se indexan por (categoria,
+            origen) y guardan el item de la regla con menos simbolos. Si la query no pertenece a la gramatica, la lista
+            de conjuntos se corta en el primer conjunto vacio.
+        """
+        rules = self._rules
+        null_rule = self._null_rule
+        n = len(tokens)
+        chart = []
+        completed = []
+        waiting = []
+        for j in range(n + 1):
+            items = {} if j else {(pid, 0, 0): None for pid in self._by_lhs.get(self._start, ())}
+            if j:
+                # Scanner
+                scanned = tokens[j - 1]
+                for (pid, dot, origin) in chart[j - 1]:
+                    rhs = rules[pid][1]
+                    if dot < len(rhs) and rhs[dot] == scanned:
+                        items[(pid, dot + 1, origin)] = j - 1
+
+            if not items:
+                return chart, completed
+
+            chart.append(items)
+            completed.append({})
+            waiting.append({})
+            token = tokens[j] if j < n else None
+            agenda = list(items)
+            while agenda:
+                item = agenda.pop()
+                pid, dot, origin = item
+                lhs, rhs = rules[pid]
+                if dot == len(rhs):
+                    # Completer. Las derivaciones vacias ya se han tenido en cuenta al predecir los simbolos anulables
+                    if origin == j:
+                        continue
+                    best = completed[j].get((lhs, origin))
+                    if best is None or (len(rhs), pid) < (len(rules[best[0]][1]), best[0]):
+                        completed[j][(lhs, origin)] = item
+                    for parent in waiting[origin].get(lhs, ()):
+                        advanced = (parent[0], parent[1] + 1, parent[2])
+                        if advanced not in items:
+                            items[advanced] = origin
+                            agenda.append(advanced)
+                    continue
+
+                symbol = rhs[dot]
+                if not is_nonterminal(symbol):
+                    continue
+
+                waiting[j].setdefault(symbol, []).append(item)
+                if token is not None:
+                    # Predictor
+                    for predicted in self._predict(symbol, token):
+                        new = (predicted, 0, j)
+                        if new not in items:
+                            items[new] = None
+                            agenda.append(new)
+
+                if symbol in null_rule:
+                    advanced = (pid, dot + 1, origin)
+                    if advanced not in items:
+                        items[advanced] = j
+                        agenda.append(advanced)
+
+        return chart, completed
+
+    def parse(self, tokens):
+        """Parsea la secuencia de tokens.
+
+        Parameters
+        ----------
+        tokens: list(str)
+            Tokens de la query.
+
+        Returns
+        -------
+        iterator(nltk.Tree)
+            Iterador con el primer arbol encontrado. Si la query no pertenece a la gramatica, esta vacio.
+        """
+        return self.parse_chart(tokens)[0]
+
+    def parse_chart(self, tokens):
+        """Parsea la secuencia de tokens como parse y devuelve tambien la tabla de Earley, por ejemplo para contar sus
+        items.
+
+        Parameters
+        ----------
+        tokens: list(str)
+            Tokens de la query.
+
+        Returns
+        -------
+        (iterator(nltk.Tree), list(dict))
+            Iterador con el primer arbol encontrado y conjuntos de Earley, ver chart.
+        """
+        tokens = list(tokens)
+        chart, completed = self.chart(tokens)
+        if len(chart) <= len(tokens):
+            return iter(()), chart
+
+        item = completed[-1].get((self._start, 0))
+        if item is None:
+            return iter(()), chart
+
+        return iter([self._build(chart, completed, tokens, item)]), chart
+
+    def _build(self, chart, completed, tokens, item):
+        """Reconstruye el arbol a partir de las derivaciones guardadas en la tabla de Earley, sin recursividad. Cuando
+        un constituyente se puede derivar con varias reglas, se elige la que tiene menos simbolos."""
+        rules = self._rules
+        root = nltk.Tree(rules[item[0]][0].symbol(), [])
+        stack = [(root, item, len(chart) - 1)]
+        while stack:
+            tree, (pid, dot, origin), j = stack.pop()
+            rhs = rules[pid][1]
+            children = []
+            while dot:
+                k = chart[j][(pid, dot, origin)]
+                symbol = rhs[dot - 1]
+                if not is_nonterminal(symbol):
+                    children.append(tokens[k])
+                elif k == j:
+                    children.append(self._null_tree(symbol))
+                else:
+                    child = nltk.Tree(symbol.symbol(), [])
+                    children.append(child)
+                    stack.append((child, completed[j][(symbol, k)], j))
+                dot -= 1
+                j = k
+
+            children.reverse()
+            tree.extend(children)
+
+        return root
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from rosqltta.tree import TREE_TYPES, leaves as tree_leaves
+
+# Clausulas que empiezan en una linea nueva, alineadas con el SELECT de su query
+_CLAUSES = frozenset(['FROM_EXPRESSION', 'WHERE_EXPRESSION', 'HAVING_EXPRESSION', 'GROUP_EXPRESSION',
+                      'ORDER_EXPRESSION', 'SORT_EXPRESSION', 'CLUSTER_EXPRESSION', 'DISTIBUTE_EXPRESSION',
+                      'INNER_JOIN', 'LEFT_RIGHT_FULL_JOIN', 'SEMI_JOIN', 'CROSS_JOIN'])
+# Clausulas cuyas condiciones se separan en lineas por los operadores logicos
+_CONDITION_CLAUSES = frozenset(['WHERE_EXPRESSION', 'HAVING_EXPRESSION'])
+# Expresiones que se escriben siempre en una sola linea, porque no pueden contener subqueries
+_INLINE = frozenset(['COLUMN_EXPRESSION', 'COLUMN_LIST', 'ORDERING_COLUMN_LIST', 'CONDITION_EXPRESSION',
+                     'PARTITION_REFERENCE', 'VALUES'])
+# Listas en las que cada elemento va en una linea
+_LISTS = frozenset(['SELECT_EXPRESSION', 'TABLE_EXPRESSION', 'VALUE_REFERENCE'])
+# Signos que no llevan espacio antes, y signos que no llevan espacio despues
+_NO_SPACE_BEFORE = frozenset([',', ')', '.'])
+_NO_SPACE_AFTER = frozenset(['(', '.'])
+
+
+def _is_empty(node):
+    """Comprueba si un nodo no tiene hojas, como las reglas de produccion vacias."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, TREE_TYPES):
+            return False
+        stack.extend(node)
+
+    return True
+
+
+class TreeFormatter(object):
+    """Formatea una query directamente a partir de su arbol, sin volver a analizarla. Cada query empieza las clausulas
+    (FROM, JOIN, WHERE, GROUP BY...) en una linea nueva alineada con su SELECT, cada columna y cada tabla va en una linea
+    y las subqueries se alinean a continuacion de su parentesis. Las condiciones del WHERE y del HAVING se separan en
+    lineas por los operadores logicos que no estan entre parentesis. El resto de la query se escribe en la misma linea.
+
+    Parameters
+    ----------
+    tree: nltk.Tree
+        Arbol de la query.
+    leaves: list(str)
+        Texto de cada hoja del arbol, en el mismo orden que tree.leaves(). Permite escribir los literales originales
+        sin modificar el arbol.
+    """
+
+    def __init__(self, tree, leaves=None):
+        self._tree = tree
+        self._leaves = iter(leaves if leaves is not None else tree_leaves(tree))
+        self._parts = []
+        self._column = 0
+        self._last = None
+        self._pending = []
+
+    def format(self):
+        """Devuelve la query formateada. Los nodos se escriben con una pila de pasos pendientes en lugar de
+        recursividad, de forma que no depende del limite de recursividad de Python aunque el arbol sea muy profundo."""
+        self._parts = []
+        self._column = 0
+        self._last = None
+        self._pending = [(self._node, self._tree, 0)]
+        while self._pending:
+            step = self._pending.pop()
+            step[0](*step[1:])
+        return ''.join(self._parts)
+
+    def _schedule(self, *steps):
+        """Programa pasos, como (funcion, argumentos...), para que se ejecuten en el orden indicado antes que el resto de
+        pasos pendientes."""
+        self._pending.extend(reversed(steps))
+
+    def _write(self, text):
+        """Escribe un token en la linea actual, separado del anterior por un espacio si corresponde."""
+        if self._last is not None and text not in _NO_SPACE_BEFORE and self._last not in _NO_SPACE_AFTER:
+            self._parts.append(' ')
+            self._column += 1
+        self._parts.append(text)
+        self._column += len(text)
+        self._last = text
+
+    def _newline(self, indent):
+        """Empieza una linea nueva con la sangria indicada. Si la linea actual esta vacia, se reutiliza."""
+        if self._last is None and self._parts:
+            self._parts.pop()
+        self._parts.append('\n' + ' ' * indent)
+        self._column = indent
+        self._last = None
+
+    def _node(self, node, base):
+        """Escribe un nodo del arbol, o programa la escritura de sus hijos.
+
+        Parameters
+        ----------
+        node: nltk.Tree or str
+            Nodo o hoja.
+        base: int
+            Columna en la que empieza la query a la que pertenece el nodo.
+        """
+        if not isinstance(node, TREE_TYPES):
+            self._write(next(self._leaves).strip())
+            return
+
+        label = node.label()
+        if label in _INLINE:
+            self._inline(node)
+        elif label == 'SELECT_SENTENCE':
+            self._schedule((self._node, node[0], None), (self._select, node))
+        elif label in _LISTS:
+            self._list(node, base)
+        elif label in _CONDITION_CLAUSES and not _is_empty(node):
+            self._newline(base)
+            self._write(next(self._leaves).strip())
+            self._condition(node[1], base + 2)
+        elif label in _CLAUSES and not _is_empty(node):
+            self._newline(base)
+            self._children(node, base)
+        elif label == 'WINDOW_EXPRESSION' and not isinstance(node[0], TREE_TYPES):
+            self._newline(base)
+            self._inline(node)
+        elif label == 'UNION_EXPRESSION' and not _is_empty(node):
+            self._newline(base)
+            self._schedule((self._node, node[0], base), (self._node, node[1], base), (self._newline, base),
+                           (self._node, node[2], base))
+        elif label in ('INSERT_EXPRESSION', 'CREATE_EXPRESSION'):
+            # La sentencia de datos va en una linea nueva
+            self._schedule(*[(self._node, child, base) for child in node[:-1]] +
+                           [(self._newline, base), (self._node, node[-1], base)])
+        else:
+            self._children(node, base)
+
+    def _children(self, node, base):
+        self._pending.extend((self._node, child, base) for child in reversed(node))
+
+    def _inline(self, node):
+        """Escribe todas las hojas de un nodo en la linea actual."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, TREE_TYPES):
+                stack.extend(reversed(node))
+            else:
+                self._write(next(self._leaves).strip())
+
+    def _select(self, node):
+        """Escribe el resto de una query, una vez escrito el SELECT. Las columnas se alinean con la primera, y las
+        clausulas con el SELECT."""
+        base = self._column - len(self._last)
+        self._schedule((self._node, node[1], base), (self._list, node[2], base), (self._node, node[3], base))
+
+    def _list(self, node, base):
+        """Escribe una lista de elementos recursiva por la derecha (SELECT_EXPRESSION, TABLE_EXPRESSION,
+        VALUE_REFERENCE), con cada elemento en una linea alineado con el primero.
+
+        Parameters
+        ----------
+        node: nltk.Tree
+            Lista.
+        base: int
+            Columna en la que empieza la query a la que pertenece la lista.
+        """
+        indent = self._column + 1 if self._last is not None else self._column
+        steps = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            label = node.label() if isinstance(node, TREE_TYPES) else None
+            if label in _LISTS:
+                stack.extend(reversed(node))
+            elif label == 'COMMA':
+                steps += [(self._node, node, base), (self._newline, indent)]
+            else:
+                steps.append((self._node, node, base))
+        self._schedule(*steps)
+
+    def _condition(self, node, indent):
+        """Escribe una condicion, empezando una linea en cada operador logico que no este entre parentesis."""
+        steps = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            label = node.label() if isinstance(node, TREE_TYPES) else None
+            if label == 'CONDITION_EXPRESSION' and node[0].label() != 'L_PAR':
+                stack.extend(reversed(node))
+            elif label == 'LOGICAL_OPERATOR':
+                steps += [(self._newline, indent), (self._node, node, indent)]
+            else:
+                steps.append((self._node, node, indent))
+        self._schedule(*steps)
+
+
+def format_tree(tree, leaves=None):
+    """Formatea una query a partir de su arbol. Ver TreeFormatter.
+
+    Parameters
+    ----------
+    tree: nltk.Tree
+        Arbol de la query.
+    leaves: list(str)
+        Texto de cada hoja del arbol. Por defecto, las hojas del arbol.
+
+    Returns
+    -------
+    str
+        Query formateada.
+    """
+    return TreeFormatter(tree, leaves).format()
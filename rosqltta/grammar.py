@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import nltk
+from nltk.grammar import Nonterminal, Production
+
+
+def lexical_productions(lhs, terminals):
+    """Construye las reglas de produccion lexicas 'lhs -> terminal' para cada uno de los terminales indicados.
+
+    Parameters
+    ----------
+    lhs: str
+        Simbolo no terminal de la parte izquierda, por ejemplo 'TABLE_NAMES'.
+    terminals: iterable(str)
+        Simbolos terminales. Pueden venir entrecomillados, tal y como aparecen en el fichero de la gramatica.
+
+    Returns
+    -------
+    list(nltk.grammar.Production)
+        Reglas de produccion nuevas.
+    """
+    lhs = Nonterminal(lhs)
+    return [Production(lhs, [terminal.strip("'")]) for terminal in terminals]
+
+
+class CompiledGrammar(nltk.CFG):
+    """Gramatica libre de contexto que se lee y se compila una sola vez por parser, con las UDFs ya agregadas (ver
+    Parser._read_grammar_).
+    """
+
+    @classmethod
+    def from_file(cls, path):
+        """Lee y compila la gramatica contenida en un fichero.
+
+        Parameters
+        ----------
+        path: str
+            Ruta al fichero que contiene las reglas de produccion de la gramatica.
+
+        Returns
+        -------
+        CompiledGrammar
+            Gramatica compilada.
+        """
+        with open(path, 'r') as f:
+            return cls.fromstring(f.read())
+
+    def terminals(self):
+        """Devuelve el conjunto de simbolos terminales de la gramatica, en mayusculas."""
+        return frozenset(t.upper().strip() for t in self._lexical_index)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from rosqltta.cache import fingerprint
+
+
+class IncrementalState(object):
+    """Huellas de las sentencias renombradas en una ejecucion, para que en la siguiente solo se renombren las que han
+    cambiado. Se guardan en un fichero json con la huella de la configuracion y, por cada fichero, un registro por
+    sentencia, indexado por la huella de su texto:
+        - lineage: tabla destino y tablas origen (ver Parser._get_lineage), para ordenar la sentencia sin parsearla.
+          Es None si la sentencia no pertenece a la gramatica.
+        - inputs: huella de todo lo que afecta al renombrado: texto, comentarios y mapeos consultados.
+        - output: sentencia renombrada.
+        - mapping: mapeos de la tabla que crea o en la que inserta, que se aplican sin renombrarla.
+        - all_tables: si para renombrarla se ha buscado una columna en todas las tablas mapeadas.
+
+    Si cambia la configuracion (gramatica, UDFs, variables hive o backend), se descartan todos los registros.
+
+    Parameters
+    ----------
+    path: str
+        Ruta al fichero json.
+    config: str
+        Huella de la configuracion.
+    """
+
+    def __init__(self, path, config):
+        self._path = path
+        self._config = config
+        self._previous = {}
+        self._current = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            if state.get('config') == config:
+                self._previous = state['files']
+
+    @staticmethod
+    def key(query):
+        """Huella del texto de una sentencia."""
+        return fingerprint(query)
+
+    def get(self, file, query):
+        """Devuelve el registro de una sentencia en la ejecucion anterior, o None."""
+        return self._previous.get(file, {}).get(self.key(query))
+
+    def set(self, file, query, record):
+        """Guarda el registro de una sentencia en esta ejecucion."""
+        self._current.setdefault(file, {})[self.key(query)] = record
+
+    def save(self):
+        """Persiste los registros de esta ejecucion. Los de la ejecucion anterior se descartan, de forma que las
+        sentencias que ya no existen no se acumulan."""
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'config': self._config, 'files': self._current}, f)
+        os.replace(tmp_path, self._path)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+from rosqltta.tree import TREE_TYPES
+
+# Campos de los registros que no son metricas
+_RECORD_FIELDS = frozenset(['stage', 'seconds', 'error'])
+
+
+class StageTimer(object):
+    """Mide las fases de una etapa del procesamiento de una sentencia y acumula sus contadores en un registro, que se
+    envia al sumidero al terminar la etapa. Las etapas son 'grammar' (al crear el parser), 'parse', 'rename' y
+    'format'. Por ejemplo:
+
+        {'stage': 'parse', 'seconds': {'clean_line': 0.0001, 'tokenize': 0.0002, 'parse': 0.012, ...},
+         'tokens': 34, 'edges': 1520, 'nodes': 210, 'cached': 0}
+
+    Parameters
+    ----------
+    sink: object
+        Sumidero de los registros, con el metodo emit(record).
+    stage: str
+        Nombre de la etapa.
+    """
+    enabled = True
+
+    def __init__(self, sink, stage):
+        self._sink = sink
+        self.record = {'stage': stage, 'seconds': {}}
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Guarda el tiempo transcurrido desde la fase anterior, o desde el principio de la etapa, como el de la fase
+        indicada."""
+        now = time.perf_counter()
+        self.record['seconds'][phase] = now - self._last
+        self._last = now
+
+    def count(self, name, value=1):
+        """Suma un valor a un contador del registro."""
+        self.record[name] = self.record.get(name, 0) + value
+
+    def emit(self, error=None):
+        """Envia el registro al sumidero. Si la etapa termina con un error (la excepcion o su clase), se indica su
+        tipo."""
+        if error is not None:
+            self.record['error'] = error.__name__ if isinstance(error, type) else type(error).__name__
+        self._sink.emit(self.record)
+
+
+class _NullTimer(object):
+    """Cronometro que no hace nada, para que la instrumentacion desactivada no tenga coste."""
+    enabled = False
+
+    def lap(self, phase):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def emit(self, error=None):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class CallbackSink(object):
+    """Sumidero que llama a una funcion con cada registro.
+
+    Parameters
+    ----------
+    callback: callable
+        Funcion que recibe el registro.
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+
+    def emit(self, record):
+        self._callback(record)
+
+
+class JsonLinesSink(object):
+    """Sumidero que escribe cada registro como una linea json.
+
+    Parameters
+    ----------
+    output: str or file
+        Ruta del fichero, al que se agregan los registros, o fichero ya abierto.
+    """
+
+    def __init__(self, output):
+        self._own = isinstance(output, str)
+        self._file = open(output, 'a') if self._own else output
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        if self._own:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class RecordBuffer(object):
+    """Sumidero que guarda los registros hasta que se recogen con pop. Lo usan las copias del parser, por ejemplo en los
+    procesos del modo paralelo, para devolver los registros al parser original."""
+
+    def __init__(self):
+        self._records = []
+
+    def emit(self, record):
+        self._records.append(record)
+
+    def pop(self):
+        """Devuelve los registros guardados y vacia el buffer."""
+        records, self._records = self._records, []
+        return records
+
+
+class Aggregator(object):
+    """Sumidero que guarda en memoria los valores de cada metrica, para calcular totales y percentiles. Las metricas se
+    nombran con la etapa y la fase o el contador, por ejemplo 'parse.tokenize' o 'rename.mapping_misses'. Los errores
+    se cuentan en '<etapa>.errors'."""
+
+    def __init__(self):
+        self._values = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        stage = record['stage']
+        with self._lock:
+            for phase, seconds in record['seconds'].items():
+                self._values[stage + '.' + phase].append(seconds)
+            for name, value in record.items():
+                if name not in _RECORD_FIELDS:
+                    self._values[stage + '.' + name].append(value)
+            if 'error' in record:
+                self._values[stage + '.errors'].append(1)
+
+    def values(self, metric):
+        """Devuelve los valores registrados de una metrica."""
+        with self._lock:
+            return list(self._values.get(metric, []))
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Resume cada metrica con el numero de valores, total, media, percentiles y maximo.
+
+        Parameters
+        ----------
+        percentiles: iterable(int)
+            Percentiles que se calculan, por el metodo del rango mas cercano.
+
+        Returns
+        -------
+        dict
+            Resumen de cada metrica, por ejemplo {'parse.parse': {'count': 10, 'total': 0.3, 'mean': 0.03,
+            'p50': 0.02, 'p90': 0.08, 'p99': 0.09, 'max': 0.09}}.
+        """
+        with self._lock:
+            metrics = {metric: sorted(values) for metric, values in self._values.items()}
+
+        summary = {}
+        for metric, values in sorted(metrics.items()):
+            total = sum(values)
+            summary[metric] = {'count': len(values), 'total': total, 'mean': total / len(values)}
+            for percentile in percentiles:
+                rank = max(1, int(math.ceil(percentile / 100.0 * len(values))))
+                summary[metric]['p{}'.format(percentile)] = values[rank - 1]
+            summary[metric]['max'] = values[-1]
+
+        return summary
+
+
+def count_nodes(tree):
+    """Cuenta los nodos de un arbol, sin contar las hojas."""
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, TREE_TYPES):
+            count += 1
+            stack.extend(node)
+
+    return count
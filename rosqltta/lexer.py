@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+
+KEYWORD = 'KEYWORD'
+IDENTIFIER = 'IDENTIFIER'
+LITERAL = 'LITERAL'
+PUNCTUATION = 'PUNCTUATION'
+OPERATOR = 'OPERATOR'
+
+# Terminales genericos de la gramatica para los identificadores (tablas, columnas, alias) y para los literales
+IDENTIFIER_TERMINAL = '#IDENT#'
+LITERAL_TERMINAL = '#WORD#'
+
+_TOKEN_PATTERN = re.compile(r'(?P<punctuation>[,.();])|(?P<operator>[<>=!]+)|(?P<word>[^\s,.();<>=!]+)')
+
+
+class Token(namedtuple('Token', ['category', 'text', 'position'])):
+    """Token de una query.
+
+    Attributes
+    ----------
+    category: str
+        Tipo de token: KEYWORD, IDENTIFIER, LITERAL, PUNCTUATION u OPERATOR.
+    text: str
+        Texto del token en mayusculas.
+    position: int
+        Posicion del token en la linea.
+    """
+    __slots__ = ()
+
+    @property
+    def terminal(self):
+        """Simbolo terminal de la gramatica que representa al token."""
+        return IDENTIFIER_TERMINAL if self.category == IDENTIFIER else self.text
+
+
+class Lexer(object):
+    """Analizador lexico de una sola pasada. Clasifica las palabras de una query (ya limpia de literales, ver
+    Parser._clean_line) en palabras clave de la gramatica, literales o identificadores, de forma que los nombres de
+    tablas y columnas no tienen que agregarse a la gramatica.
+
+    Parameters
+    ----------
+    keywords: iterable(str)
+        Simbolos terminales de la gramatica, en mayusculas.
+    """
+
+    def __init__(self, keywords):
+        self._keywords = frozenset(keywords) - {IDENTIFIER_TERMINAL, LITERAL_TERMINAL}
+
+    def get_keywords(self):
+        """Devuelve la tabla de palabras clave."""
+        return self._keywords
+
+    def tokenize(self, line):
+        """Divide una linea en tokens.
+
+        Parameters
+        ----------
+        line: str
+            Linea a dividir.
+
+        Returns
+        -------
+        list(Token)
+            Tokens de la linea en orden.
+        """
+        tokens = []
+        keywords = self._keywords
+        for match in _TOKEN_PATTERN.finditer(line):
+            kind = match.lastgroup
+            text = match.group(kind)
+            position = match.start()
+            if kind == 'word':
+                text = text.upper()
+                if text == LITERAL_TERMINAL:
+                    tokens.append(Token(LITERAL, text, position))
+                elif text in keywords:
+                    tokens.append(Token(KEYWORD, text, position))
+                else:
+                    tokens.append(Token(IDENTIFIER, text, position))
+            elif kind == 'operator':
+                tokens.extend(self._split_operator(text, position))
+            else:
+                tokens.append(Token(PUNCTUATION, text, position))
+
+        return tokens
+
+    def _split_operator(self, text, position):
+        """Divide una secuencia de operadores en los operadores de la gramatica, buscando primero los de dos
+        caracteres."""
+        i = 0
+        while i < len(text):
+            size = 2 if text[i:i + 2] in self._keywords else 1
+            yield Token(OPERATOR, text[i:i + size], position + i)
+            i += size
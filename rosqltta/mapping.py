@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import abc
+import json
+import os
+import sqlite3
+import threading
+from collections import ChainMap
+from collections.abc import MutableMapping
+
+
+class MappingStore(MutableMapping, abc.ABC):
+    """Mapeos de las tablas con carga perezosa: cada tabla se lee del almacenamiento la primera vez que se consulta y se
+    guarda en memoria, de forma que crear el almacen no lee ningun mapeo y la memoria depende solo de las tablas que se
+    usan. El indice con los nombres de todas las tablas solo se construye si se recorre el almacen, por ejemplo al
+    buscar una columna en todas las tablas mapeadas.
+
+    Se comporta como un diccionario. Los cambios se hacen en memoria y no se persisten hasta que se llama a save, si el
+    almacen lo permite. Las subclases implementan los metodos abstractos _list, _read y _contains.
+
+    Tambien mantiene un indice inverso de cada columna a las tablas que la tienen, ver owners. Para que el indice no
+    quede desactualizado, las columnas se deben agregar con add_field en lugar de modificar el mapeo directamente.
+
+    Se puede compartir entre hilos: los cambios y la construccion de los indices se hacen con el cerrojo lock, que
+    tambien pueden usar quienes necesiten hacer varios cambios seguidos sin que se intercalen otros.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._missing = set()
+        self._index = None
+        self._columns = None
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    @abc.abstractmethod
+    def _list(self):
+        """Devuelve los nombres de todas las tablas del almacenamiento."""
+
+    @abc.abstractmethod
+    def _read(self, table):
+        """Lee el mapeo de una tabla del almacenamiento. Si no existe, lanza KeyError."""
+
+    @abc.abstractmethod
+    def _contains(self, table):
+        """Indica si una tabla existe en el almacenamiento, sin leer su mapeo."""
+
+    def _tables(self):
+        with self.lock:
+            if self._index is None:
+                index = dict.fromkeys(self._list())
+                index.update(dict.fromkeys(self._entries))
+                self._index = index
+            return self._index
+
+    def __getitem__(self, table):
+        if table in self._entries:
+            return self._entries[table]
+        if table in self._missing or not isinstance(table, str):
+            raise KeyError(table)
+
+        try:
+            entry = self._read(table)
+        except KeyError:
+            with self.lock:
+                if table not in self._entries:
+                    self._missing.add(table)
+                    raise
+                return self._entries[table]
+
+        # Si otro hilo ha guardado la tabla mientras se leia, se queda la suya
+        with self.lock:
+            return self._entries.setdefault(table, entry)
+
+    def __setitem__(self, table, entry):
+        with self.lock:
+            if self._columns is not None:
+                self._unindex(table)
+                self._index_fields(self._columns, table, entry['fields'])
+            self._entries[table] = entry
+            self._missing.discard(table)
+            if self._index is not None:
+                self._index[table] = None
+
+    def __delitem__(self, table):
+        with self.lock:
+            if table not in self:
+                raise KeyError(table)
+
+            if self._columns is not None:
+                self._unindex(table)
+            self._entries.pop(table, None)
+            self._missing.add(table)
+            if self._index is not None:
+                self._index.pop(table, None)
+
+    def __contains__(self, table):
+        if table in self._entries:
+            return True
+        if table in self._missing or not isinstance(table, str):
+            return False
+        if self._index is not None:
+            return table in self._index
+
+        return self._contains(table)
+
+    def __iter__(self):
+        with self.lock:
+            tables = list(self._tables())
+        return (table for table in tables if table not in self._missing)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __bool__(self):
+        return bool(self._entries) or any(True for _ in self)
+
+    def loaded(self):
+        """Devuelve el numero de tablas cargadas en memoria."""
+        return len(self._entries)
+
+    @staticmethod
+    def _index_fields(columns, table, fields):
+        for column in fields:
+            columns.setdefault(column, set()).add(table)
+
+    def _unindex(self, table):
+        entry = self._entries.get(table)
+        if entry is None:
+            return
+        for column in entry['fields']:
+            self._columns.get(column, set()).discard(table)
+
+    def owners(self, column):
+        """Devuelve las tablas que tienen una columna. La primera llamada construye el indice inverso, para lo que se
+        cargan todas las tablas. A partir de ahi se mantiene con cada cambio.
+
+        Parameters
+        ----------
+        column: str
+            Nombre original de la columna.
+
+        Returns
+        -------
+        set(str)
+            Tablas cuyo mapeo incluye la columna.
+        """
+        with self.lock:
+            if self._columns is None:
+                # Se construye aparte para que nunca se vea el indice a medias
+                columns = {}
+                for table in self:
+                    self._index_fields(columns, table, self[table]['fields'])
+                self._columns = columns
+
+            return set(self._columns.get(column, ()))
+
+    def add_field(self, table, column, new_name):
+        """Agrega una columna al mapeo de una tabla si no la tiene, actualizando el indice inverso."""
+        with self.lock:
+            self[table]['fields'].setdefault(column, new_name)
+            if self._columns is not None:
+                self._columns.setdefault(column, set()).add(table)
+
+
+class DirectoryMappingStore(MappingStore):
+    """Mapeos de las tablas en un directorio, con un json por tabla cuyo nombre es el de la tabla. Solo se tienen en
+    cuenta los ficheros con extension .json, de forma que se ignoran los temporales de write_json que hayan podido
+    quedar por una interrupcion.
+
+    Parameters
+    ----------
+    path: str
+        Directorio que contiene los json de mapping.
+    """
+    EXTENSION = '.json'
+
+    def __init__(self, path):
+        super(DirectoryMappingStore, self).__init__()
+        self._path = path
+
+    def _file(self, table):
+        return os.path.join(self._path, table + self.EXTENSION)
+
+    def _list(self):
+        return [f[:-len(self.EXTENSION)] for f in os.listdir(self._path) if f.endswith(self.EXTENSION)]
+
+    def _read(self, table):
+        try:
+            with open(self._file(table), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(table)
+
+    def _contains(self, table):
+        return os.path.isfile(self._file(table))
+
+    def save(self, table, compact=False):
+        """Persiste el mapeo de una tabla en su json."""
+        write_json(self[table], self._file(table), compact)
+
+
+class SqliteMappingStore(MappingStore):
+    """Mapeos de las tablas en un unico fichero SQLite, con el json de cada tabla indexado por su nombre. Evita tener
+    miles de ficheros pequeños en un directorio. Se puede llenar a partir de un directorio de mapping con
+    import_directory.
+
+    Se puede compartir entre procesos e hilos: la conexion se abre en cada proceso e hilo la primera vez que se usa.
+
+    Parameters
+    ----------
+    path: str
+        Ruta al fichero de la base de datos. Se crea si no existe.
+    """
+
+    def __init__(self, path):
+        super(SqliteMappingStore, self).__init__()
+        self._path = path
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = super(SqliteMappingStore, self).__getstate__()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        super(SqliteMappingStore, self).__setstate__(state)
+        self._local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self._path, timeout=60)
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS mappings (name TEXT PRIMARY KEY, entry TEXT)')
+        return connection
+
+    def _list(self):
+        return [row[0] for row in self._connect().execute('SELECT name FROM mappings ORDER BY name')]
+
+    def _read(self, table):
+        row = self._connect().execute('SELECT entry FROM mappings WHERE name = ?', (table,)).fetchone()
+        if row is None:
+            raise KeyError(table)
+
+        return json.loads(row[0])
+
+    def _contains(self, table):
+        return self._connect().execute('SELECT 1 FROM mappings WHERE name = ?', (table,)).fetchone() is not None
+
+    def save(self, table, compact=True):
+        """Persiste el mapeo de una tabla. El json siempre se guarda sin indentar."""
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO mappings VALUES (?, ?)',
+                               (table, json.dumps(self[table], sort_keys=True, separators=(',', ':'))))
+
+    def import_directory(self, path):
+        """Copia en la base de datos todos los mapeos de un directorio, ver DirectoryMappingStore.
+
+        Parameters
+        ----------
+        path: str
+            Directorio que contiene los json de mapping.
+
+        Returns
+        -------
+        int
+            Numero de tablas copiadas.
+        """
+        source = DirectoryMappingStore(path)
+        tables = list(source)
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO mappings VALUES (?, ?)',
+                                   ((table, json.dumps(source[table], sort_keys=True, separators=(',', ':')))
+                                    for table in tables))
+        with self.lock:
+            for table in tables:
+                self._entries.pop(table, None)
+                self._missing.discard(table)
+            self._index = None
+            self._columns = None
+        return len(tables)
+
+    def close(self):
+        """Cierra la conexion del hilo actual con la base de datos. Se vuelve a abrir si se usa de nuevo."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def column_owners(mapping, column):
+    """Devuelve las tablas de unos mapeos que tienen una columna. Si los mapeos son un MappingStore se usa su indice
+    inverso. Si son un ChainMap, como en los procesos del modo paralelo, se combinan los de cada nivel teniendo en
+    cuenta que las tablas de un nivel ocultan a las de los siguientes.
+
+    Parameters
+    ----------
+    mapping: dict
+        Mapeos de las tablas.
+    column: str
+        Nombre original de la columna.
+
+    Returns
+    -------
+    set(str)
+        Tablas cuyo mapeo incluye la columna.
+    """
+    if isinstance(mapping, MappingStore):
+        return mapping.owners(column)
+
+    if isinstance(mapping, ChainMap):
+        owners = set()
+        hidden = set()
+        for level in mapping.maps:
+            owners |= column_owners(level, column) - hidden
+            if level is not mapping.maps[-1]:
+                hidden |= set(level)
+        return owners
+
+    return {table for table, entry in mapping.items() if column in entry['fields']}
+
+
+def add_field(mapping, table, column, new_name):
+    """Agrega una columna al mapeo de una tabla si no la tiene. Si la tabla esta en un MappingStore, directamente o en
+    un nivel de un ChainMap, se actualiza su indice inverso, ver MappingStore.add_field."""
+    if isinstance(mapping, ChainMap):
+        mapping = next((level for level in mapping.maps if table in level), mapping.maps[0])
+
+    if isinstance(mapping, MappingStore):
+        mapping.add_field(table, column, new_name)
+    else:
+        mapping[table]['fields'].setdefault(column, new_name)
+
+
+def write_json(output, file, compact=False):
+    """Persiste un diccionario en el fichero json indicado. Se escribe en un fichero temporal que se renombra al
+    terminar, de forma que el fichero nunca queda a medio escribir.
+
+    Parameters
+    ----------
+    output: dict
+        Datos a persistir.
+    file: str
+        Fichero de salida.
+    compact: boolean
+        Escribir el json sin indentar ni espacios.
+    """
+    tmp_file = file + '.tmp'
+    with open(tmp_file, 'w') as out_file:
+        if compact:
+            out_file.write(json.dumps(output, sort_keys=True, separators=(',', ':')))
+        else:
+            out_file.write(json.dumps(output, indent=4, sort_keys=True))
+    os.replace(tmp_file, file)
@@ -5,6 +5,8 @@ import os
 import logging
 import json
 import argparse
+from itertools import chain
+import numpy as np
 import pandas as pd
 
 parser = argparse.ArgumentParser(description='Crea los ficheros de mapping en formato json a partir de un excel')
@@ -34,80 +36,45 @@ def write_json(path, d):
         json.dump(d, fp, indent=4)
 
 
-def __init_dict__(e):
-    """Inicializa un json. El formato es el de mapeo de una tabla nueva.
+def build_jsons(df, sep):
+    """Genera el json de cada tabla a partir de las filas del excel, con operaciones sobre columnas en lugar de procesar
+    fila a fila. Las filas que hacen referencia a mas de una tabla en la primera columna se repiten una vez por tabla. Si
+    una columna aparece mas de una vez en la misma tabla, se queda con la primera. Las tablas y sus columnas mantienen el
+    orden en que aparecen en el excel.
 
     Parameters
     ----------
-    e: pd.Series
-        Fila del excel que se esta procesando.
+    df: pd.DataFrame
+        Filas del excel, con la primera columna informada.
+    sep: str
+        Caracter que separa los nombres de las tablas, cuando hay mas de una en esa fila.
 
     Returns
     -------
     dict
-        Diccionario nuevo.
-    """
-    return {'old_name': e['Tabla Origen'],
-            'new_name': e['Tabla'],
-            'fields': {}
-            }
-
-
-def _generate_json(e, all_json):
-    """Actualiza el json correspondiente a la fila que se esta procesando.
-
-    Parameters
-    ----------
-    e: pd.Series
-        Fila del excel que se esta procesando.
-    all_json: dict
-        Diccionario que contiene todos los json de todas las tablas.
+        Diccionario que contiene todos los json de todas las tablas, por nombre de la tabla origen.
     """
+    # Separar las tablas de la primera columna, repitiendo la fila por cada una
+    tables = df[df.columns[0]].astype(str).str.split(sep)
+    positions = np.repeat(np.arange(len(df)), tables.str.len().values)
     try:
-        table = all_json.get(e['Tabla Origen'], __init_dict__(e))
-        table['fields'].setdefault(e['columnaLegacy'].upper(), e['Code'])
-
-        all_json[e['Tabla Origen']] = table
-
+        rows = pd.DataFrame({name: df[name].values[positions] for name in ('Tabla Origen', 'Tabla', 'Code')})
+        rows['field'] = df['columnaLegacy'].str.upper().values[positions]
     except KeyError as err:
         raise KeyError('Error accediendo al diccionario. Por favor, comprobar que los nombres de las columnas del excel'
                        'no han cambiado.\n{}'.format(err))
+    if df.columns[0] in rows:
+        rows[df.columns[0]] = list(chain.from_iterable(tables))
 
+    # Cada columna se queda con el primer codigo de su tabla
+    rows = rows.drop_duplicates(['Tabla Origen', 'field'])
+    first = rows.drop_duplicates('Tabla Origen')
+    all_json = {old_name: {'old_name': old_name, 'new_name': new_name, 'fields': {}}
+                for old_name, new_name in zip(first['Tabla Origen'].tolist(), first['Tabla'].tolist())}
+    for old_name, fields in rows.groupby('Tabla Origen', sort=False):
+        all_json[old_name]['fields'].update(zip(fields['field'].tolist(), fields['Code'].tolist()))
 
-def __process_table__(table, e, all_jsons, index):
-    """Procesa una sola tabla, asignandole los campos correspondientes.
-
-    Parameters
-    ----------
-    table: str
-        Nombre de la tabla a procesar.
-    e: pd.Series
-        Fila del excel que se esta procesando.
-    all_jsons: dict
-        Diccionario que contiene todo los json de todas las tablas.
-    index: list(str)
-        Lista con los indices originales de la fila.
-    """
-    new = pd.Series(table).append(e.iloc[1:])
-    new.index = index
-    _ = _generate_json(new, all_jsons)
-
-
-def process_row(e, all_jsons, sep):
-    """Procesa una fila del excel. Separando en diferentes json cuando una fila hace referencia a mas de una tabla,
-    para al final generar un json por cada tabla.
-
-    Parameters
-    ----------
-    e: pd.Series
-        Fila del excel que se esta procesando.
-    all_jsons: dict
-        Diccionario que contiene todos los json de todas las tablas.
-    sep: str
-        Caracter que separa los nombres de las tablas, cuando hay mas de una en esa fila.
-    """
-    original_index = e.index
-    [__process_table__(table, e, all_jsons, original_index) for table in e[0].split(sep)]
+    return all_json
 
 
 def process_all(excel_path, sep, conf_path):
@@ -130,8 +97,7 @@ def process_all(excel_path, sep, conf_path):
                  .format(raw.shape[0], df.shape[0]))
 
     # Procesar el excel
-    all_json = {}
-    df.apply(lambda x: process_row(x, all_json, sep), axis=1)
+    all_json = build_jsons(df, sep)
 
     # Persistir los json
     for conf_file in all_json.keys():
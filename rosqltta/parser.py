@@ -6,9 +6,38 @@ import nltk
 import re
 import os
 import json
-import sqlparse
-from operator import itemgetter
+import threading
+import time
+try:
+    import sqlparse
+except ImportError:
+    sqlparse = None
+from collections import ChainMap, Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+from operator import attrgetter, itemgetter
 from copy import copy
+from rosqltta.grammar import CompiledGrammar, lexical_productions
+from rosqltta.earley import EarleyParser
+from rosqltta.lexer import Lexer, IDENTIFIER, LITERAL_TERMINAL
+from rosqltta.scheduler import DependencyGraph
+from rosqltta.cache import ParseCache, fingerprint
+from rosqltta.incremental import IncrementalState
+from rosqltta.splitter import split_statements
+from rosqltta.writer import OutputWriter
+from rosqltta.formatter import format_tree
+from rosqltta.tree import TREE_TYPES, compact, decode, encode, leaves as tree_leaves
+from rosqltta.context import StatementContext, Result
+from rosqltta.instrumentation import StageTimer, RecordBuffer, NULL_TIMER, count_nodes
+from rosqltta.mapping import DirectoryMappingStore, SqliteMappingStore, add_field, column_owners, write_json
+
+
+# Signos de puntuacion que se separan con espacios antes de parsear, y los mismos signos ya separados
+_PUNCTUATION_PATTERN = re.compile(r'([,;()=])')
+_SPACED_PUNCTUATION_PATTERN = re.compile(r' ([,;()=]) ')
+# Variables hive, literales entre comillas y constantes numericas entre espacios, en el orden en el que se buscan
+_LITERAL_PATTERN = re.compile(r"\$\{[^}]*\}|'[^']*'| [0-9]+ ")
 
 
 class UnreferencedTableError(Exception):
@@ -21,26 +50,211 @@ class OutOfGrammarException(Exception):
         super(OutOfGrammarException, self).__init__(msg)
 
 
+# Parser de cada proceso en el modo paralelo de Parser.save_renamed
+_worker_parser = None
+
+
+def _init_worker(parser):
+    """Inicializa un proceso del modo paralelo con su propia copia del parser."""
+    global _worker_parser
+    _worker_parser = parser
+    _worker_parser._start_worker()
+
+
+def _parse_in_worker(query, location=None):
+    """Parsea una sentencia en un proceso del modo paralelo, con el arbol codificado. Ver Parser._parse_encoded.
+    Devuelve tambien los tiempos y registros de instrumentacion del proceso, para pasarlos al parser principal."""
+    return _worker_parser._parse_encoded(query, location), _worker_parser._pop_metrics()
+
+
+def _rename_in_worker(args):
+    """Renombra una sentencia en un proceso del modo paralelo, con el arbol codificado por _parse_in_worker. Ver
+    Parser._rename_statement. Devuelve tambien los tiempos y registros de instrumentacion del proceso, para pasarlos al
+    parser principal."""
+    tree = decode(args[0], _worker_parser._tree_format) if args[0] is not None else None
+    return _worker_parser._rename_statement(tree, *args[1:]), _worker_parser._pop_metrics()
+
+
+class _ThreadContext(threading.local):
+    """Contexto de cada hilo. Cada hilo empieza con un contexto que modifica directamente los mapeos compartidos."""
+
+    def __init__(self, mapping):
+        self.context = StatementContext(mapping)
+
+
+def _context_property(name):
+    """Atributo del parser que se guarda en el contexto de la sentencia actual, ver StatementContext."""
+    return property(attrgetter('_local.context.' + name),
+                    lambda self, value: setattr(self._local.context, name, value))
+
+
 class Parser:
-    def __init__(self, conf, udfs=None, hive_var={}, logger=None, log_level=logging.INFO):
+    BACKENDS = ('chart', 'earley')
+    PRETTY_PRINTERS = ('tree', 'sqlparse')
+    TREE_FORMATS = ('nltk', 'compact')
+    # Separador de las sentencias en los ficheros de salida
+    STATEMENT_END = '\n;\n\n'
+
+    # Estado de la sentencia actual. Se guarda en un contexto por hilo, ver translate
+    tree = _context_property('tree')
+    _creating_table = _context_property('creating_table')
+    _all_tables = _context_property('all_tables')
+    __mapping = _context_property('mapping')
+    __queries = _context_property('queries')
+    __reverse_tree = _context_property('reverse_tree')
+    __queries_elements = _context_property('queries_elements')
+    __words = _context_property('words')
+    __comments = _context_property('comments')
+
+    def __init__(self, conf, udfs=None, hive_var={}, logger=None, log_level=logging.INFO, backend=None,
+                 cache_dir=None, instrumentation=None):
         logging.basicConfig(level=log_level, format='%(levelname)s %(name)s %(asctime)s %(message)s')
-        self.tree = None
+        self._lock = threading.Lock()
         self.udfs = [udfs] if not isinstance(udfs, list) else udfs
         self._udfs_norm = [udf.replace('.', '_').upper() for udf in self.udfs if udf]
+        self._udf_patterns = [(re.compile(point, re.IGNORECASE), scape) for point, scape in zip(self.udfs,
+                                                                                                self._udfs_norm)]
+        self._udf_restore_patterns = [(re.compile(scape, re.IGNORECASE), point) for point, scape in zip(self.udfs,
+                                                                                                        self._udfs_norm)]
         if hive_var and not isinstance(hive_var, dict):
             raise TypeError('La variable hive_var tiene que ser un diccionario')
         self.hive_var = hive_var
         self._logger = logging.getLogger('rosqltta') if not logger else logger
         self._config = self.load_json(conf)
+        self._instrumentation = instrumentation
         self._terminals = None
-        self._creating_table = None
-        self.__mapping = self.load_mapping_files(self._config['mapping_dir']) if 'mapping_dir' in self._config else None
-        self.__queries_elements = []
-        self.__reverse_tree = []
-        self.__queries = {}
-        self.__comments = []
-        self.__words = []
+        self._mapping_store = self._get_mapping_store()
+        self._local = _ThreadContext(self._mapping_store)
+        self.__dirty_mappings = []
+        timer = self._timer('grammar')
         self.__grammar = self._read_grammar_(self._config['grammar_file'])
+        timer.lap('read_grammar')
+        self._backend = backend if backend else self._config.get('parser_backend', 'chart')
+        if self._backend not in self.BACKENDS:
+            raise ValueError("El backend '{}' no existe. Los backends disponibles son: {}".format(self._backend,
+                                                                                               self.BACKENDS))
+        self.__earley = EarleyParser(self.__grammar) if self._backend == 'earley' else None
+        self._lexer = Lexer(self.__grammar.terminals())
+        timer.lap('compile')
+        timer.emit()
+        self._pretty_printer = self._config.get('pretty_printer', 'tree')
+        if self._pretty_printer not in self.PRETTY_PRINTERS:
+            raise ValueError("El formateador '{}' no existe. Los formateadores disponibles son: {}".format(
+                self._pretty_printer, self.PRETTY_PRINTERS))
+        if self._pretty_printer == 'sqlparse' and sqlparse is None:
+            raise ImportError("El formateador 'sqlparse' necesita el paquete sqlparse")
+        self._tree_format = self._config.get('tree_format', 'nltk')
+        if self._tree_format not in self.TREE_FORMATS:
+            raise ValueError("El formato de arbol '{}' no existe. Los formatos disponibles son: {}".format(
+                self._tree_format, self.TREE_FORMATS))
+        self._cache = self._get_cache(cache_dir)
+        # Segundos acumulados en cada fase ('parse', 'rename' y 'format') y numero de sentencias parseadas
+        self.timings = Counter()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local'], state['_lock']
+        state['context'] = copy(self._local.context)
+        if self._instrumentation is not None:
+            # Los registros de la copia se recogen con _pop_metrics
+            state['_instrumentation'] = RecordBuffer()
+        return state
+
+    def __setstate__(self, state):
+        context = state.pop('context')
+        self.__dict__.update(state)
+        self._local = _ThreadContext(self._mapping_store)
+        self._local.context = context
+        self._lock = threading.Lock()
+
+    def translate(self, sql):
+        """Renombra una sentencia en su propio contexto, sin modificar el estado del parser mientras tanto, de forma
+        que un mismo parser se puede usar a la vez desde varios hilos. Los comentarios se eliminan de la sentencia y se
+        ponen al principio de la sentencia renombrada.
+
+        Las tablas que crea la sentencia se mapean primero en el contexto y, si se renombra sin errores, se agregan a
+        los mapeos compartidos y se marcan como pendientes de persistir (ver flush_mappings).
+
+        Parameters
+        ----------
+        sql: str
+            Sentencia. Puede terminar en punto y coma.
+
+        Returns
+        -------
+        rosqltta.context.Result
+            Sentencia renombrada, arbol, linaje y mapeo de la tabla que crea.
+        """
+        statements = list(split_statements(sql.splitlines()))
+        texts = [statement.text for statement in statements if statement.text.strip()]
+        if len(texts) != 1:
+            raise ValueError('Se esperaba una sentencia y se han encontrado {}'.format(len(texts)))
+
+        context = StatementContext(ChainMap({}, self._mapping_store))
+        context.comments = [comment for statement in statements for comment in statement.comments]
+        previous = self._local.context
+        self._local.context = context
+        try:
+            with self._phase('parse'):
+                self.parse_query(texts[0])
+            target, sources = self._get_lineage(self.tree)
+            with self._phase('rename'):
+                self.rename_tree()
+            with self._phase('format'):
+                query = self.rebuild_query(comments=bool(context.comments))
+        finally:
+            self._local.context = previous
+
+        # Solo se guarda la tabla que crea la sentencia, no los mapeos vacios de las tablas origen que no estan mapeadas
+        table = context.creating_table
+        mapping = {table: context.mapping.maps[0][table]} if table else {}
+        if table:
+            # Con el cerrojo del almacen, el mismo que protege sus indices, el mapeo se guarda y se marca a la vez
+            with self._mapping_store.lock, self._lock:
+                self._mapping_store[table] = mapping[table]
+                self._mark_dirty(table)
+
+        return Result(query, context.tree, target, sources, mapping)
+
+    @contextmanager
+    def _phase(self, name):
+        """Acumula en timings el tiempo que tarda el bloque en la fase indicada. Al parsear tambien se cuenta la
+        sentencia."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[name] += elapsed
+                if name == 'parse':
+                    self.timings['statements'] += 1
+
+    def _pop_metrics(self):
+        """Devuelve los tiempos acumulados, que se ponen a cero, y los registros de instrumentacion pendientes de una
+        copia del parser (ver RecordBuffer)."""
+        with self._lock:
+            timings, self.timings = self.timings, Counter()
+        records = self._instrumentation.pop() if isinstance(self._instrumentation, RecordBuffer) else []
+        return timings, records
+
+    def _merge_metrics(self, metrics):
+        """Acumula los tiempos y envia al sumidero los registros devueltos por _pop_metrics en otro proceso."""
+        timings, records = metrics
+        self.timings.update(timings)
+        if self._instrumentation is not None:
+            for record in records:
+                self._instrumentation.emit(record)
+
+    def _timer(self, stage):
+        """Devuelve el cronometro de una etapa, o uno que no hace nada si la instrumentacion esta desactivada. Ver
+        rosqltta.instrumentation.StageTimer."""
+        return StageTimer(self._instrumentation, stage) if self._instrumentation is not None else NULL_TIMER
+
+    def _count(self, name):
+        """Suma uno a un contador de la etapa actual, si la instrumentacion esta activada."""
+        if self._instrumentation is not None:
+            self._local.context.timer.count(name)
 
     def get_grammar(self):
         """Devuelve la gramatica utilizada."""
@@ -71,7 +285,26 @@ class Parser:
         with open(path, 'r') as file:
             yield [line.replace('\n', ' ').replace('\t', ' ') for line in file.readlines()]
 
-    def load_queries(self, path=None):
+    @staticmethod
+    def _stream_query_file(path):
+        """Lee las sentencias de un fichero de queries linea a linea, sin cargar el fichero entero en memoria. Ver
+        rosqltta.splitter.split_statements.
+
+        Parameters
+        ----------
+        path: str
+            Ruta del fichero.
+
+        Returns
+        -------
+        generator(rosqltta.splitter.Statement)
+            Devuelve cada vez una sentencia del fichero.
+        """
+        with open(path, 'r') as file:
+            for statement in split_statements(file):
+                yield statement
+
+    def load_queries(self, path=None, stream=False):
         """Lee las queries situadas en la ruta especificada. Si no se especifica ruta, se busca en el fichero de
         configuracion.
 
@@ -79,6 +312,9 @@ class Parser:
         -------
         path: str
             Ruta al directorio de las queries. Si no se especifica, se lee del fichero de configuracion.
+        stream: boolean
+            Leer los ficheros sentencia a sentencia (ver _stream_query_file) en lugar de leer todas las lineas de una
+            vez (ver _read_query_file). Los dos formatos se pueden pasar a save_renamed.
 
         Returns
         -------
@@ -94,12 +330,19 @@ class Parser:
                                "comprueba que existe y que tiene los permisos adecuados".format(path))
             raise NotADirectoryError
 
-        return {file: self._read_query_file(os.path.join(path, file)) for file in os.listdir(path)}
+        read = self._stream_query_file if stream else self._read_query_file
+        return {file: read(os.path.join(path, file)) for file in os.listdir(path)}
 
-    def save_renamed(self, queries, path=None):
+    def save_renamed(self, queries, path=None, workers=None, incremental=False):
         """Renombra las queries de acuerdo a los ficheros de mapping y las guarda en la ruta especificada. El nombre de
         cada fichero es el mismo que en la entrada.
 
+        Antes de renombrar, se parsean todas las sentencias y se ordenan segun las tablas que crean y las que leen (ver
+        rosqltta.scheduler.DependencyGraph). Asi, los mapeos de una tabla se generan antes de renombrar las sentencias
+        que la leen, aunque esten en otro fichero. Si el orden de los ficheros ya respeta las dependencias, las
+        sentencias se renombran en ese mismo orden. Mientras tanto, los arboles se guardan codificados (ver
+        _parse_encoded) y solo se decodifican al renombrar cada sentencia.
+
         Parameters
         ----------
         queries: dict
@@ -108,6 +351,15 @@ class Parser:
         path: str
             Ruta al directorio donde se van a almacenar las queries renombradas. Si no se especifica, se lee del fichero
             de configuracion.
+        workers: int
+            Numero de procesos que parsean y renombran las sentencias en paralelo. Las sentencias que no dependen entre
+            si se renombran a la vez y el resto por niveles, en orden topologico. Si no se especifica o es 1, se procesa
+            todo secuencialmente.
+        incremental: boolean
+            Solo se renombran las sentencias cuyo texto, comentarios o mapeos consultados han cambiado desde la ultima
+            ejecucion incremental. Para el resto se reutiliza la sentencia renombrada y el mapeo generado. Las huellas
+            se guardan en el fichero 'state_file' de la configuracion (por defecto '.rosqltta_state.json' en la ruta de
+            salida), ver rosqltta.incremental.IncrementalState. Los ficheros de salida se sobreescriben.
         """
         if not path:
             path = self._config['output_path']
@@ -117,72 +369,501 @@ class Parser:
                                "comprueba que existe y que tiene los permisos adecuados".format(path))
             raise NotADirectoryError
 
+        state = self._get_incremental_state(path) if incremental else None
         self.__comments = []
-        compacted_queries = self.__process_file(queries)
+        files = self.__split_files(queries)
+        statements = [(file, query) for file, file_queries, _, _ in files for query in file_queries]
+        locations = ['{}:{}'.format(file, line) for file, _, lines, _ in files for line in lines]
+        parsed = [self.__parse_from_state(state, file, query) for file, query in statements]
+        pending = [index for index, statement in enumerate(parsed) if statement is False]
+
+        if workers and workers > 1:
+            chunksize = max(1, len(pending) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+                for index, (statement, metrics) in zip(pending, executor.map(_parse_in_worker,
+                                                                             [statements[i][1] for i in pending],
+                                                                             [locations[i] for i in pending],
+                                                                             chunksize=chunksize)):
+                    parsed[index] = statement
+                    self._merge_metrics(metrics)
+                graph, nodes = self.__schedule(files, statements, parsed)
+                renamed, created, records, error = self.__rename_levels(graph, nodes, statements, state, executor,
+                                                                        workers)
+        else:
+            for index in pending:
+                parsed[index] = self._parse_encoded(statements[index][1], locations[index])
+            graph, nodes = self.__schedule(files, statements, parsed)
+            renamed, created, records, error = self.__rename_in_order(graph, nodes, statements, state)
+
+        # Solo se persisten los mapeos y huellas de las sentencias que se guardan
+        saved = self.__save_statements(statements, renamed, path, overwrite=incremental)
+        for index, table in created:
+            if index in saved:
+                self._mark_dirty(table)
+        self.flush_mappings()
+
+        if state is not None:
+            for index in sorted(saved):
+                file, query = statements[index]
+                state.set(file, query, records.get(index, {'lineage': None}))
+            state.save()
+            self._logger.info('Modo incremental: {} sentencias renombradas de {}'.format(
+                len([record for record in records.values() if not record.get('reused')]), len(nodes)))
+
+        if error is not None:
+            index, error = error
+            self._logger.error('No se ha podido renombrar la sentencia de {}: {}'.format(locations[index], error))
+            raise error
 
-        [[self.__parse_and_save(query, file, path) for query in queries if query.strip()] for file, queries in
-         compacted_queries]
         self._logger.info('Todas las queries han sido correctamente renombradas y almacenadas en la ruta {}'.format(path))
 
-    def __process_file(self, queries):
-        """Preprocesa un fichero de query. Se eliminan los comentarios, se juntan todas las lineas en un solo string
-        y se separan las queries por cada punto y coma.
+    def stream_renamed(self, lines, name='<stdin>'):
+        """Renombra las sentencias de un fichero de queries a medida que se leen y devuelve cada una en cuanto se
+        renombra, de forma que se puede usar como filtro sobre un flujo de lineas. A diferencia de save_renamed, las
+        sentencias se renombran en el orden en el que llegan, por lo que una sentencia solo ve los mapeos de las tablas
+        creadas antes en el flujo. Las sentencias que no se reconocen en la gramatica se devuelven tal cual y los
+        comentarios se ponen al principio de la siguiente sentencia reconocida. Los mapeos de las tablas creadas se
+        marcan como pendientes de persistir, ver flush_mappings.
+
+        Parameters
+        ----------
+        lines: iterable(str)
+            Lineas del fichero, por ejemplo sys.stdin.
+        name: str
+            Nombre del fichero, para los mensajes.
+
+        Returns
+        -------
+        generator(str)
+            Sentencias renombradas, sin el separador final (ver STATEMENT_END).
+        """
+        comments = []
+        for statement in split_statements(lines):
+            comments.extend(statement.comments)
+            if not statement.text.strip():
+                continue
+
+            location = '{}:{}'.format(name, statement.line)
+            parsed = self._parse_statement(statement.text, location)
+            if parsed is None:
+                yield statement.text
+                continue
+
+            query, mapping, error, _ = self._rename_statement(parsed[0], parsed[1], comments)
+            comments = []
+            if error is not None:
+                self._logger.error('No se ha podido renombrar la sentencia de {}: {}'.format(location, error))
+                raise error
+            for table in mapping:
+                self._mark_dirty(table)
+            yield query
+
+    def _get_incremental_state(self, path):
+        """Carga las huellas del modo incremental. Ver save_renamed.
+
+        Parameters
+        ----------
+        path: str
+            Ruta de los ficheros de salida.
+
+        Returns
+        -------
+        rosqltta.incremental.IncrementalState
+            Huellas de la ultima ejecucion.
+        """
+        state_file = self._config.get('state_file', os.path.join(path, '.rosqltta_state.json'))
+        config = fingerprint(*self._get_fingerprint() + (json.dumps(self.hive_var, sort_keys=True),
+                                                          self._pretty_printer))
+        return IncrementalState(state_file, config)
+
+    @staticmethod
+    def __parse_from_state(state, file, query):
+        """Devuelve el linaje de una sentencia ya procesada en la ultima ejecucion incremental, con el mismo formato que
+        _parse_statement pero sin arbol. Si la sentencia no se conoce, devuelve False para que se parsee."""
+        record = state.get(file, query) if state is not None else None
+        if record is None:
+            return False
+        if record['lineage'] is None:
+            return None
+
+        target, sources = record['lineage']
+        return None, None, target, set(sources)
+
+    def __split_files(self, queries):
+        """Preprocesa todos los ficheros (ver __process_file). Solo se guarda el texto de las sentencias no vacias.
+
+        Parameters
+        ----------
+        queries: dict
+            Diccionario generado por la funcion load_queries.
+
+        Returns
+        -------
+        list((str, list(str), list(int), list(str)))
+            Nombre de cada fichero, sus sentencias no vacias, la linea en la que empieza cada una y los comentarios
+            eliminados.
+        """
+        files = []
+        for file, file_statements in self.__process_file(queries):
+            file_queries, lines, comments = [], [], []
+            for statement in file_statements:
+                comments.extend(statement.comments)
+                if statement.text.strip():
+                    file_queries.append(statement.text)
+                    lines.append(statement.line)
+            files.append((file, file_queries, lines, comments))
+
+        return files
+
+    def __schedule(self, files, statements, parsed):
+        """Construye el grafo de dependencias de las sentencias reconocidas en la gramatica. Los comentarios de cada
+        fichero se asignan a su primera sentencia reconocida, o a la primera de los siguientes ficheros si no tiene
+        ninguna, igual que al renombrar las sentencias una a una.
+
+        Parameters
+        ----------
+        files: list
+            Ficheros preprocesados, ver __split_files.
+        statements: list((str, str))
+            Fichero y query de cada sentencia.
+        parsed: list
+            Resultado de _parse_encoded para cada sentencia. En el modo incremental, el arbol de las sentencias que no
+            han cambiado es None.
+
+        Returns
+        -------
+        (rosqltta.scheduler.DependencyGraph, list)
+            Grafo de dependencias y, para cada nodo del grafo, el indice de la sentencia, los argumentos de
+            _rename_statement y el linaje de la sentencia.
+        """
+        comments = {file: file_comments for file, _, _, file_comments in files}
+        graph = DependencyGraph(self.__mapping)
+        nodes = []
+        pending = []
+        current = None
+        for index, ((file, _), statement) in enumerate(zip(statements, parsed)):
+            if file != current:
+                pending.extend(comments.pop(file))
+                current = file
+            if statement is None:
+                continue
+
+            tree, words, target, sources = statement
+            graph.add(target, sources)
+            nodes.append((index, (tree, words, pending), (target, sorted(sources))))
+            pending = []
+
+        return graph, nodes
+
+    def __find_record(self, state, file, query, comments, lineage):
+        """Calcula la huella de las entradas de una sentencia y busca si se renombro con las mismas entradas en la
+        ultima ejecucion incremental. Las entradas son el texto, los comentarios y los mapeos de las tablas que crea o
+        lee, con los cambios de las sentencias ya renombradas en esta ejecucion.
+
+        Returns
+        -------
+        (str, dict)
+            Huella de las entradas y registro de la ultima ejecucion, o None si hay que renombrar la sentencia.
+        """
+        if state is None:
+            return None, None
+
+        record = state.get(file, query)
+        target, sources = lineage
+        tables = set(sources) | ({target} if target else set())
+        if record is not None and record.get('all_tables'):
+            mapping = dict(self.__mapping)
+        else:
+            mapping = {table: self.__mapping.get(table) for table in tables}
+        inputs = fingerprint(query, '\n'.join(comments), json.dumps(mapping, sort_keys=True))
+
+        if record is None or record.get('inputs') != inputs:
+            return inputs, None
+
+        return inputs, dict(record, reused=True)
+
+    def __rename_in_order(self, graph, nodes, statements, state=None):
+        """Renombra las sentencias una a una en orden topologico. Se para en el primer error.
+
+        Returns
+        -------
+        (list(str), list((int, str)), dict, (int, Exception))
+            Sentencias renombradas (None si no se han podido renombrar), tablas creadas por cada sentencia, registros
+            del modo incremental de cada sentencia y error junto con el indice de la sentencia, si lo hay.
+        """
+        renamed = [query for _, query in statements]
+        for index, _, _ in nodes:
+            renamed[index] = None
+
+        created = []
+        records = {}
+        for node in graph.order():
+            index, (tree, words, comments), lineage = nodes[node]
+            file, query = statements[index]
+            inputs, record = self.__find_record(state, file, query, comments, lineage)
+            if record is None:
+                if tree is None:
+                    tree, words = self._parse_statement(query)[:2]
+                else:
+                    tree = decode(tree, self._tree_format)
+                output, mapping, error, all_tables = self._rename_statement(tree, words, comments)
+                if error is not None:
+                    return renamed, created, records, (index, error)
+                record = {'lineage': lineage, 'inputs': inputs, 'output': output, 'mapping': mapping,
+                          'all_tables': all_tables}
+            else:
+                self.__mapping.update(record['mapping'])
+
+            renamed[index] = record['output']
+            records[index] = record
+            created.extend((index, table) for table in record['mapping'])
+
+        return renamed, created, records, None
+
+    def __rename_levels(self, graph, nodes, statements, state, executor, workers):
+        """Renombra las sentencias en paralelo, nivel a nivel (ver DependencyGraph.levels). Los procesos parten de los
+        mapeos cargados al empezar y reciben con cada sentencia los mapeos de las tablas creadas en niveles
+        anteriores. Se para al terminar el nivel en el que hay un error.
+
+        Returns
+        -------
+        (list(str), list((int, str)), dict, (int, Exception))
+            Sentencias renombradas (None si no se han podido renombrar), tablas creadas por cada sentencia, registros
+            del modo incremental de cada sentencia y error junto con el indice de la sentencia, si lo hay.
+        """
+        renamed = [query for _, query in statements]
+        for index, _, _ in nodes:
+            renamed[index] = None
+
+        created = []
+        records = {}
+        mappings = {}
+        error = None
+        for level in graph.levels():
+            tasks = []
+            for node in level:
+                index, args, lineage = nodes[node]
+                file, query = statements[index]
+                inputs, record = self.__find_record(state, file, query, args[2], lineage)
+                if record is None:
+                    tasks.append((index, inputs, lineage, args + (mappings, query)))
+                else:
+                    records[index] = record
+
+            results = executor.map(_rename_in_worker, [task[3] for task in tasks],
+                                   chunksize=max(1, len(tasks) // (4 * workers)))
+            for (index, inputs, lineage, _), ((output, mapping, level_error, all_tables), metrics) in zip(tasks,
+                                                                                                          results):
+                self._merge_metrics(metrics)
+                records[index] = {'lineage': lineage, 'inputs': inputs, 'output': output, 'mapping': mapping,
+                                  'all_tables': all_tables}
+                if level_error is not None and error is None:
+                    error = (index, level_error)
+
+            mappings = dict(mappings)
+            for node in level:
+                index = nodes[node][0]
+                if index in records:
+                    renamed[index] = records[index]['output']
+                    created.extend((index, table) for table in records[index]['mapping'])
+                    mappings.update(records[index]['mapping'])
+                    self.__mapping.update(records[index]['mapping'])
+            if error is not None:
+                break
+
+        return renamed, created, records, error
+
+    def __save_statements(self, statements, renamed, path, overwrite=False):
+        """Guarda las sentencias renombradas de cada fichero en su orden original, hasta la primera que no se haya
+        podido renombrar. Cada fichero se escribe con rosqltta.writer.OutputWriter y se confirma en cuanto se terminan
+        sus sentencias. El vaciado del buffer se configura con 'output_flush_every' y 'output_buffer_size'.
+
+        Parameters
+        ----------
+        statements: list((str, str))
+            Fichero y query de cada sentencia.
+        renamed: list(str)
+            Sentencias renombradas, o None si no se han podido renombrar.
+        path: str
+            Ruta de los ficheros de salida.
+        overwrite: boolean
+            Sobreescribir los ficheros de salida en lugar de agregar las sentencias al final.
+
+        Returns
+        -------
+        set(int)
+            Indices de las sentencias guardadas.
+        """
+        stopped = set()
+        saved = set()
+        with OutputWriter(path, append=not overwrite, flush_every=self._config.get('output_flush_every', 0),
+                          buffer_size=self._config.get('output_buffer_size', -1)) as writer:
+            current = None
+            for index, ((file, _), query) in enumerate(zip(statements, renamed)):
+                if file != current:
+                    writer.commit(current)
+                    current = file
+                if query is None:
+                    stopped.add(file)
+                if file not in stopped:
+                    writer.write(file, query + self.STATEMENT_END)
+                    saved.add(index)
+
+        return saved
+
+    def _start_worker(self):
+        """Prepara el parser para renombrar sentencias en un proceso del modo paralelo. Se guardan los mapeos iniciales
+        para que cada sentencia se procese partiendo de ellos, independientemente del orden de reparto."""
+        self.__worker_mapping = self._mapping_store
+        self.timings = Counter()
+        if self._instrumentation is not None:
+            # Los registros se devuelven con cada resultado, ver _pop_metrics
+            self._instrumentation = RecordBuffer()
+
+    @staticmethod
+    def __process_file(queries):
+        """Preprocesa un fichero de query. Se eliminan los comentarios y se separan las queries por cada punto y coma
+        que no este dentro de un literal, ver rosqltta.splitter.split_statements.
 
         Parameters
         ----------
         queries: dict
             Diccionario generado por la funcion load_queries. La clave es el nombre del fichero y el valor es un
-            generador de las queries almacenadas en este.
+            generador de las queries almacenadas en este, con cualquiera de los dos formatos de load_queries.
 
         Returns
         -------
         generator
-            Devuelve cada vez uno de los ficheros preprocesados.
+            Devuelve cada vez uno de los ficheros preprocesados, con un generador de sus sentencias.
         """
         for file in queries.keys():
-            yield file, ' '.join(map(self._remove_comment, next(line for line in queries[file]))).split(';')
+            first = next(queries[file], None)
+            if isinstance(first, list):
+                # Lineas ya leidas con _read_query_file
+                yield file, split_statements(first)
+            else:
+                yield file, chain([first] if first else [], queries[file])
 
-    def __parse_and_save(self, query, file_name, path):
-        """Parsea y almacena una query. La query que entra viene de iterar sobre un generador, el proposito de esta
-        funcion es poder realizar el procesamiento sin tener que almacenar todas las queries en memoria en ningun
-        momento.
+    def _parse_statement(self, query, location=None):
+        """Parsea una sentencia para renombrarla despues con _rename_statement. Si no se reconoce en la gramatica, se
+        guardara tal cual.
 
         Parameters
         ----------
         query: str
             Query con los comentarios eliminados.
-        file_name: str
-            Nombre del fichero de salida.
-        path: str
-            Ruta de los ficheros de salida.
+        location: str
+            Fichero y linea de la sentencia, para los mensajes.
 
         Returns
         -------
-
+        (nltk.Tree, list(str), str, set(str))
+            Arbol, variables y literales tokenizados (ver _clean_line), tabla que crea o en la que inserta y tablas
+            que lee (ver _get_lineage). Si la sentencia no se reconoce en la gramatica, devuelve None.
         """
         self._logger.debug(query)
-        self.__queries_elements = []
-        self.__reverse_tree = []
-        self.__queries = {}
-        _out_path = os.path.join(path, file_name)
         try:
-            parsed = self.parse_query(query)
-            self.save_query(parsed.rename_tree().rebuild_query(), _out_path)
+            with self._phase('parse'):
+                self.parse_query(query)
         except OutOfGrammarException as err:
             # No se reconoce en la gramatica, se guarda tal cual. Puede ser un seteo de parametros de hive
-            self._logger.warning('La gramatica de la query no se reconoce, se almacena sin modificaciones. {}. '
-                                 '{}'.format(query, err))
-            self.save_query(query, _out_path)
+            self._logger.warning('La gramatica de la query {}no se reconoce, se almacena sin modificaciones. {}. '
+                                 '{}'.format('de {} '.format(location) if location else '', query, err))
+            return None
+
+        return (self.tree, self.__words) + self._get_lineage(self.tree)
+
+    def _parse_encoded(self, query, location=None):
+        """Parsea una sentencia como _parse_statement, pero devuelve el arbol codificado con rosqltta.tree.encode. El
+        arbol codificado ocupa mucho menos que el nltk.Tree, asi que save_renamed puede guardar los de todas las
+        sentencias hasta renombrarlas, y se puede enviar entre procesos aunque sea mas profundo que el limite de
+        recursividad de pickle.
+
+        Returns
+        -------
+        (bytes, list(str), str, set(str))
+            Arbol codificado, variables y literales tokenizados, tabla destino y tablas origen. Si la sentencia no se
+            reconoce en la gramatica, devuelve None.
+        """
+        statement = self._parse_statement(query, location)
+        if statement is not None:
+            statement = (encode(statement[0]),) + statement[1:]
+        return statement
+
+    def _rename_statement(self, tree, words, comments, created=None, query=None):
+        """Renombra y reconstruye una sentencia parseada con _parse_statement, sin persistir nada.
+
+        Parameters
+        ----------
+        tree: nltk.Tree
+            Arbol de la sentencia. Si es None, se parsea la query.
+        words: list(str)
+            Variables y literales tokenizados.
+        comments: list(str)
+            Comentarios que se ponen al principio de la sentencia.
+        created: dict
+            Mapeos de las tablas creadas por sentencias ya renombradas en otros procesos. Solo se usa en el modo
+            paralelo, donde se parte de los mapeos cargados al empezar.
+        query: str
+            Query de la sentencia, para parsearla si no se indica el arbol.
 
-        if self._creating_table:
-            self.save_json(self.__mapping[self._creating_table],
-                           os.path.join(self._config['mapping_dir'], self._creating_table + '.json'))
+        Returns
+        -------
+        (str, dict, Exception, boolean)
+            Sentencia renombrada, mapeo de la tabla que crea o en la que inserta, error, si lo hay, y si se ha buscado
+            alguna columna en todas las tablas mapeadas (ver _deduce_table). Si hay un error, la sentencia es None.
+        """
+        if tree is None:
+            tree, words = self._parse_statement(query)[:2]
+
+        mapping = ChainMap(dict(created), self.__worker_mapping) if created is not None else self._mapping_store
+        context = self._local.context = StatementContext(mapping)
+        context.tree = tree
+        context.words = words
+        context.comments = comments
+        try:
+            with self._phase('rename'):
+                self.rename_tree()
+            with self._phase('format'):
+                query = self.rebuild_query()
+        except Exception as err:
             self._creating_table = None
+            return None, {}, err, self._all_tables
+
+        mapping = {self._creating_table: self.__mapping[self._creating_table]} if self._creating_table else {}
+        self._creating_table = None
+        return query, mapping, None, self._all_tables
 
+    def _mark_dirty(self, table):
+        """Marca el mapeo de una tabla como pendiente de persistir, ver flush_mappings."""
+        if table not in self.__dirty_mappings:
+            self.__dirty_mappings.append(table)
+
+    def flush_mappings(self):
+        """Persiste los mapeos modificados desde la ultima vez, cada uno una sola vez aunque lo hayan modificado varias
+        sentencias. Si en la configuracion se indica 'mapping_compact', los json se escriben sin indentar.
+
+        Returns
+        -------
+        list(str)
+            Tablas cuyos mapeos se han persistido.
+        """
+        compact = self._config.get('mapping_compact', False)
+        with self._lock:
+            flushed, self.__dirty_mappings = self.__dirty_mappings, []
+        for table in flushed:
+            if isinstance(self._mapping_store, SqliteMappingStore):
+                self._mapping_store.save(table)
+            else:
+                self.save_json(self._mapping_store[table],
+                               os.path.join(self._config['mapping_dir'], table + '.json'), compact)
+
+        return flushed
 
     @staticmethod
-    def save_json(output, file):
-        """Persiste un diccionario en el fichero json indicado.
+    def save_json(output, file, compact=False):
+        """Persiste un diccionario en el fichero json indicado. Se escribe en un fichero temporal que se renombra al
+        terminar, de forma que el fichero nunca queda a medio escribir.
 
         Parameters
         ----------
@@ -190,10 +871,10 @@ class Parser:
             Datos a persistir.
         file: str
             Fichero de salida.
+        compact: boolean
+            Escribir el json sin indentar ni espacios.
         """
-        out_file = open(file, "w")
-        out_file.write(json.dumps(output, indent=4, sort_keys=True))
-        out_file.close()
+        write_json(output, file, compact)
 
     @staticmethod
     def save_query(query, file):
@@ -207,66 +888,64 @@ class Parser:
             Fichero de destino.
         """
         with open(file, 'a') as f:
-            f.writelines(query + '\n;\n\n')
+            f.writelines(query + Parser.STATEMENT_END)
 
-    @staticmethod
-    def __str_to_terminals(s):
-        """Pretende separar un terminal extraido de la query en la tupla (tabla, columna). En la practica, sin una
-        estructura gramatical a priori, es imposible saber si la entrada se refiere a (tabla, columna) o (esquema, tabla).
-        De la misma forma, si la cadena no lleva punto, es imposible saber a priori si se refiere a un esquema, una tabla,
-        o una columna.
+    def _get_cache(self, path=None):
+        """Crea la cache persistente de arboles sintacticos (ver rosqltta.cache.ParseCache). Los arboles se invalidan
+        si cambia el fichero de la gramatica y se separan por backend y UDFs.
 
         Parameters
         ----------
-        s: str
-            Terminal a separar.
+        path: str
+            Directorio de la cache. Si no se especifica, se lee del fichero de configuracion ('cache_dir'). Si tampoco
+            esta en la configuracion, no se usa cache.
 
         Returns
         -------
-        str, str
-            tabla, columna.
+        rosqltta.cache.ParseCache
+            Cache de arboles, o None.
         """
-        if '.' in s:
-            return ["'" + t + "'" for t in s.split('.')]
-        else:
-            s = "'" + s + "'"
-            return s, s
+        path = path if path else self._config.get('cache_dir')
+        if not path:
+            return None
+
+        grammar, key = self._get_fingerprint()
+        return ParseCache(path, grammar, key, self._config.get('cache_size', 100000), self._tree_format)
 
-    def _read_grammar_(self, path=None, new_terminals=None):
-        """Lee las reglas de produccion de la gramatica contenidas en el fichero indicado. Si se especifica una lista
-        de nuevos simbolos terminales, esta se agrega a las reglas de produccion que contienen los nombres de tablas y
-        columnas.
+    def _get_fingerprint(self):
+        """Devuelve la huella del fichero de la gramatica y la del resto de elementos que afectan a los arboles
+        generados: el backend y las UDFs."""
+        with open(self._config['grammar_file'], 'rb') as f:
+            grammar = fingerprint(f.read())
+
+        return grammar, fingerprint(self._backend, *self._udfs_norm)
+
+    def _read_grammar_(self, path=None):
+        """Lee y compila las reglas de produccion de la gramatica contenidas en el fichero indicado, agregando las UDFs
+        como nombres de funciones. Los nombres de tablas y columnas no se agregan a la gramatica: el lexer los envia
+        como el terminal generico de los identificadores (ver rosqltta.lexer).
 
         Parameters
         ----------
         path: str
             Ruta al fichero que contiene las reglas de produccion de la gramatica. Si no se especifica esta variable,
             la lee del fichero de configuracion.
-        new_terminals: list(str)
-            Lista de nuevos simbolos terminales, extraidos de la query.
 
         Returns
         -------
-        nltk.grammar.CFG
-            Objeto nltk que contiene la gramatica libre de contexto leida.
+        rosqltta.grammar.CompiledGrammar
+            Objeto que contiene la gramatica libre de contexto leida.
         """
         if not path:
             path = self._config['grammar_file']
 
-        f = open(path, 'r')
-        grammar_file = ' '.join(f.readlines())
-        extras = []
-        self._terminals = [t.upper().strip().replace("'", "") for t in self._find_between(grammar_file, "'", "'")]
-        if new_terminals:
-            new_tables, new_columns = zip(*[self.__str_to_terminals(t) for t in new_terminals])
-            extras.append('TABLE_NAMES -> ' + '|'.join(new_tables))
-            extras.append('COLUMN_NAMES ->' + '|'.join(new_columns))
-
-        if self.udfs:
-            new_udfs = [self.__str_to_terminals(e)[0] for e in self._udfs_norm]
-            extras.append('FUNCTION_NAMES -> ' + '|'.join(new_udfs))
+        grammar = CompiledGrammar.from_file(path)
+        self._terminals = grammar.terminals()
+        if not self._udfs_norm:
+            return grammar
 
-        return nltk.CFG.fromstring('\n'.join([grammar_file] + extras))
+        return CompiledGrammar(grammar.start(),
+                               grammar.productions() + lexical_productions('FUNCTION_NAMES', self._udfs_norm))
 
     @staticmethod
     def __skip_to_node(target, current):
@@ -284,11 +963,31 @@ class Parser:
         nltk.Tree
             Devuelve el nodo target si este no es null, en otro caso devuelve el current.
         """
-        if type(target) is nltk.Tree:
+        if isinstance(target, TREE_TYPES):
             return target
 
         return current
 
+    def _get_backend(self, trace=0):
+        """Devuelve el parser que genera el arbol con la gramatica del parser. El backend 'chart' es el
+        nltk.ChartParser de referencia. El backend 'earley' reutiliza las tablas de prediccion calculadas al crear el
+        objeto y se queda con el primer arbol que encuentra.
+
+        Parameters
+        ----------
+        trace: int
+            Define el nivel de traza que genera el objeto nltk.ChartParser. Si es 0 no genera traza.
+
+        Returns
+        -------
+        nltk.ChartParser, rosqltta.earley.EarleyParser
+            Parser con el metodo parse(tokens).
+        """
+        if self._backend == 'earley':
+            return self.__earley
+
+        return nltk.ChartParser(self.__grammar, trace=trace)
+
     def _init_query(self, i):
         """Inicializa una query con el formato especifico utilizado en la clase.
 
@@ -306,7 +1005,7 @@ class Parser:
         """
         self.__queries.setdefault('max', 0)
         self.__queries.setdefault(i, {})
-        self.__queries[i].setdefault('columns', {'alias': {}, 'names': []})
+        self.__queries[i].setdefault('columns', {'alias': {}, 'names': [], 'bare': {}})
         self.__queries[i].setdefault('tables', {'alias': {}, 'names': []})
         return self.__queries
 
@@ -327,11 +1026,12 @@ class Parser:
             self._logger.error('No se encuentra el fichero json especificado: {}'.format(path))
             raise FileNotFoundError
 
-        js = open(path)
-        return json.load(js)
+        with open(path, 'r') as js:
+            return json.load(js)
 
     def load_mapping_files(self, path):
-        """Carga los ficheros de mapping contenidos en el directorio especificado en un diccionario.
+        """Carga los ficheros de mapping contenidos en el directorio especificado. Los ficheros no se leen hasta que
+        se consulta su tabla, ver rosqltta.mapping.DirectoryMappingStore.
 
         Parameters
         ----------
@@ -340,28 +1040,61 @@ class Parser:
 
         Returns
         -------
-        dict
+        DirectoryMappingStore
             Diccionario que representa todos los ficheros de mapping.
         """
         if not os.path.isdir(path):
             self._logger.error('No se encuentra la ruta especificada: {}'.format(path))
             raise FileNotFoundError
 
-        return {f.replace('.json', ''): self.load_json(os.path.join(path, f)) for f in os.listdir(path)}
+        return DirectoryMappingStore(path)
+
+    def _get_mapping_store(self):
+        """Crea el almacen de mapeos indicado en la configuracion con 'mapping_store':
+            - directory (por defecto): un json por tabla en 'mapping_dir', ver load_mapping_files.
+            - sqlite: una base de datos SQLite en 'mapping_file'. Si no existe y se indica 'mapping_dir', se crea con
+              los json del directorio.
+        En ambos casos los mapeos se cargan la primera vez que se consulta cada tabla.
+
+        Returns
+        -------
+        MappingStore
+            Almacen de mapeos, o None si no se indica ninguno en la configuracion.
+        """
+        store = self._config.get('mapping_store', 'directory')
+        if store == 'directory':
+            return self.load_mapping_files(self._config['mapping_dir']) if 'mapping_dir' in self._config else None
+        if store != 'sqlite':
+            raise ValueError("El almacen de mapeos '{}' no existe. Los almacenes disponibles son: "
+                             "('directory', 'sqlite')".format(store))
+
+        exists = os.path.exists(self._config['mapping_file'])
+        mapping = SqliteMappingStore(self._config['mapping_file'])
+        if not exists and 'mapping_dir' in self._config:
+            self._logger.info('Importados {} mapeos de {}'.format(
+                mapping.import_directory(self._config['mapping_dir']), self._config['mapping_dir']))
+        return mapping
 
     def parse_query(self, query, trace=0):
         """Parsea una query en texto plano para transformarla en una sentencia de la gramatica.
             1. Se preprocesa la query: se cambian las variables hive, literales y constantes por el simbolo #WORD#
-            2. Se ponen espacio a cada lado de los signos de puntuacion, parentesis, etc.
-            3. Si quedan varios espacios seguidos, se simplifican a un espacio.
-            4. Se tokenizan las palabras para convertirlas elementos de una lista.
+            2. Se divide la query en tokens con el analizador lexico, que clasifica cada palabra en palabra clave,
+               literal, signo de puntuacion, operador o identificador.
+            3. Se parsea la secuencia de terminales. Los identificadores (tablas, columnas y alias) se representan en la
+               gramatica con el terminal generico #IDENT#.
+            4. Se vuelven a poner los nombres originales de los identificadores en las hojas del arbol.
+        Si hay cache de arboles (ver _get_cache), los pasos 3 y 4 se sustituyen por una consulta cuando la query
+        preprocesada ya se ha parseado antes.
+        Si la clave 'tree_format' de la configuracion es 'compact', el arbol se guarda como un
+        rosqltta.tree.CompactTree, que ocupa menos memoria y se recorre con la misma interfaz que nltk.Tree.
 
         Parameters
         ----------
         query: str
             Query que se va a transformar.
         trace: int
-            Define el nivel de traza que genera el objeto nltk.ChartParser. Si es 0 no genera traza.
+            Define el nivel de traza que genera el objeto nltk.ChartParser. Si es 0 no genera traza. Solo se aplica con
+            el backend 'chart'.
 
         Returns
         -------
@@ -372,34 +1105,104 @@ class Parser:
             raise OutOfGrammarException('No se pueden parsear directamente queries con comentarios. Solo es posible '
                                         'en el procesamiento masivo de ficheros si estan correctamente formateados.')
 
+        timer = self._timer('parse')
         self.__words = []
-        clean_query = self._clean_line(query)
-        sent = clean_query.replace(',', ' , ').replace('.', ' . ').replace('(', ' ( ').replace(')', ' ) ')
-        sent = [chunk.upper() for chunk in re.sub(' +', ' ', sent).split(' ') if chunk]
-
-        if not sent:
+        line = self._clean_line(query)
+        timer.lap('clean_line')
+        tokens = self._lexer.tokenize(line)
+        timer.lap('tokenize')
+        timer.count('tokens', len(tokens))
+
+        if not tokens:
+            timer.emit(OutOfGrammarException)
             raise OutOfGrammarException('La query introducida no pertenece a la gramatica de hive.')
-        if sent[0] == 'SET':
+        if tokens[0].text == 'SET':
+            timer.emit(OutOfGrammarException)
             raise OutOfGrammarException('Procesando sentencia de configuracion, no es gramatica de hive: '
-                                        '{}'.format(sent))
-
-        self._logger.debug('sent: {}'.format(sent))
-        new_terminals = set(filter(lambda x: x not in self._terminals + self._udfs_norm, sent))
-        self._logger.debug('new terminals: {}'.format(new_terminals))
-        self.__grammar = self._read_grammar_(self._config['grammar_file'], new_terminals)
-        parser = nltk.ChartParser(self.__grammar, trace=trace)
-
-        self.tree = next(parser.parse(sent), None)
+                                        '{}'.format([token.text for token in tokens]))
+
+        cached, self.tree = self._cache.get(line) if self._cache is not None else (False, None)
+        timer.lap('cache')
+        timer.count('cached', int(cached))
+        if not cached:
+            sent = [token.terminal for token in tokens]
+            self._logger.debug('sent: {}'.format(sent))
+            parser = self._get_backend(trace)
+            timer.lap('backend')
+
+            if timer.enabled:
+                trees, edges = self._parse_counting_edges(parser, sent)
+                timer.count('edges', edges)
+            else:
+                trees = parser.parse(sent)
+            self.tree = next(trees, None)
+            timer.lap('parse')
+            if self.tree:
+                self._restore_identifiers(self.tree, tokens)
+            if self._cache is not None:
+                self._cache.put(line, self.tree)
+            timer.lap('restore')
 
         if not self.tree:
+            timer.emit(OutOfGrammarException)
+            identifiers = {token.text for token in tokens if token.category == IDENTIFIER}
             raise OutOfGrammarException('La query proporcionada no es una sentencia de la gramatica utilizada. Los '
-                                        'siguientes no terminales han sido incluidos en la gramatica como tablas o '
-                                        'columnas, si alguno de ellos deberia hacer referencia a una funcion o a otra '
-                                        'regla de produccion, esta puede ser la causa del error: '
-                                        '{}'.format(new_terminals))
-
+                                        'siguientes identificadores se han tratado como tablas o columnas, si alguno '
+                                        'de ellos deberia hacer referencia a una funcion o a otra regla de produccion, '
+                                        'esta puede ser la causa del error: {}'.format(identifiers))
+
+        if self._tree_format == 'compact':
+            self.tree = compact(self.tree)
+            timer.lap('compact')
+        if timer.enabled:
+            timer.count('nodes', count_nodes(self.tree))
+        timer.emit()
         return self
 
+    @staticmethod
+    def _parse_counting_edges(parser, sent):
+        """Parsea una secuencia de terminales con el backend indicado y cuenta los arcos del chart: las aristas del
+        nltk.ChartParser o los items de la tabla de Earley. Solo se usa con la instrumentacion activada.
+
+        Returns
+        -------
+        (iterator(nltk.Tree), int)
+            Arboles encontrados, como en parse, y numero de arcos.
+        """
+        if isinstance(parser, EarleyParser):
+            trees, chart = parser.parse_chart(sent)
+            return trees, sum(len(items) for items in chart)
+
+        chart = parser.chart_parse(sent)
+        return iter(chart.parses(parser.grammar().start())), chart.num_edges()
+
+    @staticmethod
+    def _restore_identifiers(tree, tokens):
+        """Sustituye el terminal generico de los identificadores en las hojas del arbol por su nombre en la query.
+
+        Parameters
+        ----------
+        tree: nltk.Tree
+            Arbol generado por el parser.
+        tokens: list(rosqltta.lexer.Token)
+            Tokens de la query, en el mismo orden que las hojas del arbol.
+        """
+        tokens = iter(tokens)
+        stack = [(tree, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i == len(node):
+                continue
+
+            stack.append((node, i + 1))
+            if isinstance(node[i], nltk.Tree):
+                stack.append((node[i], 0))
+                continue
+
+            token = next(tokens)
+            if token.category == IDENTIFIER:
+                node[i] = token.text
+
     def __update_subqueries(self, i):
         """Cuando se lee un nodo que representa una subquery, este se almacena en una cola a la espera de saber
         el indice de esa subquery. Cuando la siguiente subquery empieza a procesarse, coge el ultimo elemento de la
@@ -419,41 +1222,24 @@ class Parser:
         _node = self.__queries_elements.pop()
         _node.update({'subquery': i})
 
-    def __process_table_name(self, parent, node, root, i, skip_to):
-        """Extrae los nombres de las tablas involucradas en este nivel de la query asi como sus alias a partir de un
-        nodo TABLE_EXPRESSION. Las posibles subqueries no se procesan todavia, quedan a la espera de que se itere sobre
-        ellas.
+    def __process_table_name(self, parent, node, root, i):
+        """Extrae el nombre de una tabla, o su alias, de un nodo TABLE_NAMES o el alias de una subquery de su nodo raiz,
+        a partir de un nodo TABLE_EXPRESSION. La subquery no se procesa todavia, su alias queda a la espera de que se
+        itere sobre ella. Ver __iter_table_node.
 
         Parameters
         ----------
         parent: nltk.Tree
             Nodo progenitor del que se procesa.
         node: nltk.Tree
-            Nodo que se procesa.
+            Nodo que se procesa, con la etiqueta TABLE_NAMES o root.
         root: str
             Etiqueta del nodo que contiene una subquery.
         i: int
             Indice de la query actual.
-        skip_to: nltk.Tree
-            Toma el valor del ultimo nodo procesado para que la funcion que llama a get_table_name pueda saltar
-            directamente a ese nodo y no tenga que volver a procesarlo. Si el nodo contiene subqueries, se deuvelve
-        la raiz de la primera subquery.
-
-        Returns
-        -------
-        nltk.Tree
-            Toma el valor del ultimo nodo procesado para que la funcion que llama a get_table_name pueda saltar
-            directamente a ese nodo y no tenga que volver a procesarlo. Si el nodo contiene subqueries, se deuvelve
-            la raiz de la primera subquery.
         """
         tables = self.__queries[i]['tables']
-        if node.label() not in ['TABLE_NAMES', root]:
-            # Si no es un nodo de tabla, sigue iterando
-            _skip = self.__iter_table_node(node, root, i, skip_to)
-            skip_to = self.__skip_to_node(skip_to, _skip)
-        elif node.label() == root:
-            # Si es el primer nodo root encontrado
-            skip_to = self.__skip_to_node(skip_to, parent)
+        if node.label() == root:
             # Se extrae el alias (sin AS) y se actualiza el diccionario
             _alias_node = parent[-1].leaves()
             _table_name = _alias_node[0] if len(_alias_node) == 1 else _alias_node[1]  # Si no lleva 'AS' guarda el primero
@@ -467,14 +1253,12 @@ class Parser:
             if _table_name not in tables['names']:
                 tables['names'] += [_table_name]
             self.__reverse_tree.append((parent, i, False))
-        elif parent.label() == 'TABLE_ALIAS' and tables['names']:
+        elif tables['names']:
             # Si es una referencia a un alias y este no es de una subquery
             tables['alias'].setdefault(node.leaves()[0], tables['names'][-1])
             self._logger.debug('Se mete nodo alias: {}'.format(parent))
             self.__reverse_tree.append((parent, i, False))
 
-        return skip_to
-
     @staticmethod
     def __merge_schema(node):
         """Si el nodo es una referencia a una tabla y esta lleva referencia a su esquema, se fusiona el nombre de la
@@ -506,8 +1290,57 @@ class Parser:
 
         return False
 
-    def __iter_table_node(self, tree, root, i, skip_to=None):
-        """Itera sobre los nodos de una referencia a tabla y los va procesando.
+    @staticmethod
+    def _get_lineage(tree):
+        """Obtiene la tabla que crea o en la que inserta una sentencia y las tablas que lee. El nombre de las tablas
+        incluye el esquema, igual que en los mapeos. No modifica el arbol.
+
+        Parameters
+        ----------
+        tree: nltk.Tree
+            Arbol de la sentencia.
+
+        Returns
+        -------
+        (str, set(str))
+            Tabla destino, o None si la sentencia no crea ni inserta en ninguna tabla, y tablas origen.
+        """
+        target_node = Parser.__target_reference(tree)
+        target = None
+        sources = set()
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, TREE_TYPES):
+                continue
+
+            stack.extend(node)
+            if node.label() != 'TABLE_REFERENCE' or node[0].label() != 'TABLE_NAMES':
+                # Las subqueries y las vistas laterales se recorren por sus propias referencias a tablas
+                continue
+
+            # Los hijos pueden ser TABLE_NAMES [POINT TABLE_NAMES] [TABLE_ALIAS]
+            name = ''.join(''.join(child.leaves()) for child in node if child.label() in ('TABLE_NAMES', 'POINT'))
+            if node is target_node:
+                target = name
+            else:
+                sources.add(name)
+
+        return target, sources
+
+    @staticmethod
+    def __target_reference(tree):
+        """Devuelve el nodo TABLE_REFERENCE de la tabla que crea o en la que inserta una sentencia, o None."""
+        for node in tree:
+            if isinstance(node, TREE_TYPES) and node.label() in ('INSERT_EXPRESSION', 'CREATE_EXPRESSION'):
+                return next(child for child in node if isinstance(child, TREE_TYPES) and
+                            child.label() == 'TABLE_REFERENCE')
+
+        return None
+
+    def __iter_table_node(self, tree, root, i):
+        """Recorre en profundidad los nodos de una referencia a tabla, con una pila en lugar de recursividad, y procesa
+        los nombres de tablas y las subqueries que encuentra (ver __process_table_name). No se entra en las subqueries.
 
         Parameters
         ----------
@@ -517,22 +1350,39 @@ class Parser:
             Etiqueta del nodo que contiene una subquery.
         i: int
             Indice de la query actual.
-        skip_to: nltk.Tree
-            Toma el valor del ultimo nodo procesado para que la funcion que llama a get_table_name pueda saltar
-            directamente a ese nodo y no tenga que volver a procesarlo. Si el nodo contiene subqueries, se deuvelve
-            la raiz de la primera subquery.
 
         Returns
         -------
         nltk.Tree
-            Toma el valor del ultimo nodo procesado para que la funcion que llama a get_table_name pueda saltar
-            directamente a ese nodo y no tenga que volver a procesarlo. Si el nodo contiene subqueries, se deuvelve
-            la raiz de la primera subquery.
+            Si el primer nodo que se alcanza bajando siempre por el primer hijo es una subquery, su progenitor, para
+            que _process_tree salte directamente a el y no tenga que volver a procesar el resto del nodo. En otro caso,
+            None.
         """
+        skip_to = None
+        # Mientras solo se haya bajado por el primer hijo de cada nodo
+        first = True
         self.__merge_schema(tree)
-        skip_to = [self.__process_table_name(tree, node, root, i, skip_to) for node in self.get_subtrees(tree)]
+        stack = [(tree, self.get_subtrees(tree))]
+        while stack:
+            parent, children = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                first = False
+                continue
+
+            if node.label() not in ('TABLE_NAMES', root):
+                # Si no es un nodo de tabla, sigue iterando
+                self.__merge_schema(node)
+                stack.append((node, self.get_subtrees(node)))
+                continue
+
+            if first and node.label() == root:
+                skip_to = parent
+            first = False
+            self.__process_table_name(parent, node, root, i)
 
-        return skip_to[0] if skip_to else None
+        return skip_to
 
     def __process_column_node(self, parent, node, columns):
         """Extrae los nombres de las columnas involucradas en los nodos que se procesan.
@@ -548,8 +1398,8 @@ class Parser:
 
         Returns
         -------
-        list(str)
-            Lista de columnas extraidas hasta ahora.
+        dict
+            Columnas extraidas hasta ahora.
         """
         if node.label() != 'COLUMN_NAMES':
             # Si no es un nodo de columna, sigue iterando
@@ -557,6 +1407,8 @@ class Parser:
         elif parent.label() != 'COLUMN_ALIAS':
             # Si es una referencia directa a una columna
             columns['names'] += [''.join(parent.leaves()).replace('DISTINCT', '')]
+            # Indexa la columna por su nombre sin tabla para resolverla desde las queries padre sin recorrer la lista
+            columns.setdefault('bare', {}).setdefault(self._bare_column(columns['names'][-1]), columns['names'][-1])
         elif parent.label() == 'COLUMN_ALIAS':
             # Si es un alias
             columns['alias'].setdefault(node.leaves()[0], columns['names'][-1])
@@ -564,21 +1416,31 @@ class Parser:
         return columns
 
     def __iter_column_node(self, tree, columns):
-        """Itera sobre los nodos que hacen referencia a columnas y los va procesando.
+        """Recorre en profundidad los nodos de un trozo de query, con una pila en lugar de recursividad, y procesa los
+        nombres de columnas que encuentra (ver __process_column_node).
 
         Parameters
         ----------
         tree: nltk.Tree
             Nodo raiz.
         columns: dict
-            Lista de columnas.
+            Columnas extraidas hasta ahora.
 
         Returns
         -------
-        list(str)
-            Lista actualizada de columnas.
+        dict
+            Columnas actualizadas.
         """
-        columns = [self.__process_column_node(tree, node, columns) for node in self.get_subtrees(tree)]
+        stack = [(tree, self.get_subtrees(tree))]
+        while stack:
+            parent, children = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+            elif node.label() != 'COLUMN_NAMES':
+                stack.append((node, self.get_subtrees(node)))
+            else:
+                self.__process_column_node(parent, node, columns)
 
         return columns
 
@@ -602,7 +1464,10 @@ class Parser:
         elif node.label() == 'CREATE_EXPRESSION':
             self._creating_table = ''.join(node[2].leaves())
 
-        self.__mapping.setdefault(self._creating_table, self.new_mapped_table(self._creating_table))
+        # Se copia el mapeo de la tabla que se crea antes de registrar los campos nuevos, para no modificar los mapeos
+        # que comparten las sentencias en el modo paralelo
+        mapped_table = self.__mapping.get(self._creating_table) or self.new_mapped_table(self._creating_table)
+        self.__mapping[self._creating_table] = dict(mapped_table, fields=dict(mapped_table.get('fields', {})))
         self._logger.debug('Creando tabla: {}. Se van a almacenar los nuevos mapeos'.format(self._creating_table))
 
     @staticmethod
@@ -673,6 +1538,12 @@ class Parser:
             Etiqueta del nodo raiz de una consulta.
         i: int
             Indice de la query procesada.
+
+        Returns
+        -------
+        (nltk.Tree, int)
+            Nodo por el que tiene que seguir el recorrido de _process_tree, que es el propio nodo o el progenitor de la
+            primera subquery de una referencia a tabla, e indice de su query. None si no hay que profundizar.
         """
         next_node = None
         if node.label() == root:
@@ -697,12 +1568,16 @@ class Parser:
             # Si es la parte del insert o create table, se renombra directamente
             self.__rename_non_select(node)
 
-        if not node.label() == 'COLUMN_EXPRESSION':
+        if node.label() == 'COLUMN_EXPRESSION':
             # Si el nodo es de columnas, ya esta procesado y no es necesario profundizar
-            self._process_tree(self.__skip_to_node(next_node, node), i, root)
+            return None
+
+        return self.__skip_to_node(next_node, node), i
 
     def _process_tree(self, tree, i=0, root='SELECT_SENTENCE'):
-        """Recorre el AST y va actualizando el diccionario de queries (self.__queries).
+        """Recorre el AST en profundidad y va actualizando el diccionario de queries (self.__queries). El recorrido usa
+        una pila en lugar de recursividad, de forma que no depende del limite de recursividad de Python aunque el arbol
+        sea muy profundo, como en las cadenas largas de columnas o de UNION.
 
         Parameters
         ----------
@@ -713,8 +1588,20 @@ class Parser:
         root: str
             Etiqueta del nodo raiz de una consulta select.
         """
-        self.__queries.update(self._init_query(i + 1))
-        [self.__process_node(node, tree, root, i) for node in self.get_subtrees(tree)]
+        self._init_query(i + 1)
+        stack = [(tree, self.get_subtrees(tree), i)]
+        while stack:
+            parent, children, i = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                continue
+
+            next_node = self.__process_node(node, parent, root, i)
+            if next_node is not None:
+                node, i = next_node
+                self._init_query(i + 1)
+                stack.append((node, self.get_subtrees(node), i))
 
     def _get_reverse_tree(self):
         """Devuelve la lista de nodos extraidos en la funcion get_nodes."""
@@ -786,7 +1673,23 @@ class Parser:
         filter
             Lista filtrada de subarboles.
         """
-        return filter(lambda child: isinstance(child, nltk.Tree), tree)
+        return filter(lambda child: isinstance(child, TREE_TYPES), tree)
+
+    @staticmethod
+    def _bare_column(name):
+        """Normaliza el nombre de una columna quitando la referencia a la tabla.
+
+        Parameters
+        ----------
+        name: str
+            Nombre de la columna.
+
+        Returns
+        -------
+        str
+            Nombre de la columna sin tabla y en mayusculas.
+        """
+        return str(name).split('.')[-1].upper()
 
     @staticmethod
     def _equal_columns(a, b):
@@ -804,7 +1707,7 @@ class Parser:
         Boolean
             True si las columnas son iguales aun que pertenezcan a distintas tablas, False en caso contrario.
         """
-        return str(a).split('.')[-1].upper() == str(b).split('.')[-1].upper()
+        return Parser._bare_column(a) == Parser._bare_column(b)
 
     def _get_unreferenced_table(self, i, column):
         """Obtiene la tabla en una query en la que las columnas no llevan referencias a tablas.
@@ -905,22 +1808,30 @@ class Parser:
             # Si se trata de un alias, no lleva referencia de columna
             return '', current_column
 
-        try:
+        columns = self.__queries[target_i]['columns']
+        if 'bare' in columns:
+            new_reference = columns['bare'].get(self._bare_column(current_column))
+        else:
             # Busca coincidencias en la subquery con el nombre de la columna actual
-            new_reference = [e for e in self.__queries[target_i]['columns']['names'] if
-                             self._equal_columns(current_column, e)]
-            return self._get_referenced_names(new_reference[0], target_i)
-        except IndexError:
-            # La columna puede no estar en la subquery, pero pertenecer a la subtabla
-            pass
+            new_reference = next((e for e in columns['names'] if self._equal_columns(current_column, e)), None)
+
+        # La columna puede no estar en la subquery, pero pertenecer a la subtabla
+        if new_reference is not None:
+            try:
+                return self._get_referenced_names(new_reference, target_i)
+            except IndexError:
+                pass
 
         # Si no es un alias y va sin referencia a tabla, esta haciendo referencia a una columna de la subquery que no
         # aparece en la consulta pero que deberia existir. Esto solo se permite si la subquery consulta una sola tabla
         table = self._get_unreferenced_table(target_i, current_column)
 
         try:
-            return table, self.__mapping[table]['fields'][current_column]
+            column = self.__mapping[table]['fields'][current_column]
+            self._count('mapping_hits')
+            return table, column
         except KeyError as err:
+            self._count('mapping_misses')
             self._logger.warning("{}. La referencia a la columna '{}' de la tabla '{}' no se encuentra en los ficheros "
                                  "de mapping proporcionados ni en los generados."
                                  " Se devuelve el nombre original".format(err, current_column, table))
@@ -973,7 +1884,7 @@ class Parser:
             # Si es un alias que no pertenece a una subquery
             real_name = self.__queries[i]['tables']['alias'][table_name]
             new_table = table_name
-            new_column = self.__mapping[real_name]['fields'].get(column_name, column_name)
+            new_column = self.__lookup_column(real_name, column_name)
         elif self.is_subquery(table_name, i):
             # Si es una subquery
             new_table = table_name  # el nombre de tabla es un alias
@@ -982,13 +1893,24 @@ class Parser:
             # Si es una referencia normal
             try:
                 new_table = self.__mapping[table_name].get('new_name', table_name)
-                new_column = self.__mapping[table_name]['fields'].get(column_name, column_name)
+                new_column = self.__lookup_column(table_name, column_name)
             except KeyError as err:
                 self._logger.debug('referencia normal. Tabla: {}, i: {}, is: {}'.format(table_name, i, self.is_subquery(table_name, i)))
                 raise KeyError(err)
 
         return new_table, new_column
 
+    def __lookup_column(self, table_name, column_name):
+        """Devuelve el nombre nuevo de una columna en el mapeo de su tabla, o el original si no esta mapeada. Si la
+        tabla no esta en los mapeos, lanza KeyError."""
+        fields = self.__mapping[table_name]['fields']
+        if column_name in fields:
+            self._count('mapping_hits')
+            return fields[column_name]
+
+        self._count('mapping_misses')
+        return column_name
+
     @staticmethod
     def _is_referenced_column_node(parent, node):
         """Comprueba si el nodo pertenece a una columna con referencia a su tabla.
@@ -1046,23 +1968,52 @@ class Parser:
         return parent.label() == 'TABLE_REFERENCE' and node.label() == 'TABLE_NAMES'
 
     def _deduce_table(self, i, column, possible_tables=None):
+        """Deduce la tabla a la que pertenece una columna sin referencia, entre las tablas indicadas o, si no se
+        indica ninguna, entre todas las tablas mapeadas. Las tablas que tienen la columna se obtienen siempre del indice
+        inverso de los mapeos (ver rosqltta.mapping.column_owners), que despues se cruza con las candidatas, en lugar de
+        recorrer los campos de cada tabla.
+
+        Parameters
+        ----------
+        i: int
+            Indice de la query actual.
+        column: str
+            Nombre de la columna.
+        possible_tables: list(str)
+            Tablas candidatas.
+
+        Returns
+        -------
+        str
+            Tabla de la columna, o None si no pertenece a ninguna o alguna candidata no esta mapeada.
+        """
+        owners = column_owners(self.__mapping, column)
         if not possible_tables:
             # todas
             self._logger.warning('Se intenta deducir la tabla pero no se obtiene referencia desde la query. Se procede'
                                  ' a buscar el campo en todas las tablas mapeadas hasta el momento.')
+            self._all_tables = True
+            subqueries = [table for table in self.__queries[i]['tables']['alias']
+                          if self.is_subquery(table, i) and table in self.__mapping]
+            if len(owners) < 2 and not subqueries:
+                return next(iter(owners), None)
+
+            # Solo hace falta recorrer todas las tablas si alguna tiene el nombre de una subquery o para listar las
+            # candidatas en el mensaje de error en el mismo orden que los mapeos
             possible_tables = self.__mapping.keys()
 
         possible_tables = [self.__find_sub_column(table, column, i)[0] if self.is_subquery(table, i) else table
                            for table in possible_tables]
 
-        try:
-            matching_tables = [table for table in possible_tables if column in self.__mapping[table]['fields']]
-        except KeyError as key:
+        missing = [table for table in possible_tables if table not in self.__mapping]
+        if missing:
             self._logger.warning("La tabla '{}' no se encuentra en los ficheros de mapping. Por favor, asegura "
                                  "que ha sido anteriormente procesada y/o incluida en los ficheros de "
-                                 "mapping.".format(key))
+                                 "mapping.".format(missing[0]))
             return
 
+        matching_tables = [table for table in possible_tables if table in owners]
+
         if len(matching_tables) > 1:
             raise UnreferencedTableError('Referencia ambigua. El campo {} no hace referencia explicita '
                                          'a ninguna tabla. Se ha intentado deducir pero podria pertenecer a varias '
@@ -1107,7 +2058,9 @@ class Parser:
             table_name = tables[0]
             try:
                 new_column = self.__mapping[table_name]['fields'][node[1][0]]
+                self._count('mapping_hits')
             except KeyError:
+                self._count('mapping_misses')
                 self._logger.warning("Nombre de columna no encontrado en los ficheros de mapping: '{}'. Se deja el "
                                      "nombre original".format(node[1][0]))
                 new_column = node[1][0]
@@ -1135,15 +2088,15 @@ class Parser:
             original_table, _ = self._get_subtable(table_name, old_name, i)
             self._logger.debug("Registrando un '*' en {}, la tabla de referencia es: {}".format(self._creating_table,
                                                                                                 original_table))
-            [self.__mapping[self._creating_table]['fields'].setdefault(old, new) for old, new in
-             self.__mapping[original_table]['fields'].items()]
+            for old, new in list(self.__mapping[original_table]['fields'].items()):
+                add_field(self.__mapping, self._creating_table, old, new)
         else:
             self._logger.debug("Registro nuevo mapeo: '{}' por '{}'".format(old_name, new_name))
-            self.__mapping[self._creating_table]['fields'].setdefault(old_name, new_name)
+            add_field(self.__mapping, self._creating_table, old_name, new_name)
 
     def _process_names(self, node, child, i, register, rename_alias=None):
         """Procesa un nodo del AST. En caso de que este contenga un nombre de tabla o columna, lo renombra, en otro
-        caso, continua recorriendo en profundidad el nodo.
+        caso, indica a _rename_children que tiene que seguir recorriendo en profundidad el nodo.
 
         Parameters
         ----------
@@ -1153,6 +2106,12 @@ class Parser:
             Nodo a procesar.
         i: int
             Indice de la query que se esta procesando.
+
+        Returns
+        -------
+        (nltk.Tree, nltk.Tree)
+            Nodo que hay que recorrer y alias de la columna que hay que renombrar con el, o None. None si el nodo ya
+            se ha renombrado.
         """
         if self._is_referenced_column_node(node, child):
             # Columna con referencia a su tabla. El hijo de indice 1 es la tabla y el 3 la columna
@@ -1175,7 +2134,9 @@ class Parser:
             # Tabla
             try:
                 child[0] = self.__mapping[child[0]].get('new_name', child[0])
+                self._count('mapping_hits')
             except KeyError:
+                self._count('mapping_misses')
                 self._logger.warning('No se ha encontrado la tabla {} en los ficheros de mapping, por lo tanto, ninguna'
                                      ' referencia a esta tabla sera renombrada'.format(child[0]))
                 self.__mapping.setdefault(child[0], self.new_mapped_table(child[0]))
@@ -1183,13 +2144,16 @@ class Parser:
         elif node.label() == 'COLUMN_EXPRESSION' and len(child) and child[0] != 'AS' and len(node[-1]) \
                 and register and self._creating_table:
             self._logger.debug('Mando alias a renombrar: {}'.format(node[-1]))
-            self._rename_children(child, i, register, node[-1])
+            return child, node[-1]
         else:
-            self._rename_children(child, i, register)
+            return child, None
+
+        return None
 
     def _rename_children(self, node, i, register_column, alias=None):
         """Renombra las tablas y las columnas de acuerdo a los ficheros de mapping. Los cambios tienen lugar en el
-        propio arbol recibido por parametro, ya que es un objeto mutable.
+        propio arbol recibido por parametro, ya que es un objeto mutable. El arbol se recorre en profundidad con una
+        pila en lugar de recursividad (ver _process_names).
 
         Parameters
         ----------
@@ -1198,7 +2162,18 @@ class Parser:
         i: int
             Indice de la query que se esta procesando.
         """
-        [self._process_names(node, child, i, register_column, alias) for child in self.get_subtrees(node)]
+        stack = [(node, self.get_subtrees(node), alias)]
+        while stack:
+            node, children, alias = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+
+            next_node = self._process_names(node, child, i, register_column, alias)
+            if next_node is not None:
+                child, alias = next_node
+                stack.append((child, self.get_subtrees(child), alias))
 
     def rename_tree(self):
         """Procesa el AST y lleva a cabo el renombramiento conforme a los ficheros de mapping."""
@@ -1212,12 +2187,24 @@ class Parser:
                                'load_mapping_files() para cargarlos antes de proceder al renombramiento.')
             raise LookupError
 
+        timer = self._local.context.timer = self._timer('rename')
         self.__queries_elements = []
         self.__reverse_tree = []
         self.__queries = {}
-        self._process_tree(self.tree)
-        [self._rename_children(e[0], e[1], e[2]) for e in self._get_reverse_tree()]
-
+        try:
+            self._process_tree(self.tree)
+            timer.lap('process_tree')
+            for node, i, register_column in self._get_reverse_tree():
+                self._rename_children(node, i, register_column)
+            timer.lap('rename_children')
+        except Exception as err:
+            timer.emit(err)
+            raise
+        finally:
+            self._local.context.timer = NULL_TIMER
+
+        timer.count('queries', len(self.__queries))
+        timer.emit()
         return self
 
     def _remove_comment(self, line):
@@ -1230,121 +2217,117 @@ class Parser:
         else:
             return line
 
-    @staticmethod
-    def _find_numbers(line):
-        """"Devuelve la lista de los numeros contenidos en la linea."""
-        line = re.sub(r' +', ' ', line).strip()
-        all_numbers = [int(e.strip()) for e in re.findall(r'^[0-9]+ | [0-9]+ | [0-9]+$', line)]
-        return (' ' + str(e) + ' ' for e in all_numbers)
-
-    def _find_between(self, string, start, end):
-        substrings = []
-        start_index = string.find(start)
-        if start_index > -1:
-            start_offset = start_index + len(start)
-            end_index = string[start_offset:].find(end)
-            if end_index > -1:
-                end_index += start_offset
-                substrings.append(start + string[start_offset:end_index] + end)
-                end_offset = end_index + len(end)
-                return substrings + self._find_between(string[end_offset:], start, end)
-
-        return []
-
     def _clean_line(self, line):
         """Limpia una linea. Busca referencias a variables hive, literales y constantes; las remplaza por #WORD# y se
-        almacena todo para posteriormente reconstruir la query con la forma original."""
+        almacena todo para posteriormente reconstruir la query con la forma original.
+
+        Las variables, literales y constantes se buscan en una sola pasada con un patron precompilado, y se guardan en
+        el orden en el que aparecen en la linea, que es el mismo orden en el que aparecen los #WORD# en el arbol.
+
+        Parameters
+        ----------
+        line: str
+            Linea.
+
+        Returns
+        -------
+        str
+            Linea limpia, en mayusculas.
+        """
         if not line:
             return line
 
-        if self.udfs:
-            for point, scape in zip(self.udfs, self._udfs_norm):
-                pattern = re.compile(point, re.IGNORECASE)
-                line = pattern.sub(scape, line)
+        for pattern, scape in self._udf_patterns:
+            line = pattern.sub(scape, line)
 
         if self.hive_var:
             for var in self.hive_var.keys():
                 line = line.replace(var, self.hive_var[var])
 
-        line = (line
-                .replace(',', ' , ')
-                .replace(';', ' ; ')
-                .replace('(', ' ( ')
-                .replace(')', ' ) ')
-                .replace('=', ' = ')
-                )
-        variables = self._find_between(line, start="${", end="}")
-        variables += self._find_between(line, start="'", end="'")
-        variables += self._find_numbers(line)
-
-        if variables:
-            line = str(' ' + str(line) + ' ')
-            return self._tokenize_vars(line, variables).upper()
-        else:
-            return line.upper()
+        line = _PUNCTUATION_PATTERN.sub(r' \1 ', line)
+        n_words = len(self.__words)
+        masked = _LITERAL_PATTERN.sub(self.__mask_literal, ' ' + line + ' ')
+        return (masked if len(self.__words) > n_words else line).upper()
 
-    def __replace_var(self, variable, replacements):
-        """Remplaza la variables por la que corresponda, segun el diccionario 'replacements'.
+    def __mask_literal(self, match):
+        """Almacena una variable, literal o constante y la sustituye por #WORD#. Se almacena con los signos de
+        puntuacion como estaban en la query original, sin los espacios que se agregan para parsear.
 
         Parameters
         ----------
-        variable: _sre.SRE_Match
-            Match de las variables a sustituir.
-        replacements: dict
-            Diccionario con los remplazamientos a realizar.
+        match: _sre.SRE_Match
+            Match de la variable a sustituir.
 
         Returns
         -------
         str
-            Variable sustituida.
+            Token que sustituye a la variable.
         """
-        self.__words.append(variable.group(0))
-        return replacements[re.escape(variable.group(0))]
-
-    def _tokenize_vars(self, line, variables, token=' #WORD# '):
-        """Tokeniza las variables en una linea sustituyendolos por el especificado por parametro.
+        self.__words.append(_SPACED_PUNCTUATION_PATTERN.sub(r'\1', match.group(0)))
+        return ' ' + LITERAL_TERMINAL + ' '
+
+    def _untokenize(self, leaves, token=LITERAL_TERMINAL):
+        """Vuelve a poner las variables en las hojas del arbol, sustituyendo a su token correspondiente. Las variables
+        se guardan en _clean_line en el mismo orden en el que aparecen los tokens, asi que la i-esima aparicion del
+        token corresponde a la i-esima variable. Las variables utilizadas se eliminan de la lista.
+
+        Restaurar por orden es seguro porque el procesamiento del arbol nunca cambia el orden de las hojas: el lexer y
+        el parser generan una hoja por token en el orden de la linea (igual que supone _restore_identifiers), los
+        renombrados solo cambian el texto de las hojas de identificadores y la unica transformacion que quita hojas,
+        __merge_schema, junta el esquema y la tabla, que son hojas contiguas, en una sola hoja y en el mismo orden
+        ('#WORD#.T1'). Por eso una hoja puede contener mas de un token, y cada aparicion se sustituye por la siguiente
+        variable. El indice de cada variable no se puede guardar en su token porque los nombres de tabla con el
+        esquema enmascarado son claves de los mapeos y del linaje.
+
+        Una hoja solo pierde su token si se renombra una tabla con el esquema enmascarado con un mapeo cuyo nombre
+        nuevo no lo lleva. En ese caso las variables siguientes se descolocarian, asi que si al terminar no coinciden
+        los tokens y las variables se registra un warning.
 
         Parameters
         ----------
-        line: str
-            Linea.
-        variables: list(str)
-            Lista de variables.
+        leaves: list(str)
+            Hojas del arbol.
         token: str
-            Token que va a sustituir a las variables especificadas.
+            Token que sustituye a las variables.
 
         Returns
         -------
-        str
-            Linea con las variables tokenizadas.
+        list(str)
+            Hojas con las variables originales.
         """
-        replacements = {re.escape(k): token for k in iter(variables)}
-        pattern = re.compile("|".join(replacements.keys()))
-        return pattern.sub(lambda m: self.__replace_var(m, replacements), line)
-
-    def _untokenize(self, line, token='#WORD#'):
-        """Vuelve a poner las variables de una linea, sustituyendo a su token correspondiente."""
-        if not self.__words:
-            return line
-
-        if token not in line:
-            return line
-
-        i_start = line.find(token)
-        i_end = i_start + len(token)
-
-        new_word = self.__words[0]
-        self.__words = self.__words[1:]
-
-        return self._untokenize(line[:i_start] + new_word + line[i_end:], token)
+        words = iter(self.__words)
+        restored = []
+        tokens = 0
+        for leaf in leaves:
+            if leaf == token:
+                tokens += 1
+                leaf = next(words, leaf)
+            elif token in leaf:
+                parts = leaf.split(token)
+                tokens += len(parts) - 1
+                leaf = parts[0] + ''.join(next(words, token) + part for part in parts[1:])
+            restored.append(leaf)
+        if tokens != len(self.__words):
+            self._logger.warning('El arbol tiene {} tokens {} pero se han guardado {} variables, puede que alguna '
+                                 'variable no se haya restaurado en su lugar: {}'.format(tokens, token,
+                                                                                         len(self.__words),
+                                                                                         self.__words))
+        self.__words = list(words)
+        return restored
 
     def rebuild_query(self, comments=True, pretty=True):
         """Reconstruye la query representada por el arbol procesado. Se vuelven a poner las variables anteriormente
         tokenizadas, se eliminan espacios utilizados para parsear y se vuelven a poner los comentarios eliminados al
         principio de la query.
 
+        El formato se aplica con el formateador indicado en la clave 'pretty_printer' de la configuracion: 'tree' (por
+        defecto) formatea directamente a partir del arbol (ver rosqltta.formatter), y 'sqlparse' vuelve a analizar la
+        query con sqlparse.format.
+
         Parameters
         ----------
+        comments: boolean
+            Poner los comentarios eliminados al principio de la query. Solo se aplica si se formatea la query.
         pretty: boolean
             Formatear la query a una forma humanamente amigable.
 
@@ -1363,27 +2346,32 @@ class Parser:
                                'procesar el arbol.')
             raise LookupError
 
-        query = ' '.join(self.tree.leaves())
-        query = (self._untokenize(query)
-                 .replace(' , ', ', ')
-                 .replace(' ; ', ';')
-                 .replace(' ( ', ' (')
-                 .replace(' ) ', ') ')
-                 #.replace(' = ', '=')
-                 .replace(' . ', '.')
-                 )
-
-        if self.udfs:
-            for point, scape in zip(self.udfs, self._udfs_norm):
-                pattern = re.compile(scape, re.IGNORECASE)
-                query = pattern.sub(point, query)
-
-        if pretty:
-            if comments:
-                final = '\n'.join(self.__comments) + '\n' + sqlparse.format(query, reindent=True, keyword_case='upper')
-                self.__comments = []
-                return final
-            else:
-                return sqlparse.format(query, reindent=True, keyword_case='upper')
+        timer = self._timer('format')
+        leaves = self._untokenize(tree_leaves(self.tree))
+        timer.lap('untokenize')
+        if pretty and self._pretty_printer == 'tree':
+            query = format_tree(self.tree, leaves)
         else:
-            return query
+            query = (' '.join(leaves)
+                     .replace(' , ', ', ')
+                     .replace(' ; ', ';')
+                     .replace(' ( ', ' (')
+                     .replace(' ) ', ') ')
+                     #.replace(' = ', '=')
+                     .replace(' . ', '.')
+                     )
+
+        for pattern, point in self._udf_restore_patterns:
+            query = pattern.sub(point, query)
+        timer.lap('layout')
+
+        if pretty and self._pretty_printer == 'sqlparse':
+            query = sqlparse.format(query, reindent=True, keyword_case='upper')
+            timer.lap('sqlparse')
+
+        if pretty and comments:
+            query = '\n'.join(self.__comments) + '\n' + query
+            self.__comments = []
+
+        timer.emit()
+        return query
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+
+
+class DependencyGraph(object):
+    """Grafo de dependencias entre las sentencias de un conjunto de ficheros. Cada sentencia puede crear o insertar en
+    una tabla (destino) y leer de otras (origenes). Una sentencia depende de:
+        1. La ultima sentencia anterior que escribe en cada una de las tablas que lee. Si no hay ninguna anterior y la
+           tabla no existia previamente, de la primera posterior, que normalmente esta en otro fichero.
+        2. La ultima sentencia anterior que escribe en su misma tabla destino.
+        3. Las sentencias anteriores que leen su tabla destino desde esa ultima escritura, salvo que dependan de ella.
+           Las que la leen antes ya dependen de la ultima escritura, asi que no hace falta repetirlas.
+
+    Las dependencias se calculan al agregar cada sentencia, guardando por tabla la ultima sentencia que la escribe y
+    las que la leen desde entonces, de forma que cada dependencia cuesta O(1) aunque muchas sentencias lean la misma
+    tabla. Las sentencias se identifican por el orden en el que se agregan, que es el orden original de los ficheros.
+
+    Parameters
+    ----------
+    existing: iterable(str)
+        Tablas que ya existen antes de procesar las sentencias, por ejemplo las que tienen fichero de mapping.
+    """
+
+    def __init__(self, existing=()):
+        self._existing = frozenset(existing)
+        self._dependencies = []
+        self._last_writer = {}
+        self._readers = {}
+
+    def __len__(self):
+        return len(self._dependencies)
+
+    def add(self, target, sources):
+        """Agrega una sentencia al grafo.
+
+        Parameters
+        ----------
+        target: str
+            Tabla que crea o en la que inserta la sentencia, o None.
+        sources: iterable(str)
+            Tablas que lee la sentencia.
+
+        Returns
+        -------
+        int
+            Identificador de la sentencia.
+        """
+        node = len(self._dependencies)
+        dependencies = set()
+        for table in frozenset(sources) - {target}:
+            writer = self._last_writer.get(table)
+            if writer is not None:
+                dependencies.add(writer)
+            self._readers.setdefault(table, []).append(node)
+
+        if target is not None:
+            previous = self._last_writer.get(target)
+            if previous is not None or target in self._existing:
+                if previous is not None:
+                    dependencies.add(previous)
+                dependencies.update(self._readers.pop(target, ()))
+            else:
+                # Primera escritura de una tabla nueva: los lectores anteriores dependen de ella, y la siguiente
+                # escritura tendra que esperar a que se lean
+                for reader in self._readers.get(target, ()):
+                    self._dependencies[reader].add(node)
+            self._last_writer[target] = node
+
+        self._dependencies.append(dependencies)
+        return node
+
+    def dependencies(self, node):
+        """Devuelve las sentencias de las que depende una sentencia.
+
+        Parameters
+        ----------
+        node: int
+            Identificador de la sentencia.
+
+        Returns
+        -------
+        set(int)
+            Identificadores de las sentencias de las que depende.
+        """
+        return set(self._dependencies[node])
+
+    def _resolve(self):
+        """Devuelve las dependencias de cada sentencia y calcula sus dependientes."""
+        dependencies = self._dependencies
+        dependents = [[] for _ in range(len(self))]
+        for node, nodes in enumerate(dependencies):
+            for dependency in nodes:
+                dependents[dependency].append(node)
+
+        return dependencies, dependents
+
+    def order(self):
+        """Devuelve las sentencias en orden topologico. Entre las sentencias disponibles se elige siempre la primera en
+        el orden original, de forma que si el orden original respeta las dependencias, no se cambia. Si hay un ciclo,
+        se rompe por la primera sentencia pendiente.
+
+        Returns
+        -------
+        list(int)
+            Identificadores de las sentencias.
+        """
+        dependencies, dependents = self._resolve()
+        pending = [len(nodes) for nodes in dependencies]
+        ready = [node for node, count in enumerate(pending) if not count]
+        heapq.heapify(ready)
+        done = [False] * len(self)
+        order = []
+        while len(order) < len(self):
+            if not ready:
+                heapq.heappush(ready, done.index(False))
+
+            node = heapq.heappop(ready)
+            if done[node]:
+                continue
+
+            done[node] = True
+            order.append(node)
+            for dependent in dependents[node]:
+                pending[dependent] -= 1
+                if not pending[dependent] and not done[dependent]:
+                    heapq.heappush(ready, dependent)
+
+        return order
+
+    def levels(self):
+        """Agrupa las sentencias en niveles. Las sentencias de un nivel solo dependen de sentencias de niveles
+        anteriores, por lo que se pueden procesar a la vez. Si hay un ciclo, se rompe por la primera sentencia
+        pendiente.
+
+        Returns
+        -------
+        list(list(int))
+            Identificadores de las sentencias de cada nivel, en el orden original.
+        """
+        dependencies, dependents = self._resolve()
+        pending = [len(nodes) for nodes in dependencies]
+        level = [node for node, count in enumerate(pending) if not count]
+        done = [False] * len(self)
+        levels = []
+        remaining = len(self)
+        while remaining:
+            if not level:
+                level = [done.index(False)]
+
+            levels.append(sorted(level))
+            remaining -= len(level)
+            for node in level:
+                done[node] = True
+
+            following = []
+            for node in level:
+                for dependent in dependents[node]:
+                    pending[dependent] -= 1
+                    if not pending[dependent] and not done[dependent]:
+                        following.append(dependent)
+            level = following
+
+        return levels
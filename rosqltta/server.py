@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Servicio de traduccion que mantiene un parser cargado (gramatica, lexer y mapeos) entre peticiones.
+
+Uso, desde el directorio rosqltta (las rutas de la configuracion son relativas a el):
+
+    python -m rosqltta.server --conf ../conf/config.conf --port 8765
+    python -m rosqltta.server --conf ../conf/config.conf --socket /tmp/rosqltta.sock
+
+Peticiones (json sobre HTTP):
+
+    POST /translate  {"statements": ["CREATE TABLE ...", "SELECT ..."], "flush": true}
+    POST /flush
+    GET  /status
+"""
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rosqltta.parser import Parser
+
+
+class ServiceBusyError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class TranslationService(object):
+    """Traduce lotes de sentencias con un parser compartido. Las sentencias de un lote se renombran en orden, de forma
+    que una sentencia ve los mapeos de las tablas que crean las anteriores; los lotes se procesan a la vez, hasta
+    max_concurrent, y el resto espera como mucho timeout segundos.
+
+    Parameters
+    ----------
+    parser: rosqltta.parser.Parser
+        Parser ya cargado.
+    max_concurrent: int
+        Lotes que se procesan a la vez.
+    timeout: float
+        Segundos que espera un lote a que haya sitio antes de rechazarlo.
+    """
+
+    def __init__(self, parser, max_concurrent=4, timeout=30):
+        self.parser = parser
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._statements = 0
+        self._errors = 0
+        self._started = time.time()
+
+    def translate(self, statements, flush=False):
+        """Renombra un lote de sentencias con Parser.translate. Un error en una sentencia no detiene el resto del lote.
+
+        Parameters
+        ----------
+        statements: list(str)
+            Sentencias.
+        flush: bool
+            Si es True, persiste los mapeos modificados al terminar el lote.
+
+        Returns
+        -------
+        dict
+            Resultado de cada sentencia (query, target, sources, mapping, error y ms), mapeos agregados por el lote,
+            tablas persistidas, milisegundos de espera y milisegundos totales.
+        """
+        if isinstance(statements, str) or not all(isinstance(statement, str) for statement in statements):
+            raise TypeError("'statements' tiene que ser una lista de sentencias")
+
+        start = time.perf_counter()
+        self._acquire()
+        waited = time.perf_counter() - start
+        try:
+            results, mappings = [], {}
+            for statement in statements:
+                results.append(self._translate_one(statement))
+                mappings.update(results[-1]['mapping'])
+            flushed = self.parser.flush_mappings() if flush else []
+        finally:
+            self._release()
+
+        return {'results': results, 'mappings': mappings, 'flushed': flushed, 'wait_ms': self._ms(waited),
+                'ms': self._ms(time.perf_counter() - start)}
+
+    def _translate_one(self, statement):
+        start = time.perf_counter()
+        try:
+            result = self.parser.translate(statement)
+            output = {'query': result.query, 'target': result.target, 'sources': sorted(result.sources),
+                      'mapping': result.mapping, 'error': None}
+        except Exception as e:
+            self.parser._logger.warning('Error al traducir la sentencia: {!r}'.format(e))
+            output = {'query': None, 'target': None, 'sources': [], 'mapping': {},
+                      'error': '{}: {}'.format(type(e).__name__, getattr(e, 'msg', e))}
+
+        with self._lock:
+            self._statements += 1
+            self._errors += output['error'] is not None
+        output['ms'] = self._ms(time.perf_counter() - start)
+        return output
+
+    def flush(self):
+        """Persiste los mapeos modificados, ver Parser.flush_mappings."""
+        return {'flushed': self.parser.flush_mappings()}
+
+    def status(self):
+        """Devuelve el estado del servicio: lotes en curso, sentencias traducidas y errores."""
+        with self._lock:
+            return {'active': self._active, 'max_concurrent': self.max_concurrent, 'statements': self._statements,
+                    'errors': self._errors, 'uptime_s': round(time.time() - self._started, 1)}
+
+    def _acquire(self):
+        if self._slots is not None and not self._slots.acquire(timeout=self.timeout):
+            raise ServiceBusyError('Hay {} lotes en curso'.format(self.max_concurrent))
+        with self._lock:
+            self._active += 1
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    @staticmethod
+    def _ms(seconds):
+        return round(seconds * 1000, 3)
+
+
+class TranslationHandler(BaseHTTPRequestHandler):
+    """Atiende las peticiones HTTP del servicio. El servidor tiene que tener el atributo service."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._reply(HTTPStatus.OK, self.server.service.status())
+        else:
+            self._reply(HTTPStatus.NOT_FOUND, {'error': 'No existe la ruta {}'.format(self.path)})
+
+    def do_POST(self):
+        try:
+            body = self._read_body()
+            if self.path == '/translate':
+                self._reply(HTTPStatus.OK, self.server.service.translate(body.get('statements', []),
+                                                                        bool(body.get('flush', False))))
+            elif self.path == '/flush':
+                self._reply(HTTPStatus.OK, self.server.service.flush())
+            else:
+                self._reply(HTTPStatus.NOT_FOUND, {'error': 'No existe la ruta {}'.format(self.path)})
+        except ServiceBusyError as e:
+            self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {'error': e.msg})
+        except (ValueError, TypeError, AttributeError) as e:
+            self._reply(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(body, dict):
+            raise ValueError('El cuerpo de la peticion tiene que ser un objeto json')
+        return body
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # En un socket unix no hay direccion del cliente
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        self.server.service.parser._logger.debug('%s %s', self.address_string(), format % args)
+
+
+class UnixTranslationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8765, socket_path=None):
+    """Crea el servidor HTTP del servicio, en un puerto TCP o, si se indica socket_path, en un socket unix.
+
+    Parameters
+    ----------
+    service: TranslationService
+        Servicio.
+    host: str
+        Direccion en la que escucha.
+    port: int
+        Puerto en el que escucha. Con 0 se elige uno libre.
+    socket_path: str
+        Ruta del socket unix. Si ya existe, se reemplaza.
+
+    Returns
+    -------
+    socketserver.BaseServer
+        Servidor, sin arrancar. Ver serve_forever.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixTranslationServer(socket_path, TranslationHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), TranslationHandler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument('--conf', default='../conf/config.conf', help='Fichero de configuracion del parser.')
+    args.add_argument('--host', default='127.0.0.1', help='Direccion en la que escucha.')
+    args.add_argument('--port', type=int, default=8765, help='Puerto en el que escucha.')
+    args.add_argument('--socket', help='Escucha en este socket unix en lugar de en un puerto.')
+    args.add_argument('--max-concurrent', type=int, default=4, help='Lotes que se procesan a la vez.')
+    args.add_argument('--timeout', type=float, default=30, help='Segundos que espera un lote antes de rechazarlo.')
+    args.add_argument('--backend', choices=Parser.BACKENDS, help='Backend del parser.')
+    args.add_argument('--cache-dir', help='Directorio de la cache de arboles.')
+    args.add_argument('--udf', nargs='*', default=[], help='Funciones definidas por el usuario.')
+    args.add_argument('--hivevar', nargs='*', default=[], help='Variables hive, como nombre=valor.')
+    args = args.parse_args(argv)
+
+    hive_var = dict(var.split('=', 1) for var in args.hivevar)
+    parser = Parser(args.conf, udfs=args.udf or None, hive_var=hive_var, backend=args.backend,
+                    cache_dir=args.cache_dir)
+    server = make_server(TranslationService(parser, args.max_concurrent, args.timeout), args.host, args.port,
+                         args.socket)
+    logging.getLogger('rosqltta').info('Escuchando en {}'.format(args.socket or '{}:{}'.format(*server.server_address)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        parser.flush_mappings()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+
+# Fuera de un literal: separador de sentencias, inicio de literal o de comentario
+_NORMAL = re.compile(r"[;'\"`]|--")
+# Dentro de un literal: caracter escapado o cierre del literal
+_QUOTED = {quote: re.compile(r'\\.|' + re.escape(quote)) for quote in '\'"`'}
+
+
+class Statement(namedtuple('Statement', ['text', 'line', 'comments'])):
+    """Sentencia de un fichero de queries.
+
+    Attributes
+    ----------
+    text: str
+        Texto de la sentencia, sin el punto y coma ni los comentarios. Los saltos de linea y tabuladores se sustituyen
+        por espacios.
+    line: int
+        Linea del fichero en la que empieza la sentencia, contando desde 1.
+    comments: list(str)
+        Comentarios eliminados de la sentencia.
+    """
+    __slots__ = ()
+
+
+def split_statements(lines):
+    """Divide un fichero de queries en sentencias, leyendo linea a linea. Solo se separa por los puntos y coma y se
+    eliminan los comentarios que estan fuera de los literales. Cada sentencia se devuelve en cuanto se termina de
+    leer, de forma que el fichero nunca esta entero en memoria.
+
+    El texto de las sentencias es el mismo que si se juntaran todas las lineas con un espacio y se separara por los
+    puntos y coma: cada salto de linea se sustituye por dos espacios, uno si la linea termina en un comentario, y
+    despues de la ultima sentencia se devuelve el resto del fichero, aunque este vacio.
+
+    Parameters
+    ----------
+    lines: iterable(str)
+        Lineas del fichero, por ejemplo el propio fichero abierto.
+
+    Returns
+    -------
+    generator(Statement)
+        Sentencias del fichero en orden.
+    """
+    parts = []
+    comments = []
+    start = None
+    quote = None
+    number = 0
+    for number, line in enumerate(lines, 1):
+        if number > 1:
+            parts.append(' ')
+        line = line.replace('\n', ' ').replace('\t', ' ')
+        pos = 0
+        while pos < len(line):
+            match = (_QUOTED[quote] if quote else _NORMAL).search(line, pos)
+            end = match.start() if match else len(line)
+            if start is None and line[pos:end].strip():
+                start = number
+            if not match:
+                parts.append(line[pos:])
+                break
+
+            token = match.group(0)
+            if quote:
+                parts.append(line[pos:match.end()])
+                if token == quote:
+                    quote = None
+            elif token == ';':
+                parts.append(line[pos:end])
+                yield Statement(''.join(parts), start or number, comments)
+                parts, comments, start = [], [], None
+            elif token == '--':
+                parts.append(line[pos:end])
+                comments.append(line[end:].strip())
+                break
+            else:
+                if start is None:
+                    start = number
+                parts.append(line[pos:match.end()])
+                quote = token
+
+            pos = match.end()
+
+    yield Statement(''.join(parts), start or number, comments)
@@ -0,0 +1,92 @@
+import nltk
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from rosqltta.cache import ParseCache, fingerprint
+from rosqltta.tree import CompactNode
+
+
+class TestParseCache(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = ParseCache(self.path, fingerprint('grammar'), max_entries=10)
+        self.tree = nltk.Tree('S', [nltk.Tree('TABLE_NAMES', ['T1'])])
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.path)
+
+    def test_get_put(self):
+        self.assertEqual(self.cache.get('SELECT A FROM T1'), (False, None))
+        self.cache.put('SELECT A FROM T1', self.tree)
+        self.cache.put('SELECT', None)
+
+        found, tree = self.cache.get('SELECT A FROM T1')
+        self.assertTrue(found)
+        self.assertEqual(tree, self.tree)
+        self.assertIsNot(tree, self.tree)
+        self.assertEqual(self.cache.get('SELECT'), (True, None))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_key(self):
+        self.cache.put('SELECT A FROM T1', self.tree)
+        other = ParseCache(self.path, fingerprint('grammar'), key='udf', max_entries=10)
+        self.assertEqual(other.get('SELECT A FROM T1'), (False, None))
+        other.close()
+
+    def test_invalidation(self):
+        self.cache.put('SELECT A FROM T1', self.tree)
+        self.cache.close()
+        self.assertEqual(len(ParseCache(self.path, fingerprint('grammar'))), 1)
+        self.assertEqual(len(ParseCache(self.path, fingerprint('grammar changed'))), 0)
+
+    def test_encoding_invalidation(self):
+        self.cache.put('SELECT A FROM T1', self.tree)
+        self.cache.close()
+        # Simula una cache guardada con otra version de la codificacion de los arboles
+        connection = sqlite3.connect(os.path.join(self.path, ParseCache.FILE_NAME))
+        with connection:
+            connection.execute("UPDATE meta SET value = '0' WHERE name = 'encoding'")
+        connection.close()
+        self.assertEqual(len(ParseCache(self.path, fingerprint('grammar'))), 0)
+
+    def test_tree_format(self):
+        self.cache.put('SELECT A FROM T1', self.tree)
+        cache = ParseCache(self.path, fingerprint('grammar'), max_entries=10, tree_format='compact')
+        found, tree = cache.get('SELECT A FROM T1')
+        self.assertIsInstance(tree, CompactNode)
+        self.assertEqual(tree.to_nltk(), self.tree)
+        cache.close()
+
+    def test_eviction(self):
+        for i in range(10):
+            self.cache.put(str(i), self.tree)
+        # El primero se usa despues de guardar el resto, el que lleva mas tiempo sin usarse es el segundo
+        self.cache.get('0')
+        self.cache.put('10', self.tree)
+
+        self.assertEqual(len(self.cache), 9)
+        self.assertTrue(self.cache.get('0')[0])
+        self.assertFalse(self.cache.get('1')[0])
+
+    def test_pickle(self):
+        self.cache.put('SELECT A FROM T1', self.tree)
+        cache = pickle.loads(pickle.dumps(self.cache))
+        self.assertEqual(cache.get('SELECT A FROM T1'), (True, self.tree))
+        cache.close()
+
+    def test_threads(self):
+        def put_get(line):
+            self.cache.put(line, self.tree)
+            found = self.cache.get(line)
+            self.cache.close()
+            return found
+
+        self.cache.put('SELECT A FROM T1', self.tree)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(put_get, ['1', '2', '3', '4'])), [(True, self.tree)] * 4)
+        self.assertEqual(len(self.cache), 5)
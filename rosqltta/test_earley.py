@@ -0,0 +1,39 @@
+import nltk
+from unittest import TestCase
+from rosqltta.parser import Parser
+from rosqltta.earley import EarleyParser
+
+
+class TestEarleyParser(TestCase):
+    def setUp(self):
+        self.hv = Parser('../conf/config.conf')
+        self.earley = EarleyParser(self.hv.get_grammar())
+
+    def _assert_same_tree(self, query):
+        sent = [token.terminal for token in self.hv._lexer.tokenize(self.hv._clean_line(query))]
+        grammar = self.hv.get_grammar()
+        expected = next(nltk.ChartParser(grammar).parse(sent))
+        tree = next(self.earley.parse(sent))
+        self.assertEqual(tree, expected)
+
+    def test_parse(self):
+        self._assert_same_tree('SELECT a FROM ${hivevar:tabla} WHERE (a = 1 AND b=2) OR c = 4')
+        self._assert_same_tree('SELECT t1.a FROM (SELECT a FROM t2) AS t1')
+        self._assert_same_tree("INSERT OVERWRITE TABLE t1 PARTITION(a = '12/02/2019', b) SELECT a, 1 AS b FROM t2")
+        self._assert_same_tree('SELECT CASE WHEN a = 1 THEN b WHEN a = 2 THEN c ELSE d END AS x FROM t1')
+        self._assert_same_tree('SELECT a, b FROM t1 JOIN t2 ON t1.a = t2.a UNION ALL SELECT a, b FROM t3')
+
+    def test_parse_out_of_grammar(self):
+        self.assertIsNone(next(self.earley.parse(['SELECT', 'FROM']), None))
+        self.assertIsNone(next(self.earley.parse([]), None))
+
+    def test_parse_chart(self):
+        sent = [token.terminal for token in self.hv._lexer.tokenize(self.hv._clean_line('SELECT a FROM t1'))]
+        trees, chart = self.earley.parse_chart(sent)
+        self.assertEqual(next(trees), next(self.earley.parse(sent)))
+        self.assertEqual(len(chart), len(sent) + 1)
+        self.assertEqual(list(self.earley.parse_chart(['SELECT', 'FROM'])[0]), [])
+
+    def test_null_tree(self):
+        tree = self.earley._null_tree(nltk.grammar.Nonterminal('SELECT_COMPLEMENT'))
+        self.assertEqual(tree, nltk.Tree('SELECT_COMPLEMENT', []))
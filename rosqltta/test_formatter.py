@@ -0,0 +1,59 @@
+import nltk
+from unittest import TestCase
+from rosqltta.parser import Parser
+from rosqltta.formatter import format_tree, _is_empty
+
+
+class TestTreeFormatter(TestCase):
+    def setUp(self):
+        self.hv = Parser('../conf/config.conf')
+
+    def _format(self, query):
+        self.hv.parse_query(query)
+        return format_tree(self.hv.tree, self.hv._untokenize(self.hv.tree.leaves()))
+
+    def test_is_empty(self):
+        self.assertTrue(_is_empty(nltk.Tree('WHERE_EXPRESSION', [])))
+        self.assertTrue(_is_empty(nltk.Tree('ORDERING_EXPRESSION', [nltk.Tree('SORT_EXPRESSION', [])])))
+        self.assertFalse(_is_empty(nltk.Tree('COMMA', [','])))
+
+    def test_format_clauses(self):
+        query = ('SELECT a, b FROM t1 JOIN t2 ON t1.a = t2.a WHERE a = 1 AND (b = 2 OR c = 3) GROUP BY a '
+                 'HAVING COUNT(b) > 1 ORDER BY a DESC UNION ALL SELECT a, b FROM t3')
+        self.assertEqual(self._format(query), 'SELECT A,\n'
+                                              '       B\n'
+                                              'FROM T1\n'
+                                              'JOIN T2 ON T1.A = T2.A\n'
+                                              'WHERE A = 1\n'
+                                              '  AND (B = 2 OR C = 3)\n'
+                                              'GROUP BY A\n'
+                                              'HAVING COUNT (B) > 1\n'
+                                              'ORDER BY A DESC\n'
+                                              'UNION ALL\n'
+                                              'SELECT A,\n'
+                                              '       B\n'
+                                              'FROM T3')
+
+    def test_format_subquery(self):
+        query = "SELECT t1.a FROM t3, (SELECT a, ${hivevar:b} FROM t2 WHERE a = 'a,b') AS t1"
+        self.assertEqual(self._format(query), 'SELECT T1.A\n'
+                                              'FROM T3,\n'
+                                              '     (SELECT A,\n'
+                                              '             ${hivevar:b}\n'
+                                              '      FROM T2\n'
+                                              "      WHERE A = 'a,b') AS T1")
+
+    def test_format_insert(self):
+        self.assertEqual(self._format("INSERT INTO TABLE t1 VALUES (1, 'x'), (2, 'y')"),
+                         "INSERT INTO TABLE T1\n"
+                         "VALUES (1, 'x'),\n"
+                         "       (2, 'y')")
+        self.assertEqual(self._format("INSERT OVERWRITE TABLE t1 PARTITION(a = '12/02/2019', b) SELECT a FROM t2"),
+                         "INSERT OVERWRITE TABLE T1 PARTITION (A = '12/02/2019', B)\n"
+                         "SELECT A\n"
+                         "FROM T2")
+
+    def test_format_inline(self):
+        query = 'SELECT COUNT(DISTINCT a) OVER (PARTITION BY b ORDER BY c) AS d FROM t1'
+        self.assertEqual(self._format(query), 'SELECT COUNT (DISTINCT A) OVER (PARTITION BY B ORDER BY C) AS D\n'
+                                              'FROM T1')
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from rosqltta.incremental import IncrementalState
+
+
+class TestIncrementalState(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.path, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_save(self):
+        state = IncrementalState(self.state_file, 'config')
+        self.assertIsNone(state.get('file', 'SELECT a FROM t1'))
+        state.set('file', 'SELECT a FROM t1', {'lineage': None})
+        state.save()
+
+        state = IncrementalState(self.state_file, 'config')
+        self.assertEqual(state.get('file', 'SELECT a FROM t1'), {'lineage': None})
+        self.assertIsNone(state.get('other_file', 'SELECT a FROM t1'))
+
+        # Los registros que no se vuelven a guardar se descartan
+        state.save()
+        self.assertIsNone(IncrementalState(self.state_file, 'config').get('file', 'SELECT a FROM t1'))
+
+    def test_config(self):
+        state = IncrementalState(self.state_file, 'config')
+        state.set('file', 'SELECT a FROM t1', {'lineage': None})
+        state.save()
+        self.assertIsNone(IncrementalState(self.state_file, 'other config').get('file', 'SELECT a FROM t1'))
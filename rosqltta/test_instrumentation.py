@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import nltk
+from unittest import TestCase
+from rosqltta.parser import Parser, UnreferencedTableError
+from rosqltta.instrumentation import (StageTimer, CallbackSink, JsonLinesSink, RecordBuffer, Aggregator, NULL_TIMER,
+                                      count_nodes)
+
+
+class TestInstrumentation(TestCase):
+    def test_stage_timer(self):
+        records = []
+        timer = StageTimer(CallbackSink(records.append), 'parse')
+        timer.lap('tokenize')
+        timer.count('tokens', 3)
+        timer.count('tokens')
+        timer.emit(ValueError)
+        self.assertEqual(records[0]['stage'], 'parse')
+        self.assertEqual(list(records[0]['seconds']), ['tokenize'])
+        self.assertEqual((records[0]['tokens'], records[0]['error']), (4, 'ValueError'))
+        self.assertFalse(NULL_TIMER.enabled)
+
+    def test_json_lines_sink(self):
+        output = io.StringIO()
+        with JsonLinesSink(output) as sink:
+            sink.emit({'stage': 'parse', 'seconds': {}})
+            sink.emit({'stage': 'rename', 'seconds': {}})
+        self.assertEqual([json.loads(line)['stage'] for line in output.getvalue().splitlines()], ['parse', 'rename'])
+
+    def test_record_buffer(self):
+        buffer = RecordBuffer()
+        buffer.emit({'stage': 'parse'})
+        self.assertEqual(buffer.pop(), [{'stage': 'parse'}])
+        self.assertEqual(buffer.pop(), [])
+
+    def test_aggregator(self):
+        aggregator = Aggregator()
+        for i in range(1, 101):
+            aggregator.emit({'stage': 'parse', 'seconds': {'parse': i / 100.0}, 'tokens': i})
+        aggregator.emit({'stage': 'rename', 'seconds': {}, 'error': 'KeyError'})
+        summary = aggregator.summary()
+        self.assertEqual(summary['parse.parse']['count'], 100)
+        self.assertEqual((summary['parse.tokens']['p50'], summary['parse.tokens']['p90']), (50, 90))
+        self.assertEqual((summary['parse.tokens']['p99'], summary['parse.tokens']['max']), (99, 100))
+        self.assertAlmostEqual(summary['parse.tokens']['mean'], 50.5)
+        self.assertEqual(summary['rename.errors']['total'], 1)
+        self.assertEqual(aggregator.values('parse.tokens')[:2], [1, 2])
+
+    def test_count_nodes(self):
+        tree = nltk.Tree('A', [nltk.Tree('B', ['x']), nltk.Tree('C', [nltk.Tree('D', []), 'y'])])
+        self.assertEqual(count_nodes(tree), 4)
+
+
+class TestParserInstrumentation(TestCase):
+    def test_translate(self):
+        for backend in Parser.BACKENDS:
+            aggregator = Aggregator()
+            hv = Parser('../conf/config.conf', backend=backend, instrumentation=aggregator)
+            hv.translate('SELECT t.a, b FROM t1 t, (SELECT a, c FROM t2) s WHERE t.a = s.a')
+            self.assertRaises(UnreferencedTableError, hv.translate, 'SELECT a FROM t1, t2')
+            summary = aggregator.summary()
+            self.assertEqual(summary['grammar.read_grammar']['count'], 1)
+            self.assertEqual(summary['parse.tokens']['count'], 2)
+            self.assertTrue(summary['parse.edges']['max'] > 0)
+            self.assertEqual(summary['parse.nodes']['count'], 2)
+            self.assertEqual(summary['rename.errors']['count'], 1)
+            self.assertEqual(summary['rename.queries']['total'], 4)
+            self.assertGreater(summary['rename.mapping_hits']['total'], 0)
+            self.assertEqual(summary['format.layout']['count'], 1)
+
+    def test_mapping_misses(self):
+        records = []
+        hv = Parser('../conf/config.conf', instrumentation=CallbackSink(records.append))
+        hv.parse_query('SELECT t1.a, t1.nada FROM t1').rename_tree()
+        rename = [record for record in records if record['stage'] == 'rename'][0]
+        self.assertEqual((rename['mapping_hits'], rename['mapping_misses']), (2, 1))
+
+    def test_out_of_grammar(self):
+        records = []
+        hv = Parser('../conf/config.conf', instrumentation=CallbackSink(records.append))
+        self.assertIsNone(hv._parse_statement('SET hive.exec.parallel = true'))
+        self.assertEqual(records[-1]['error'], 'OutOfGrammarException')
+
+    def test_workers(self):
+        test_dir = tempfile.mkdtemp()
+        shutil.copytree('../conf/mapping', os.path.join(test_dir, 'mapping'))
+        os.mkdir(os.path.join(test_dir, 'output'))
+        conf = os.path.join(test_dir, 'config.conf')
+        Parser.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': os.path.join(test_dir, 'mapping')}, conf)
+
+        aggregator = Aggregator()
+        hv = Parser(conf, instrumentation=aggregator)
+        queries = {'.test_file1': iter([['SELECT a FROM t20;', 'SELECT b FROM t2;']]),
+                   '.test_file2': iter([['CREATE TABLE t20 AS SELECT a FROM t1;']])}
+        hv.save_renamed(queries, os.path.join(test_dir, 'output'), workers=2)
+        self.assertEqual(len(aggregator.values('parse.tokens')), 3)
+        self.assertEqual(len(aggregator.values('format.layout')), 3)
+        self.assertEqual(hv.timings['statements'], 3)
+        shutil.rmtree(test_dir)
@@ -0,0 +1,31 @@
+from unittest import TestCase
+from rosqltta.lexer import Lexer, Token, KEYWORD, IDENTIFIER, LITERAL, PUNCTUATION, OPERATOR
+
+
+class TestLexer(TestCase):
+    def setUp(self):
+        self.lexer = Lexer(['SELECT', 'FROM', 'WHERE', '>=', '>', '=', '!', '*', ',', '.', '#WORD#', '#IDENT#'])
+
+    def test_get_keywords(self):
+        self.assertTrue('SELECT' in self.lexer.get_keywords())
+        self.assertFalse('#WORD#' in self.lexer.get_keywords())
+        self.assertFalse('#IDENT#' in self.lexer.get_keywords())
+
+    def test_tokenize(self):
+        tokens = self.lexer.tokenize('SELECT t1.a, b FROM t1 WHERE a>=#WORD#')
+        self.assertEqual([token.category for token in tokens],
+                         [KEYWORD, IDENTIFIER, PUNCTUATION, IDENTIFIER, PUNCTUATION, IDENTIFIER, KEYWORD, IDENTIFIER,
+                          KEYWORD, IDENTIFIER, OPERATOR, LITERAL])
+        self.assertEqual([token.text for token in tokens],
+                         ['SELECT', 'T1', '.', 'A', ',', 'B', 'FROM', 'T1', 'WHERE', 'A', '>=', '#WORD#'])
+        self.assertEqual(tokens[1].position, 7)
+        self.assertEqual(self.lexer.tokenize('  '), [])
+
+    def test_split_operator(self):
+        self.assertEqual([token.text for token in self.lexer.tokenize('a != b')], ['A', '!', '=', 'B'])
+        self.assertEqual([token.text for token in self.lexer.tokenize('a >= b')], ['A', '>=', 'B'])
+
+    def test_terminal(self):
+        self.assertEqual(Token(IDENTIFIER, 'T1', 0).terminal, '#IDENT#')
+        self.assertEqual(Token(KEYWORD, 'SELECT', 0).terminal, 'SELECT')
+        self.assertEqual(Token(LITERAL, '#WORD#', 0).terminal, '#WORD#')
@@ -0,0 +1,60 @@
+import io
+import os
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import redirect_stderr
+from unittest import TestCase
+from rosqltta.parser import Parser
+from rosqltta.__main__ import main, parse_args, summary
+
+
+class TestMain(TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        shutil.copytree('../conf/mapping', os.path.join(self.test_dir, 'mapping'))
+        self.conf = os.path.join(self.test_dir, 'config.conf')
+        Parser.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': os.path.join(self.test_dir, 'mapping')},
+                         self.conf)
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+    def _write(self, name, text):
+        path = os.path.join(self.test_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_parse_args(self):
+        args = parse_args([])
+        self.assertEqual((args.input, args.output, args.workers), ('-', '-', None))
+        with redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, parse_args, [self.test_dir, '-'])
+            self.assertRaises(SystemExit, parse_args, ['-', '-', '--workers', '2'])
+
+    def test_summary(self):
+        result = summary(Counter(statements=4, parse=1.5, rename=0.25, format=0.125), 2)
+        self.assertEqual(result, {'statements': 4, 'seconds': 2, 'statements_per_second': 2.0, 'parse_seconds': 1.5,
+                                  'rename_seconds': 0.25, 'format_seconds': 0.125})
+
+    def test_stream(self):
+        source = self._write('input.hql', 'CREATE TABLE t20 AS SELECT t1.a FROM t1;\nSELECT a FROM t20;\n')
+        target = os.path.join(self.test_dir, 'output.hql')
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(main([source, target, '--conf', self.conf, '--summary', 'json', '--log-level',
+                                   'WARNING']), 0)
+        with open(target) as f:
+            self.assertEqual(f.read().split(Parser.STATEMENT_END)[1], '\nSELECT nuevo_a_t1\nFROM T20')
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, 'mapping', 'T20.json')))
+        self.assertIn('"statements": 2', stderr.getvalue())
+
+    def test_directories(self):
+        self._write(os.path.join('input', 'a.hql'), 'SELECT a FROM t20;\n')
+        self._write(os.path.join('input', 'b.hql'), 'CREATE TABLE t20 AS SELECT t1.a FROM t1;\n')
+        os.mkdir(os.path.join(self.test_dir, 'output'))
+        with redirect_stderr(io.StringIO()):
+            self.assertEqual(main([os.path.join(self.test_dir, 'input'), os.path.join(self.test_dir, 'output'),
+                                   '--conf', self.conf, '--workers', '2', '--log-level', 'WARNING']), 0)
+        with open(os.path.join(self.test_dir, 'output', 'a.hql')) as f:
+            self.assertIn('SELECT nuevo_a_t1', f.read())
@@ -0,0 +1,180 @@
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import ChainMap
+from unittest import TestCase
+from rosqltta.mapping import (MappingStore, DirectoryMappingStore, SqliteMappingStore, add_field, column_owners,
+                              write_json)
+
+
+class TestDirectoryMappingStore(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for table in ('T1', 'T2'):
+            write_json({'new_name': 'nueva_' + table.lower(), 'fields': {'A': 'nuevo_a'}},
+                       os.path.join(self.path, table + '.json'))
+        with open(os.path.join(self.path, 'T3.json.tmp'), 'w') as f:
+            f.write('{')
+        self.store = DirectoryMappingStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_lazy_load(self):
+        self.assertEqual(self.store.loaded(), 0)
+        self.assertTrue('T1' in self.store)
+        self.assertFalse('T3' in self.store)
+        self.assertFalse(None in self.store)
+        self.assertEqual(self.store.loaded(), 0)
+
+        self.assertEqual(self.store['T1']['new_name'], 'nueva_t1')
+        self.assertEqual(self.store.loaded(), 1)
+        self.assertIsNone(self.store.get('T3'))
+        self.assertRaises(KeyError, lambda: self.store[None])
+
+    def test_keys(self):
+        self.assertEqual(sorted(self.store.keys()), ['T1', 'T2'])
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.loaded(), 0)
+
+    def test_set(self):
+        self.store['T20'] = {'new_name': 'nueva_t20', 'fields': {}}
+        self.store.setdefault('T1', {})
+        self.assertEqual(sorted(self.store), ['T1', 'T2', 'T20'])
+        self.assertEqual(self.store['T1']['new_name'], 'nueva_t1')
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'T20.json')))
+
+        self.store.save('T20')
+        with open(os.path.join(self.path, 'T20.json')) as f:
+            self.assertEqual(json.load(f)['new_name'], 'nueva_t20')
+
+        del self.store['T2']
+        self.assertEqual(sorted(self.store), ['T1', 'T20'])
+        self.assertFalse('T2' in self.store)
+
+    def test_abstract(self):
+        # Un almacen que no implementa todos los metodos del almacenamiento no se puede crear
+        class IncompleteStore(MappingStore):
+            def _list(self):
+                return []
+
+        self.assertRaises(TypeError, MappingStore)
+        self.assertRaises(TypeError, IncompleteStore)
+
+    def test_owners(self):
+        self.assertEqual(self.store.owners('A'), {'T1', 'T2'})
+        self.assertEqual(self.store.owners('B'), set())
+
+        self.store.add_field('T1', 'B', 'nuevo_b')
+        self.store['T20'] = {'fields': {'A': 'nuevo_a', 'B': 'nuevo_b'}}
+        self.assertEqual(self.store.owners('B'), {'T1', 'T20'})
+        self.store['T20'] = {'fields': {'C': 'nuevo_c'}}
+        self.assertEqual(self.store.owners('A'), {'T1', 'T2'})
+        self.assertEqual(self.store.owners('C'), {'T20'})
+        del self.store['T2']
+        self.assertEqual(self.store.owners('A'), {'T1'})
+
+    def test_column_owners(self):
+        created = {'T2': {'fields': {}}, 'T20': {'fields': {'A': 'nuevo_a'}}}
+        mapping = ChainMap(created, self.store)
+        self.assertEqual(column_owners(mapping, 'A'), {'T1', 'T20'})
+        self.assertEqual(column_owners(created, 'A'), {'T20'})
+
+        add_field(mapping, 'T2', 'A', 'otro_a')
+        add_field(mapping, 'T1', 'B', 'nuevo_b')
+        self.assertEqual(created['T2']['fields'], {'A': 'otro_a'})
+        self.assertEqual(self.store.owners('B'), {'T1'})
+        self.assertEqual(column_owners(mapping, 'A'), {'T1', 'T2', 'T20'})
+
+    def test_owners_threads(self):
+        # Con lecturas lentas, un hilo no puede ver el indice inverso a medio construir por otro
+        class SlowStore(DirectoryMappingStore):
+            def _read(self, table):
+                time.sleep(0.01)
+                return super(SlowStore, self)._read(table)
+
+        for i in range(20):
+            write_json({'fields': {'C{}'.format(i): 'nuevo'}}, os.path.join(self.path, 'T1{:02d}.json'.format(i)))
+        store = SlowStore(self.path)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            owners = list(executor.map(store.owners, ['C19'] * 4))
+        self.assertEqual(owners, [{'T119'}] * 4)
+
+        # Los cambios a la vez que se consulta el indice no lo dejan inconsistente
+        stop = threading.Event()
+
+        def write():
+            i = 0
+            while not stop.is_set():
+                store['T2{}'.format(i % 50)] = {'fields': {'A': 'nuevo_a'}}
+                store.add_field('T1', 'B{}'.format(i), 'nuevo_b')
+                i += 1
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(2000):
+                self.assertIn('T1', store.owners('A'))
+        finally:
+            stop.set()
+            writer.join()
+        self.assertEqual(store.owners('A'), {table for table in store if 'A' in store[table]['fields']})
+
+    def test_pickle(self):
+        self.store['T20'] = {'fields': {}}
+        store = pickle.loads(pickle.dumps(self.store))
+        self.assertEqual(store['T20'], {'fields': {}})
+        self.assertEqual(store['T2']['new_name'], 'nueva_t2')
+
+
+class TestSqliteMappingStore(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, 'mapping'))
+        for table in ('T1', 'T2'):
+            write_json({'new_name': 'nueva_' + table.lower(), 'fields': {'A': 'nuevo_a'}},
+                       os.path.join(self.path, 'mapping', table + '.json'))
+        self.store = SqliteMappingStore(os.path.join(self.path, 'mapping.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.path)
+
+    def test_import_directory(self):
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.import_directory(os.path.join(self.path, 'mapping')), 2)
+        self.assertEqual(sorted(self.store), ['T1', 'T2'])
+        self.assertTrue('T1' in self.store)
+        self.assertEqual(self.store['T2']['new_name'], 'nueva_t2')
+        self.assertIsNone(self.store.get('T3'))
+
+    def test_save(self):
+        self.store['T20'] = {'new_name': 'nueva_t20', 'fields': {}}
+        self.store.save('T20')
+        self.store.close()
+
+        store = SqliteMappingStore(os.path.join(self.path, 'mapping.sqlite'))
+        self.assertEqual(store.loaded(), 0)
+        self.assertEqual(store['T20']['new_name'], 'nueva_t20')
+        store.close()
+
+    def test_threads(self):
+        def read(table):
+            entry = self.store[table]
+            self.store.close()
+            return entry['new_name']
+
+        self.store.import_directory(os.path.join(self.path, 'mapping'))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(list(executor.map(read, ['T1', 'T2'])), ['nueva_t1', 'nueva_t2'])
+
+    def test_pickle(self):
+        self.store.import_directory(os.path.join(self.path, 'mapping'))
+        store = pickle.loads(pickle.dumps(self.store))
+        self.assertEqual(store['T1']['new_name'], 'nueva_t1')
+        store.close()
@@ -0,0 +1,24 @@
+import json
+import pandas as pd
+from unittest import TestCase
+from rosqltta.parse_excel import build_jsons
+
+
+class TestParseExcel(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'Tabla Origen': ['t1;t2', 't2', 't1', 't3'],
+                                'Tabla': ['new_t1', 'other', 'new_t1b', 'new_t3'],
+                                'columnaLegacy': ['a', 'b', 'A', 'c'],
+                                'Code': [1, 2, 3, 4]},
+                               columns=['Tabla Origen', 'Tabla', 'columnaLegacy', 'Code'])
+
+    def test_build_jsons(self):
+        jsons = build_jsons(self.df, ';')
+        self.assertEqual(list(jsons), ['t1', 't2', 't3'])
+        self.assertEqual(jsons['t1'], {'old_name': 't1', 'new_name': 'new_t1', 'fields': {'A': 1}})
+        self.assertEqual(jsons['t2'], {'old_name': 't2', 'new_name': 'new_t1', 'fields': {'A': 1, 'B': 2}})
+        self.assertEqual(list(jsons['t2']['fields']), ['A', 'B'])
+        self.assertEqual(json.loads(json.dumps(jsons)), jsons)
+
+    def test_columns(self):
+        self.assertRaises(KeyError, build_jsons, self.df.drop('Code', axis=1), ';')
@@ -1,7 +1,14 @@
 import os
+import sys
+import inspect
+import json
+import shutil
+import tempfile
 import nltk
 import copy
 import re
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 from rosqltta.parser import Parser, UnreferencedTableError
 
@@ -60,8 +67,172 @@ class TestParser(TestCase):
         os.remove(file_path_2)
         os.rmdir(test_dir)
 
+    def test_stream_query_file(self):
+        file_path = os.path.join('.', '.test_file')
+        with open(file_path, 'w') as f:
+            f.write("SELECT ';' FROM t1; -- comentario\nSELECT a\nFROM t2;")
+
+        statements = list(self.hv._stream_query_file(file_path))
+        self.assertEqual([(statement.text, statement.line) for statement in statements],
+                         [("SELECT ';' FROM t1", 1), ('  SELECT a  FROM t2', 2), ('', 3)])
+        self.assertEqual(statements[1].comments, ['-- comentario'])
+        os.remove(file_path)
+
     def test_save_renamed(self):
-        pass
+        lines = ['-- comentario', 'SELECT t1.a, b FROM t1;', 'SELECT a FROM t2 WHERE c = 4;']
+        outputs = []
+        for workers in (None, 2):
+            test_dir = '.test_renamed_{}'.format(workers)
+            os.mkdir(test_dir)
+            queries = {name: iter([lines]) for name in ('.test_file1', '.test_file2', '.test_file3')}
+            self.hv.save_renamed(queries, test_dir, workers=workers)
+            outputs.append({name: open(os.path.join(test_dir, name)).read() for name in sorted(os.listdir(test_dir))})
+            [os.remove(os.path.join(test_dir, name)) for name in os.listdir(test_dir)]
+            os.rmdir(test_dir)
+
+        self.assertEqual(len(outputs[0]), 3)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_save_renamed_dependencies(self):
+        # La tabla T20 se crea en el segundo fichero y se lee en el primero
+        test_dir = tempfile.mkdtemp()
+        shutil.copytree('../conf/mapping', os.path.join(test_dir, 'mapping'))
+        os.mkdir(os.path.join(test_dir, 'output'))
+        conf = os.path.join(test_dir, 'config.conf')
+        self.hv.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': os.path.join(test_dir, 'mapping')}, conf)
+
+        for workers in (None, 2):
+            hv = Parser(conf)
+            queries = {'.test_file1': iter([['SELECT a FROM t20;']]),
+                       '.test_file2': iter([['CREATE TABLE t20 AS SELECT a FROM t1;']])}
+            hv.save_renamed(queries, os.path.join(test_dir, 'output'), workers=workers)
+            with open(os.path.join(test_dir, 'output', '.test_file1')) as f:
+                self.assertIn('SELECT nuevo_a_t1', f.read())
+            with open(os.path.join(test_dir, 'mapping', 'T20.json')) as f:
+                self.assertEqual(json.load(f)['fields'], {'A': 'nuevo_a_t1'})
+            [os.remove(os.path.join(test_dir, 'output', name)) for name in os.listdir(os.path.join(test_dir, 'output'))]
+            os.remove(os.path.join(test_dir, 'mapping', 'T20.json'))
+
+        shutil.rmtree(test_dir)
+
+    def test_stream_renamed(self):
+        lines = ['-- comentario', 'CREATE TABLE t20 AS SELECT t1.a', 'FROM t1;', 'set hive.exec.parallel=true;',
+                 "SELECT a FROM t20 WHERE a = 'x;y'"]
+        renamed = self.hv.stream_renamed(iter(lines), 'test.hql')
+        self.assertTrue(next(renamed).startswith('-- comentario\nCREATE TABLE T20 AS\nSELECT nueva_t1.nuevo_a_t1'))
+        self.assertEqual(self.hv._Parser__dirty_mappings, ['T20'])
+        self.assertEqual(next(renamed).strip(), 'set hive.exec.parallel=true')
+        self.assertEqual(list(renamed), ["\nSELECT nuevo_a_t1\nFROM T20\nWHERE nuevo_a_t1 = 'x;y'"])
+        self.assertRaises(UnreferencedTableError, list, self.hv.stream_renamed(['SELECT a FROM t1, t2']))
+
+    def test_timings(self):
+        self.hv.translate('SELECT t1.a, b FROM t1')
+        list(self.hv.stream_renamed(['SELECT a FROM t1;', 'set hive.exec.parallel=true']))
+        self.assertEqual(self.hv.timings['statements'], 3)
+        self.assertTrue(all(self.hv.timings[phase] > 0 for phase in ('parse', 'rename', 'format')))
+        timings, records = self.hv._pop_metrics()
+        self.assertEqual(timings['statements'], 3)
+        self.assertEqual(self.hv.timings, {})
+
+    def test_save_renamed_incremental(self):
+        test_dir = tempfile.mkdtemp()
+        shutil.copytree('../conf/mapping', os.path.join(test_dir, 'mapping'))
+        output = os.path.join(test_dir, 'output')
+        os.mkdir(output)
+        conf = os.path.join(test_dir, 'config.conf')
+        self.hv.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': os.path.join(test_dir, 'mapping')}, conf)
+
+        def run(lines, workers=None):
+            with self.assertLogs('rosqltta', 'INFO') as logs:
+                Parser(conf).save_renamed({'.test_file1': iter([lines]),
+                                           '.test_file2': iter([['CREATE TABLE t20 AS SELECT a, c FROM t1;']])},
+                                          output, workers=workers, incremental=True)
+            with open(os.path.join(output, '.test_file1')) as f:
+                return f.read(), [log for log in logs.output if 'Modo incremental' in log][0].split(': ')[-1]
+
+        lines = ['SELECT a FROM t20;', 'SELECT b FROM t2;']
+        self.assertEqual(run(lines)[1], '3 sentencias renombradas de 3')
+        # La segunda vez ya existe el fichero de mapping de T20, que lee la sentencia que la crea
+        renamed, _ = run(lines)
+        self.assertEqual(run(lines), (renamed, '0 sentencias renombradas de 3'))
+        self.assertEqual(run(lines, workers=2), (renamed, '0 sentencias renombradas de 3'))
+
+        # Cambia el mapeo de una tabla: se renombran las sentencias que la leen
+        with open(os.path.join(test_dir, 'mapping', 'T2.json')) as f:
+            mapping = json.load(f)
+        mapping['fields']['B'] = 'otra_b'
+        self.hv.save_json(mapping, os.path.join(test_dir, 'mapping', 'T2.json'))
+        renamed, count = run(lines)
+        self.assertEqual(count, '1 sentencias renombradas de 3')
+        self.assertIn('SELECT otra_b', renamed)
+
+        # Cambia un fichero de queries: solo se renombran las sentencias nuevas
+        renamed, count = run(lines + ['SELECT c FROM t1;'], workers=2)
+        self.assertEqual(count, '1 sentencias renombradas de 4')
+        self.assertEqual(renamed.count(';'), 3)
+
+        shutil.rmtree(test_dir)
+
+    def test_get_cache(self):
+        self.assertIsNone(self.hv._cache)
+        cache_dir = tempfile.mkdtemp()
+        hv = Parser('../conf/config.conf', cache_dir=cache_dir)
+        query = "SELECT t1.a, b FROM t1 WHERE c = 'x'"
+
+        tree = copy.deepcopy(hv.parse_query(query).tree)
+        self.assertEqual(hv.parse_query(query).tree, tree)
+        self.assertEqual(hv._cache.hits, 1)
+        self.assertEqual(hv.parse_query(query).rename_tree().rebuild_query(),
+                         self.hv.parse_query(query).rename_tree().rebuild_query())
+
+        hv._cache.close()
+        shutil.rmtree(cache_dir)
+
+    def test_get_lineage(self):
+        tree = self.hv.parse_query('INSERT INTO TABLE db.t9 SELECT a FROM t1 JOIN db.t2 ON t1.a = t2.a, '
+                                   '(SELECT b FROM t3) s').tree
+        self.assertEqual(self.hv._get_lineage(tree), ('DB.T9', {'T1', 'DB.T2', 'T3'}))
+        self.assertEqual(self.hv._get_lineage(self.hv.parse_query('SELECT a FROM t1').tree), (None, {'T1'}))
+
+    def test_translate(self):
+        result = self.hv.translate('-- comentario\nSELECT t1.a, b FROM t1;\n')
+        self.assertEqual(result.query, '-- comentario\nSELECT nueva_t1.nuevo_a_t1,\n       nuevo_b_t1\nFROM nueva_t1')
+        self.assertEqual((result.target, result.sources, result.mapping), (None, {'T1'}, {}))
+        self.assertIsNone(self.hv.tree)
+
+        # Las tablas origen que no estan mapeadas no se guardan
+        result = self.hv.translate('SELECT a FROM t99')
+        self.assertEqual((result.sources, result.mapping), ({'T99'}, {}))
+        self.assertNotIn('T99', self.hv._Parser__mapping)
+        self.assertEqual(self.hv._Parser__dirty_mappings, [])
+        self.assertEqual(self.hv.get_comments(), [])
+
+        result = self.hv.translate('CREATE TABLE t20 AS SELECT t1.a FROM t1')
+        self.assertEqual(result.target, 'T20')
+        self.assertEqual(result.mapping['T20']['fields'], {'A': 'nuevo_a_t1'})
+        self.assertEqual(self.hv._Parser__mapping['T20'], result.mapping['T20'])
+        self.assertEqual(self.hv._Parser__dirty_mappings, ['T20'])
+        self.assertEqual(self.hv.translate('SELECT a FROM t20').query, 'SELECT nuevo_a_t1\nFROM T20')
+
+        self.assertRaises(ValueError, self.hv.translate, 'SELECT a FROM t1; SELECT b FROM t1')
+        self.assertRaises(ValueError, self.hv.translate, '-- solo un comentario')
+
+    def test_translate_threads(self):
+        queries = ["SELECT t1.a, b FROM t1 WHERE a = '{}'".format(i) for i in range(20)]
+        queries += ['SELECT t.a FROM (SELECT a, b FROM t2 WHERE b > {}) AS t'.format(i) for i in range(20)]
+        expected = [self.hv.translate(query).query for query in queries]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual([result.query for result in executor.map(self.hv.translate, queries)], expected)
+
+    def test_context(self):
+        hv_parser = copy.copy(self.hv)
+        hv_parser.parse_query('SELECT a FROM t1')
+        self.assertIsNone(self.hv.tree)
+
+        hv_parser = pickle.loads(pickle.dumps(hv_parser))
+        self.assertEqual(hv_parser.rename_tree().rebuild_query(comments=False), 'SELECT nuevo_a_t1\nFROM nueva_t1')
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.assertIsNone(executor.submit(lambda: hv_parser.tree).result())
 
     def test_process_file(self):
         pass
@@ -72,19 +243,67 @@ class TestParser(TestCase):
     def test_save_query(self):
         pass
 
-    def test_str_to_terminals(self):
-        column_name = 'a'
-        table_column_name = 't.a'
-
-        table, column = self.hv._Parser__str_to_terminals(column_name)
-        self.assertEqual(table, column, "'" + column_name + "'")
-
-        table, column = self.hv._Parser__str_to_terminals(table_column_name)
-        self.assertEqual(table, "'t'")
-        self.assertEqual(column, "'a'")
+    def test_save_json(self):
+        test_dir = tempfile.mkdtemp()
+        file = os.path.join(test_dir, 'T1.json')
+        self.hv.save_json({'b': 1, 'a': {'c': 2}}, file)
+        with open(file) as f:
+            self.assertEqual(f.read(), '{\n    "a": {\n        "c": 2\n    },\n    "b": 1\n}')
+        self.hv.save_json({'b': 1, 'a': {'c': 2}}, file, compact=True)
+        with open(file) as f:
+            self.assertEqual(f.read(), '{"a":{"c":2},"b":1}')
+        self.assertEqual(os.listdir(test_dir), ['T1.json'])
+        shutil.rmtree(test_dir)
+
+    def test_flush_mappings(self):
+        test_dir = tempfile.mkdtemp()
+        self.hv._config = dict(self.hv._config, mapping_dir=test_dir, mapping_compact=True)
+        self.hv._Parser__mapping['T20'] = self.hv.new_mapped_table('T20')
+        [self.hv._mark_dirty(table) for table in ('T20', 'T1', 'T20')]
+
+        self.assertEqual(self.hv.flush_mappings(), ['T20', 'T1'])
+        self.assertEqual(sorted(os.listdir(test_dir)), ['T1.json', 'T20.json'])
+        self.assertEqual(self.hv.load_mapping_files(test_dir)['T20'], self.hv.new_mapped_table('T20'))
+        self.assertEqual(self.hv.flush_mappings(), [])
+        shutil.rmtree(test_dir)
+
+    def test_get_mapping_store(self):
+        self.assertEqual(self.hv._Parser__mapping.loaded(), 0)
+        test_dir = tempfile.mkdtemp()
+        conf = os.path.join(test_dir, 'conf.json')
+        with open(conf, 'w') as f:
+            json.dump(dict(self.hv._config, mapping_store='sqlite', mapping_file=os.path.join(test_dir, 'mapping.db')), f)
+
+        hv = Parser(conf)
+        self.assertEqual(sorted(hv._Parser__mapping), sorted(self.hv._Parser__mapping))
+        self.assertEqual(hv.parse_query('SELECT t1.a FROM t1').rename_tree().rebuild_query(),
+                         self.hv.parse_query('SELECT t1.a FROM t1').rename_tree().rebuild_query())
+
+        hv._Parser__mapping['T20'] = hv.new_mapped_table('T20')
+        hv._mark_dirty('T20')
+        self.assertEqual(hv.flush_mappings(), ['T20'])
+        hv._Parser__mapping.close()
+        self.assertTrue('T20' in Parser(conf)._Parser__mapping)
+        self.assertFalse(os.path.exists(os.path.join(self.hv._config['mapping_dir'], 'T20.json')))
+
+        with open(conf, 'w') as f:
+            json.dump(dict(self.hv._config, mapping_store='otro'), f)
+        self.assertRaises(ValueError, Parser, conf)
+        shutil.rmtree(test_dir)
 
     def test__read_grammar_(self):
-        pass
+        grammar = self.hv._read_grammar_()
+        self.assertTrue('SELECT' in self.hv._terminals)
+        self.assertEqual(grammar.start().symbol(), 'S')
+        self.assertFalse(grammar.productions(rhs='DB_MI_UDF'))
+
+        # Las UDFs son los unicos terminales que se agregan a la gramatica, como nombres de funciones
+        for backend in Parser.BACKENDS:
+            hv = Parser('../conf/config.conf', udfs=['db.mi_udf'], backend=backend)
+            productions = hv.get_grammar().productions(rhs='DB_MI_UDF')
+            self.assertEqual([production.lhs().symbol() for production in productions], ['FUNCTION_NAMES'])
+            query = hv.parse_query('SELECT db.mi_udf(a) FROM t1').rename_tree().rebuild_query(comments=False)
+            self.assertIn('db.mi_udf', query)
 
     def test_skip_to_node(self):
         current = nltk.Tree(3, [4])
@@ -104,6 +323,7 @@ class TestParser(TestCase):
         self.assertTrue('columns' in query[0])
         self.assertTrue('alias' in query[0]['columns'])
         self.assertTrue('names' in query[0]['columns'])
+        self.assertTrue('bare' in query[0]['columns'])
         self.assertTrue('tables' in query[0])
         self.assertTrue('alias' in query[0]['tables'])
         self.assertTrue('names' in query[0]['tables'])
@@ -128,6 +348,25 @@ class TestParser(TestCase):
         self.assertTrue(new_tree._Parser__grammar)
         self.assertTrue(new_tree.tree)
 
+    def test_get_backend(self):
+        self.assertTrue(isinstance(self.hv._get_backend(), nltk.ChartParser))
+
+        hv_parser = Parser('../conf/config.conf', backend='earley')
+        self.assertEqual(hv_parser.parse_query('SELECT t1.a FROM t1').tree,
+                         self.hv.parse_query('SELECT t1.a FROM t1').tree)
+
+        self.assertRaises(ValueError, Parser, '../conf/config.conf', backend='otro')
+
+    def test_restore_identifiers(self):
+        tree = nltk.Tree('COLUMN_REFERENCE',
+                         [nltk.Tree('TABLE_NAMES', ['#IDENT#']),
+                          nltk.Tree('POINT', ['.']),
+                          nltk.Tree('COLUMN_NAMES', ['#IDENT#'])
+                          ])
+        tokens = self.hv._lexer.tokenize('tabla.columna')
+        self.hv._restore_identifiers(tree, tokens)
+        self.assertEqual(tree.leaves(), ['TABLA', '.', 'COLUMNA'])
+
     def test_update_subqueries(self):
         i = 0
         hv_parser = copy.copy(self.hv).parse_query('SELECT t1.a FROM (SELECT a FROM t2) AS t1')
@@ -294,6 +533,7 @@ class TestParser(TestCase):
         self.assertEquals(sub_trees[1].label(), 'SELECT_SENTENCE')
 
     def test_equal_columns(self):
+        self.assertEqual(self.hv._bare_column('t1.a'), 'A')
         self.assertTrue(self.hv._equal_columns('a', 'a'))
         self.assertTrue(self.hv._equal_columns('t1.a', 't2.a'))
         self.assertTrue(self.hv._equal_columns('t1.a', 'a'))
@@ -316,6 +556,28 @@ class TestParser(TestCase):
         tabla = hv_parser._get_unreferenced_table(0)
         self.assertEquals(tabla, 'tabla1')
 
+    def test_deduce_table(self):
+        hv_parser = copy.copy(self.hv)
+        hv_parser._Parser__queries = {0: {'tables': {'names': [], 'alias': {}}}}
+        self.assertEqual(hv_parser._deduce_table(0, 'D', ['T1', 'T2']), 'T1')
+        self.assertIsNone(hv_parser._deduce_table(0, 'D', ['T2', 'T3']))
+        self.assertIsNone(hv_parser._deduce_table(0, 'D', ['T1', 'T9']))
+        self.assertRaises(UnreferencedTableError, hv_parser._deduce_table, 0, 'P', ['T1', 'T2'])
+
+        self.assertIsNone(hv_parser._deduce_table(0, 'NO_EXISTE'))
+        self.assertTrue(hv_parser._all_tables)
+        with self.assertRaises(UnreferencedTableError) as error:
+            hv_parser._deduce_table(0, 'F')
+        self.assertTrue(all("'{}'".format(table) in str(error.exception) for table in ('T4', 'T5')))
+
+        hv_parser._Parser__mapping['T20'] = hv_parser.new_mapped_table('T20')
+        hv_parser._creating_table = 'T20'
+        hv_parser._register_column(0, 'COLUMNA_NUEVA', 'columna_nueva', True)
+        self.assertEqual(hv_parser._deduce_table(0, 'COLUMNA_NUEVA'), 'T20')
+        self.assertEqual(hv_parser._deduce_table(0, 'COLUMNA_NUEVA', ['T1', 'T20']), 'T20')
+        del hv_parser._Parser__mapping['T20']
+        self.assertIsNone(hv_parser._deduce_table(0, 'COLUMNA_NUEVA'))
+
     def test_is_referenced_column(self):
         self.assertTrue(self.hv.is_referenced_column('t1.a'))
         self.assertFalse(self.hv.is_referenced_column('a'))
@@ -336,7 +598,21 @@ class TestParser(TestCase):
         pass
 
     def test_get_reference_in_subquery(self):
-        pass
+        hv_parser = copy.copy(self.hv)
+        hv_parser._Parser__queries = {}
+        columns = hv_parser._init_query(1)[1]['columns']
+        hv_parser._Parser__queries[1]['tables']['names'] = ['t1']
+        for name in ('t1.a', 'b', 't1.A'):
+            node = nltk.Tree('COLUMN_REFERENCE', [nltk.Tree('COLUMN_NAMES', [name])])
+            hv_parser._Parser__process_column_node(node, node[0], columns)
+
+        self.assertEqual(columns['bare'], {'A': 't1.a', 'B': 'b'})
+        self.assertEqual(hv_parser._Parser__get_reference_in_subquery('x.a', 1), ['t1', 'a'])
+        self.assertEqual(hv_parser._Parser__get_reference_in_subquery('B', 1), ('t1', 'b'))
+
+        # Sin indice, se recorre la lista de columnas
+        del columns['bare']
+        self.assertEqual(hv_parser._Parser__get_reference_in_subquery('x.a', 1), ['t1', 'a'])
 
     def test_find_sub_column(self):
         pass
@@ -381,6 +657,18 @@ class TestParser(TestCase):
     def test_rename_tree(self):
         pass
 
+    def test_rename_deep_tree(self):
+        # Cada UNION anida un nivel mas en el arbol. El recorrido no depende del limite de recursividad
+        query = ' UNION ALL '.join('SELECT t1.a FROM t1 WHERE b > {}'.format(i) for i in range(40))
+        hv_parser = Parser('../conf/config.conf', backend='earley').parse_query(query)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(len(inspect.stack()) + 50)
+        try:
+            query = hv_parser.rename_tree().rebuild_query(comments=False)
+        finally:
+            sys.setrecursionlimit(limit)
+        self.assertEqual(query.count('SELECT nueva_t1.nuevo_a_t1'), 40)
+
     def test_remove_comment(self):
         hv_parser = copy.copy(self.hv)
         line = hv_parser._remove_comment('query --comentario1')
@@ -391,53 +679,93 @@ class TestParser(TestCase):
         self.assertEquals(comments[0], '--comentario1')
         self.assertEquals(comments[1], '--comentario2')
 
-    def test_find_numbers(self):
-        numbers = [' ' + str(e) + ' ' for e in self.hv._find_numbers('hola 14 como estas1 mil 1000')]
-        self.assertEquals(len(numbers), 2)
-        self.assertEquals(numbers[0], '  14  ')
-        self.assertEquals(numbers[1], '  1000  ')
-
-    def test_find_between(self):
-        strings = self.hv._find_between("hola 'cadena1', estaba aqui siendo una 'cadena2'", "'", "'")
-        self.assertEquals(len(strings), 2)
-        self.assertEquals(strings[0], "'cadena1'")
-        self.assertEquals(strings[1], "'cadena2'")
-
-        vars = self.hv._find_between("hola ${hivevar:var1}, cosas {}", "${", "}")
-        self.assertEquals(len(vars), 1)
-        self.assertEquals(vars[0], "${hivevar:var1}")
-
     def test_clean_line(self):
         line = "SELECT 1, a FROM ${hivevar: db}.t1 WHERE a > '2013-06-01' AND b < 2"
         parsed = self.hv._clean_line(line)
         self.assertEqual(parsed, " SELECT #WORD# ,  A FROM  #WORD# .T1 WHERE A >  #WORD#  AND B < #WORD# ")
 
-    def test_replace_var(self):
+    def test_clean_line_words(self):
         hv_parser = copy.copy(self.hv)
-        pattern = re.compile(r"a|b")
-        new_line = pattern.sub(lambda m: hv_parser._Parser__replace_var(m, {'a': '_a_', 'b': '_b_'}), 'hola boris')
-        self.assertEqual(new_line, 'hol_a_ _b_oris')
-        words = hv_parser.get_words()
-        self.assertEqual(words[0], 'a')
-        self.assertEqual(words[1], 'b')
-
-    def test_tokenize_vars(self):
+        hv_parser._Parser__words = []
+        line = "SELECT a1, 14 FROM t WHERE b IN ('x,y', '${no}') AND c = ${hivevar:v} AND d = 1000"
+        parsed = hv_parser._clean_line(line)
+        self.assertEqual(parsed.split(), ['SELECT', 'A1', ',', '#WORD#', 'FROM', 'T', 'WHERE', 'B', 'IN', '(',
+                                          '#WORD#', ',', '#WORD#', ')', 'AND', 'C', '=', '#WORD#', 'AND', 'D', '=',
+                                          '#WORD#'])
+        self.assertEqual(hv_parser.get_words(), [' 14 ', "'x,y'", "'${no}'", '${hivevar:v}', ' 1000 '])
+
+        # Sin literales no se agregan espacios al principio ni al final
+        hv_parser._Parser__words = []
+        self.assertEqual(hv_parser._clean_line('SELECT a FROM t'), 'SELECT A FROM T')
+        self.assertEqual(hv_parser.get_words(), [])
+
+    def test_clean_line_long(self):
         hv_parser = copy.copy(self.hv)
-        line = " SELECT 1 ,  A FROM ${hivevar: db} .T1 WHERE A >  '2013-06-01'  AND B < 2 "
-        clean_line = hv_parser._tokenize_vars(line, [" 1 ", " ${hivevar: db} ", " '2013-06-01' ", " 2 "])
-        self.assertEquals(clean_line, " SELECT #WORD# ,  A FROM #WORD# .T1 WHERE A >  #WORD#  AND B < #WORD# ")
-        words = hv_parser.get_words()
-        self.assertEqual(words[0], " 1 ")
-        self.assertEqual(words[1], " ${hivevar: db} ")
-        self.assertEqual(words[2], " '2013-06-01' ")
-        self.assertEqual(words[3], " 2 ")
+        hv_parser._Parser__words = []
+        n = 20000
+        line = 'SELECT a FROM t WHERE b IN (' + ', '.join("'{}'".format(i) for i in range(n)) + ')'
+        parsed = hv_parser._clean_line(line)
+        self.assertEqual(parsed.count('#WORD#'), n)
+        self.assertEqual(len(hv_parser.get_words()), n)
 
     def test_untokenize(self):
         hv_parser = copy.copy(self.hv)
-        line = " SELECT 1 ,  A FROM ${hivevar: db} .T1 WHERE A >  '2013-06-01'  AND B < 2 "
-        clean_line = hv_parser._tokenize_vars(line, [" 1 ", " ${hivevar: db} ", " '2013-06-01' ", " 2 "])
-        untokenized_line = hv_parser._untokenize(clean_line)
-        self.assertEqual(re.sub(r' +', ' ', line), re.sub(r' +', ' ', untokenized_line))
+        hv_parser._Parser__words = []
+        line = "SELECT 1, a FROM ${hivevar: db}.t1 WHERE a > '2013-06-01' AND b < 2"
+        clean_line = hv_parser._clean_line(line)
+        untokenized_line = ' '.join(hv_parser._untokenize(clean_line.split()))
+        self.assertEqual(re.sub(r' +', ' ', untokenized_line).strip(),
+                         "SELECT 1 , A FROM ${hivevar: db} .T1 WHERE A > '2013-06-01' AND B < 2")
+        self.assertEqual(hv_parser.get_words(), [])
+
+        # Si no quedan variables, el token se mantiene
+        self.assertEqual(hv_parser._untokenize(['A', '#WORD#']), ['A', '#WORD#'])
+
+    def test_untokenize_long(self):
+        hv_parser = copy.copy(self.hv)
+        n = 20000
+        hv_parser._Parser__words = [str(i) for i in range(n)]
+        leaves = hv_parser._untokenize(['VALUES', '('] + ['#WORD#', ','] * n + [')'])
+        self.assertEqual(leaves[2:6], ['0', ',', '1', ','])
+        self.assertEqual(leaves[-3], str(n - 1))
+        self.assertEqual(hv_parser.get_words(), [])
+
+    def test_untokenize_schema_variable(self):
+        # La variable del esquema queda en la misma hoja que la tabla ('#WORD#.T1') y va antes que los literales
+        query = "SELECT a FROM ${hivevar:db}.t1 WHERE b = 'x' AND c = 'y'"
+        self.assertEqual(self.hv.parse_query(query).rename_tree().rebuild_query(comments=False),
+                         "SELECT A\nFROM ${hivevar:db}.T1\nWHERE B = 'x'\n  AND C = 'y'")
+        self.assertEqual(self.hv.translate(query).query,
+                         "SELECT A\nFROM ${hivevar:db}.T1\nWHERE B = 'x'\n  AND C = 'y'")
+
+        hv_parser = copy.copy(self.hv)
+        hv_parser._Parser__words = ['${a}', '${b}', "'x'"]
+        with self.assertLogs('rosqltta', 'WARNING'):
+            self.assertEqual(hv_parser._untokenize(['#WORD#.#WORD#.T1', '=', '#WORD#', '#WORD#.T2']),
+                             ['${a}.${b}.T1', '=', "'x'", '#WORD#.T2'])
 
     def test_rebuild_query(self):
-        pass
+        query = "SELECT t1.a, b FROM t1 WHERE (a = 'x,y' AND b=2) OR c = 4"
+        self.assertEqual(self.hv.parse_query(query).rename_tree().rebuild_query(comments=False),
+                         "SELECT nueva_t1.nuevo_a_t1,\n"
+                         "       nuevo_b_t1\n"
+                         "FROM nueva_t1\n"
+                         "WHERE (nuevo_a_t1 = 'x,y' AND nuevo_b_t1 = 2)\n"
+                         "  OR nuevo_c_t1 = 4")
+
+        test_dir = tempfile.mkdtemp()
+        conf = os.path.join(test_dir, 'conf.json')
+        with open(conf, 'w') as f:
+            json.dump(dict(self.hv._config, pretty_printer='sqlparse'), f)
+        self.assertEqual(Parser(conf).parse_query(query).rename_tree().rebuild_query(comments=False),
+                         "SELECT nueva_t1.nuevo_a_t1,\n"
+                         "       nuevo_b_t1\n"
+                         "FROM nueva_t1\n"
+                         "WHERE (nuevo_a_t1 = 'x,y'\n"
+                         "       AND nuevo_b_t1 = 2)\n"
+                         "  OR nuevo_c_t1 = 4")
+
+        with open(conf, 'w') as f:
+            json.dump(dict(self.hv._config, pretty_printer='otro'), f)
+        self.assertRaises(ValueError, Parser, conf)
+        shutil.rmtree(test_dir)
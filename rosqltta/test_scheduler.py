@@ -0,0 +1,66 @@
+from unittest import TestCase
+from rosqltta.scheduler import DependencyGraph
+
+
+class TestDependencyGraph(TestCase):
+    def setUp(self):
+        # Fichero 1: lee T20, que se crea en el fichero 2
+        self.graph = DependencyGraph(existing=['T1'])
+        self.graph.add(None, ['T20'])
+        self.graph.add('T1', ['T2'])
+        # Fichero 2
+        self.graph.add('T20', ['T1'])
+        self.graph.add(None, ['T1', 'T3'])
+
+    def test_dependencies(self):
+        self.assertEqual(self.graph.dependencies(0), {2})
+        self.assertEqual(self.graph.dependencies(1), set())
+        self.assertEqual(self.graph.dependencies(2), {1})
+        self.assertEqual(self.graph.dependencies(3), {1})
+
+    def test_existing(self):
+        # Los lectores de una tabla existente no esperan a que se escriba despues, pero la escritura espera a que se lea
+        graph = DependencyGraph(existing=['T1'])
+        graph.add(None, ['T1'])
+        graph.add('T1', [])
+        self.assertEqual(graph.dependencies(0), set())
+        self.assertEqual(graph.dependencies(1), {0})
+
+    def test_readers(self):
+        # La segunda escritura espera a los lectores de la primera, tambien a los que la leen antes de que se cree
+        graph = DependencyGraph()
+        graph.add(None, ['T20'])
+        graph.add('T20', [])
+        graph.add(None, ['T20'])
+        graph.add('T20', [])
+        graph.add(None, ['T20'])
+        self.assertEqual(graph.dependencies(0), {1})
+        self.assertEqual(graph.dependencies(2), {1})
+        self.assertEqual(graph.dependencies(3), {0, 1, 2})
+        self.assertEqual(graph.dependencies(4), {3})
+        self.assertEqual(graph.levels(), [[1], [0, 2], [3], [4]])
+
+    def test_many_readers(self):
+        # Cada escritura solo depende de los lectores desde la escritura anterior
+        graph = DependencyGraph(existing=['T1'])
+        for i in range(20000):
+            graph.add('T1' if i % 10 == 0 else None, ['T1'])
+        self.assertEqual(graph.dependencies(20), set(range(10, 20)))
+        self.assertEqual(len(graph.levels()), 4000)
+
+    def test_order(self):
+        self.assertEqual(self.graph.order(), [1, 2, 0, 3])
+
+        graph = DependencyGraph()
+        [graph.add(None, []) for _ in range(3)]
+        self.assertEqual(graph.order(), [0, 1, 2])
+
+    def test_levels(self):
+        self.assertEqual(self.graph.levels(), [[1], [2, 3], [0]])
+
+    def test_cycle(self):
+        graph = DependencyGraph()
+        graph.add('A', ['B'])
+        graph.add('B', ['A'])
+        self.assertEqual(graph.order(), [0, 1])
+        self.assertEqual(graph.levels(), [[0], [1]])
@@ -0,0 +1,111 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from unittest import TestCase
+from rosqltta.parser import Parser
+from rosqltta.server import TranslationService, ServiceBusyError, make_server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__('localhost')
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+
+class TestTranslationService(TestCase):
+    def setUp(self):
+        self.service = TranslationService(Parser('../conf/config.conf'), max_concurrent=2, timeout=0)
+
+    def test_translate(self):
+        response = self.service.translate(['CREATE TABLE t20 AS SELECT t1.a FROM t1', 'SELECT a FROM t20',
+                                           'SELECT FROM'])
+        results = response['results']
+        self.assertEqual(results[0]['target'], 'T20')
+        self.assertEqual(results[0]['sources'], ['T1'])
+        self.assertEqual(response['mappings']['T20']['fields'], {'A': 'nuevo_a_t1'})
+        self.assertEqual(results[1]['query'], 'SELECT nuevo_a_t1\nFROM T20')
+        self.assertIsNone(results[1]['error'])
+        self.assertIsNone(results[2]['query'])
+        self.assertTrue(results[2]['error'])
+        self.assertTrue(all(result['ms'] >= 0 for result in results))
+        self.assertEqual(response['flushed'], [])
+        self.assertEqual(self.service.status()['statements'], 3)
+        self.assertEqual(self.service.status()['errors'], 1)
+        self.assertRaises(TypeError, self.service.translate, 'SELECT a FROM t1')
+
+    def test_select_only(self):
+        # Un lote sin CREATE ni INSERT no devuelve mapeos ni escribe ficheros, aunque lea tablas que no estan mapeadas
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        mapping_dir = os.path.join(test_dir, 'mapping')
+        shutil.copytree('../conf/mapping', mapping_dir)
+        conf = os.path.join(test_dir, 'config.conf')
+        Parser.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': mapping_dir}, conf)
+        service = TranslationService(Parser(conf), timeout=0)
+        files = sorted(os.listdir(mapping_dir))
+
+        response = service.translate(['SELECT a FROM t99', 'SELECT t1.a FROM t1'], flush=True)
+        self.assertEqual(response['mappings'], {})
+        self.assertEqual([result['mapping'] for result in response['results']], [{}, {}])
+        self.assertEqual(response['flushed'], [])
+        self.assertEqual(service.flush(), {'flushed': []})
+        self.assertEqual(sorted(os.listdir(mapping_dir)), files)
+
+    def test_concurrency_limit(self):
+        self.service._acquire()
+        self.service._acquire()
+        self.assertEqual(self.service.status()['active'], 2)
+        self.assertRaises(ServiceBusyError, self.service.translate, ['SELECT a FROM t1'])
+        self.service._release()
+        self.assertEqual(len(self.service.translate(['SELECT a FROM t1'])['results']), 1)
+        self.service._release()
+        self.assertEqual(self.service.status()['active'], 0)
+
+
+class TestTranslationServer(TestCase):
+    def setUp(self):
+        self.service = TranslationService(Parser('../conf/config.conf'), max_concurrent=1, timeout=0)
+
+    def _serve(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def _request(self, connection, method, path, body=None):
+        connection.request(method, path, json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_http(self):
+        server = make_server(self.service, port=0)
+        self._serve(server)
+        connection = http.client.HTTPConnection(*server.server_address)
+        status, body = self._request(connection, 'POST', '/translate', {'statements': ['SELECT t1.a, b FROM t1']})
+        self.assertEqual(status, 200)
+        self.assertEqual(body['results'][0]['query'], 'SELECT nueva_t1.nuevo_a_t1,\n       nuevo_b_t1\nFROM nueva_t1')
+        self.assertEqual(self._request(connection, 'POST', '/flush'), (200, {'flushed': []}))
+        self.assertEqual(self._request(connection, 'GET', '/status')[1]['statements'], 1)
+        self.assertEqual(self._request(connection, 'POST', '/translate', [])[0], 400)
+        self.assertEqual(self._request(connection, 'GET', '/nada')[0], 404)
+
+        self.service._acquire()
+        self.assertEqual(self._request(connection, 'POST', '/translate', {'statements': []})[0], 503)
+        self.service._release()
+        connection.close()
+
+    def test_unix_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'rosqltta.sock')
+        self._serve(make_server(self.service, socket_path=path))
+        connection = _UnixConnection(path)
+        status, body = self._request(connection, 'POST', '/translate', {'statements': ['SELECT a FROM t1']})
+        self.assertEqual((status, body['results'][0]['query']), (200, 'SELECT nuevo_a_t1\nFROM nueva_t1'))
+        connection.close()
@@ -0,0 +1,28 @@
+import io
+from unittest import TestCase
+from rosqltta.splitter import split_statements, Statement
+
+
+class TestSplitter(TestCase):
+    def test_split_statements(self):
+        lines = io.StringIO('-- cabecera\nSELECT a\tFROM t1;\n\nSELECT b -- columna\nFROM t2;')
+        statements = list(split_statements(lines))
+
+        self.assertEqual(statements, [Statement(' SELECT a FROM t1', 2, ['-- cabecera']),
+                                      Statement('    SELECT b  FROM t2', 4, ['-- columna']),
+                                      Statement('', 5, [])])
+
+    def test_literals(self):
+        # Los puntos y coma y los comentarios dentro de literales se mantienen
+        lines = io.StringIO("SELECT ';' a, \"--\" b, 'it\\'s;' c\nFROM t1; SELECT `x;y` FROM t2")
+        self.assertEqual([statement.text for statement in split_statements(lines)],
+                         ["SELECT ';' a, \"--\" b, 'it\\'s;' c  FROM t1", " SELECT `x;y` FROM t2"])
+
+    def test_join(self):
+        # Mismo resultado que juntar las lineas y separar por punto y coma
+        lines = ['SELECT a ', 'FROM t1; ', 'SELECT b FROM t2 --x ', ';']
+        self.assertEqual([statement.text for statement in split_statements(lines)],
+                         ' '.join(['SELECT a ', 'FROM t1; ', 'SELECT b FROM t2 ', ';']).split(';'))
+
+    def test_empty(self):
+        self.assertEqual(list(split_statements([])), [Statement('', 0, [])])
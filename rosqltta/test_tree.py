@@ -0,0 +1,140 @@
+import os
+import pickle
+import shutil
+import tempfile
+import nltk
+from unittest import TestCase
+from rosqltta.parser import Parser
+from rosqltta.tree import CompactTree, CompactNode, TREE_TYPES, compact, decode, encode, leaves
+
+QUERIES = [
+    'SELECT t1.a, b FROM t1 WHERE a > 10',
+    'SELECT t.a FROM (SELECT a, b FROM t2 WHERE b > 1) AS t',
+    'SELECT a, COUNT(b) FROM t1 GROUP BY a HAVING COUNT(b) > 1 ORDER BY a',
+    'SELECT t1.a, t2.b FROM t1 JOIN t2 ON t1.a = t2.a LEFT JOIN t3 ON t1.a = t3.a',
+    'SELECT a FROM t1 UNION ALL SELECT b FROM t2',
+    'CREATE TABLE t20 AS SELECT t1.a FROM t1',
+    'INSERT INTO TABLE t2 SELECT a, b FROM t1',
+    'SELECT a FROM db.t1',
+]
+
+
+class TestCompactTree(TestCase):
+    def setUp(self):
+        self.tree = nltk.Tree('A', [nltk.Tree('B', ['x', 'y']), nltk.Tree('C', [nltk.Tree('D', []), 'z']),
+                                    nltk.Tree('B', ['w'])])
+
+    def test_from_nltk(self):
+        tree = CompactTree.from_nltk(self.tree)
+        self.assertEqual(tree.labels, ['A', 'B', 'C', 'D'])
+        self.assertEqual(list(tree.label_ids), [0, 1, -1, -1, 2, 3, -1, 1, -1])
+        self.assertEqual(list(tree.ends), [9, 4, 3, 4, 7, 6, 7, 9, 9])
+        self.assertEqual(tree.tokens, ['x', 'y', 'z', 'w'])
+        self.assertEqual(tree.children(0), (1, 4, 7))
+        self.assertEqual(tree.leaves(4), ['z'])
+        self.assertEqual(tree.to_nltk(), self.tree)
+
+    def test_node(self):
+        root = compact(self.tree)
+        self.assertIs(compact(root), root)
+        self.assertEqual(root.label(), 'A')
+        self.assertEqual(len(root), 3)
+        self.assertEqual([child.label() for child in root], ['B', 'C', 'B'])
+        self.assertIs(root[1], root[1])
+        self.assertEqual(root[1][1], 'z')
+        self.assertEqual(root[-1].leaves(), ['w'])
+        self.assertEqual([child.label() for child in root[:-1]], ['B', 'C'])
+        self.assertEqual(root.leaves(), self.tree.leaves())
+        self.assertEqual([node.label() for node in root.subtrees()],
+                         [node.label() for node in self.tree.subtrees()])
+        self.assertEqual([node.label() for node in root.child_trees()], ['B', 'C', 'B'])
+        self.assertEqual(root[1], self.tree[1])
+        self.assertEqual(str(root), str(self.tree))
+        self.assertTrue(isinstance(root, TREE_TYPES) and isinstance(self.tree, TREE_TYPES))
+
+        root[0][1] = 'v'
+        self.assertEqual(root.leaves(), ['x', 'v', 'z', 'w'])
+        self.assertEqual(root.to_nltk()[0], nltk.Tree('B', ['x', 'v']))
+        with self.assertRaises(TypeError):
+            root[0] = 'v'
+
+    def test_remove(self):
+        root = compact(self.tree)
+        root.remove(root[1])
+        self.assertEqual([child.label() for child in root], ['B', 'B'])
+        self.assertEqual(root.leaves(), ['x', 'y', 'w'])
+        self.assertEqual([node.label() for node in root.subtrees()], ['A', 'B', 'B'])
+        root[0].remove('x')
+        self.assertEqual(root.to_nltk(), nltk.Tree('A', [nltk.Tree('B', ['y']), nltk.Tree('B', ['w'])]))
+        self.assertEqual(pickle.loads(pickle.dumps(root)).leaves(), ['y', 'w'])
+        self.assertRaises(ValueError, root.remove, 'z')
+
+    def test_pickle(self):
+        root = compact(self.tree)
+        copy = pickle.loads(pickle.dumps(root[1]))
+        self.assertIsInstance(copy, CompactNode)
+        self.assertEqual(copy.label(), 'C')
+        self.assertEqual(copy._tree.root, root)
+
+
+class TestEncoding(TestCase):
+    def setUp(self):
+        self.tree = nltk.Tree('A', [nltk.Tree('B', ['x', 'y']), nltk.Tree('C', [nltk.Tree('D', []), 'x']),
+                                    nltk.Tree('B', ['ñ'])])
+
+    def test_roundtrip(self):
+        data = encode(self.tree)
+        self.assertLess(len(data), len(pickle.dumps(self.tree, pickle.HIGHEST_PROTOCOL)))
+        self.assertEqual(decode(data), self.tree)
+        tree = decode(data, 'compact')
+        self.assertIsInstance(tree, CompactNode)
+        self.assertEqual(tree.to_nltk(), self.tree)
+        self.assertEqual(encode(compact(self.tree)), data)
+
+    def test_removed(self):
+        root = compact(self.tree)
+        root.remove(root[1])
+        self.assertEqual(decode(encode(root)), root.to_nltk())
+
+    def test_deep_tree(self):
+        tree = 'x'
+        for _ in range(5000):
+            tree = nltk.Tree('A', [tree])
+        self.assertEqual(decode(encode(tree), 'compact').leaves(), ['x'])
+        tree = decode(encode(tree))
+        self.assertIsInstance(tree, nltk.Tree)
+        self.assertEqual(leaves(tree), ['x'])
+
+    def test_errors(self):
+        self.assertRaises(ValueError, encode, nltk.Tree('A', ['x\0']))
+        self.assertRaises(ValueError, decode, b'XXXX' + encode(self.tree)[4:])
+
+
+class TestParserCompactTree(TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.conf = os.path.join(self.test_dir, 'config.conf')
+        Parser.save_json({'grammar_file': '../conf/grammar', 'mapping_dir': '../conf/mapping',
+                          'tree_format': 'compact'}, self.conf)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_parse_query(self):
+        tree = Parser(self.conf).parse_query(QUERIES[1]).tree
+        self.assertIsInstance(tree, CompactNode)
+        self.assertEqual(tree.to_nltk(), Parser('../conf/config.conf').parse_query(QUERIES[1]).tree)
+
+    def test_translate(self):
+        for backend in Parser.BACKENDS:
+            expected = Parser('../conf/config.conf', backend=backend)
+            parser = Parser(self.conf, backend=backend)
+            for query in QUERIES:
+                result, compact_result = expected.translate(query), parser.translate(query)
+                self.assertEqual(compact_result.query, result.query)
+                self.assertEqual((compact_result.target, compact_result.sources, compact_result.mapping),
+                                 (result.target, result.sources, result.mapping))
+
+    def test_tree_format(self):
+        Parser.save_json({'grammar_file': '../conf/grammar', 'tree_format': 'arena'}, self.conf)
+        self.assertRaises(ValueError, Parser, self.conf)
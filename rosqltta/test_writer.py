@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from rosqltta.writer import OutputWriter
+
+
+class TestOutputWriter(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'existente'), 'w') as f:
+            f.write('inicio\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read()
+
+    def test_write(self):
+        with OutputWriter(self.path, flush_every=1) as writer:
+            writer.write('nuevo', 'a\n')
+            writer.write('existente', 'b\n')
+            writer.write('nuevo', 'c\n')
+            # Hasta que se confirma, el fichero de salida no cambia
+            self.assertFalse(os.path.exists(os.path.join(self.path, 'nuevo')))
+            self.assertEqual(self._read('.nuevo.tmp'), 'a\nc\n')
+
+        self.assertEqual(self._read('nuevo'), 'a\nc\n')
+        self.assertEqual(self._read('existente'), 'b\n')
+        self.assertEqual(sorted(os.listdir(self.path)), ['existente', 'nuevo'])
+
+    def test_append(self):
+        writer = OutputWriter(self.path, append=True)
+        writer.write('existente', 'b\n')
+        writer.commit('existente')
+        self.assertEqual(self._read('existente'), 'inicio\nb\n')
+
+    def test_abort(self):
+        with self.assertRaises(ValueError):
+            with OutputWriter(self.path) as writer:
+                writer.write('existente', 'b\n')
+                raise ValueError
+
+        self.assertEqual(self._read('existente'), 'inicio\n')
+        self.assertEqual(os.listdir(self.path), ['existente'])
@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import sys
+from array import array
+from itertools import accumulate
+
+import nltk
+
+# Cabecera de la codificacion binaria (ver encode): version del formato, numero de etiquetas, de tokens distintos, de
+# nodos y de hojas
+ENCODING_VERSION = 1
+_HEADER = struct.Struct('<4sIIII')
+_MAGIC = b'RQT' + bytes([ENCODING_VERSION])
+
+
+class CompactTree(object):
+    """Arbol de una sentencia guardado en arrays paralelos, en preorden, en lugar de un nltk.Tree por nodo. Cada nodo
+    se identifica por su posicion en el preorden y guarda el identificador de su etiqueta (-1 en las hojas), la posicion
+    en la que termina su subarbol y el numero de hojas anteriores, de forma que las hojas de cualquier subarbol son un
+    trozo contiguo de tokens. Los tokens se pueden modificar y los hijos se pueden eliminar (ver CompactNode.remove),
+    pero no se pueden agregar nodos.
+
+    Los nodos se recorren con vistas CompactNode, que se crean al acceder a cada nodo por primera vez y se reutilizan
+    despues, de forma que un mismo nodo es siempre el mismo objeto.
+
+    Parameters
+    ----------
+    labels: list(str)
+        Diccionario de etiquetas.
+    label_ids: array('i')
+        Etiqueta de cada nodo, -1 si es una hoja o -2 si se ha eliminado.
+    ends: array('i')
+        Posicion siguiente al ultimo nodo del subarbol de cada nodo.
+    token_index: array('i')
+        Numero de hojas anteriores a cada nodo. En las hojas es la posicion de su token.
+    tokens: list(str)
+        Texto de las hojas. El de las hojas eliminadas es None.
+    """
+    __slots__ = ('labels', 'label_ids', 'ends', 'token_index', 'tokens', '_views', '_children', '_removed')
+
+    def __init__(self, labels, label_ids, ends, token_index, tokens):
+        self.labels = labels
+        self.label_ids = label_ids
+        self.ends = ends
+        self.token_index = token_index
+        self.tokens = tokens
+        self._views = [None] * len(label_ids)
+        self._children = [None] * len(label_ids)
+        self._removed = None in tokens
+
+    @classmethod
+    def from_nltk(cls, tree):
+        """Convierte un nltk.Tree, sin recursividad.
+
+        Parameters
+        ----------
+        tree: nltk.Tree
+            Arbol.
+
+        Returns
+        -------
+        CompactTree
+        """
+        labels = []
+        label_dict = {}
+        label_ids = array('i')
+        ends = array('i')
+        token_index = array('i')
+        tokens = []
+        # Cada entrada es un nodo por visitar o, si es un entero, el nodo cuyo subarbol termina
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if node.__class__ is int:
+                ends[node] = len(label_ids)
+                continue
+
+            token_index.append(len(tokens))
+            if isinstance(node, nltk.Tree):
+                label = node.label()
+                label_id = label_dict.get(label)
+                if label_id is None:
+                    label_id = label_dict[label] = len(labels)
+                    labels.append(label)
+                stack.append(len(label_ids))
+                label_ids.append(label_id)
+                ends.append(0)
+                stack.extend(reversed(node))
+            else:
+                label_ids.append(-1)
+                ends.append(len(label_ids))
+                tokens.append(node)
+
+        return cls(labels, label_ids, ends, token_index, tokens)
+
+    def __getstate__(self):
+        return self.labels, self.label_ids, self.ends, self.token_index, self.tokens
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    @property
+    def root(self):
+        """Vista del nodo raiz."""
+        return self.node(0)
+
+    def node(self, index):
+        """Devuelve la vista de un nodo, o el texto si es una hoja."""
+        view = self._views[index]
+        if view is not None:
+            return view
+
+        label_id = self.label_ids[index]
+        if label_id < 0:
+            return self.tokens[self.token_index[index]]
+
+        view = self._views[index] = CompactNode(self, index, self.labels[label_id])
+        return view
+
+    def children(self, index):
+        """Devuelve las posiciones de los hijos de un nodo."""
+        children = self._children[index]
+        if children is None:
+            ends = self.ends
+            children = []
+            child = index + 1
+            end = ends[index]
+            while child < end:
+                if self.label_ids[child] != -2:
+                    children.append(child)
+                child = ends[child]
+            children = self._children[index] = tuple(children)
+        return children
+
+    def leaves(self, index=0):
+        """Devuelve las hojas del subarbol de un nodo."""
+        end = self.ends[index]
+        leaves = self.tokens[self.token_index[index]:self.token_index[end] if end < len(self.label_ids)
+                             else len(self.tokens)]
+        if self._removed:
+            return [leaf for leaf in leaves if leaf is not None]
+        return leaves
+
+    def remove(self, index, position):
+        """Elimina un hijo de un nodo. El subarbol eliminado se marca con la etiqueta -2 y sus hojas con None, en lugar
+        de desplazar los arrays."""
+        children = self.children(index)
+        child = children[position]
+        self._children[index] = children[:position] + children[position + 1:]
+        end = self.ends[child]
+        for removed in range(child, end):
+            if self.label_ids[removed] == -1:
+                self.tokens[self.token_index[removed]] = None
+            self.label_ids[removed] = -2
+            self._views[removed] = None
+        self._removed = True
+
+    def to_nltk(self, index=0):
+        """Convierte el subarbol de un nodo en un nltk.Tree, sin recursividad."""
+        root = nltk.Tree(self.labels[self.label_ids[index]], [])
+        stack = [(root, index)]
+        while stack:
+            tree, index = stack.pop()
+            for child in self.children(index):
+                label_id = self.label_ids[child]
+                if label_id < 0:
+                    tree.append(self.tokens[self.token_index[child]])
+                else:
+                    subtree = nltk.Tree(self.labels[label_id], [])
+                    tree.append(subtree)
+                    stack.append((subtree, child))
+
+        return root
+
+
+class CompactNode(object):
+    """Vista de un nodo de un CompactTree con la interfaz de nltk.Tree que usan el parser y el formateador: label,
+    acceso a los hijos por posicion (las hojas son str y se pueden reemplazar), len, iteracion, leaves y subtrees. Para
+    depurar, se puede convertir con to_nltk.
+
+    Parameters
+    ----------
+    tree: CompactTree
+        Arbol al que pertenece.
+    index: int
+        Posicion del nodo en el preorden.
+    label: str
+        Etiqueta del nodo.
+    """
+    __slots__ = ('_tree', '_index', '_label')
+
+    def __init__(self, tree, index, label):
+        self._tree = tree
+        self._index = index
+        self._label = label
+
+    def label(self):
+        return self._label
+
+    def __len__(self):
+        tree = self._tree
+        return len(tree._children[self._index] or tree.children(self._index))
+
+    def __getitem__(self, i):
+        tree = self._tree
+        children = tree._children[self._index] or tree.children(self._index)
+        if i.__class__ is slice:
+            return [tree.node(child) for child in children[i]]
+        # Las vistas de los nodos ya visitados se devuelven sin pasar por CompactTree.node
+        child = children[i]
+        return tree._views[child] or tree.node(child)
+
+    def __setitem__(self, i, value):
+        tree = self._tree
+        child = tree.children(self._index)[i]
+        if tree.label_ids[child] >= 0 or not isinstance(value, str):
+            raise TypeError('Solo se pueden reemplazar las hojas de un CompactTree')
+        tree.tokens[tree.token_index[child]] = value
+
+    def remove(self, value):
+        """Elimina el primer hijo igual al valor, como list.remove."""
+        tree = self._tree
+        for position, child in enumerate(tree.children(self._index)):
+            node = tree.node(child)
+            if node is value or node == value:
+                tree.remove(self._index, position)
+                return
+        raise ValueError('{!r} no es un hijo del nodo'.format(value))
+
+    def __iter__(self):
+        tree = self._tree
+        return map(tree.node, tree._children[self._index] or tree.children(self._index))
+
+    def subtrees(self, filter=None):
+        """Devuelve los nodos del subarbol en preorden, empezando por el propio nodo, como nltk.Tree.subtrees."""
+        tree = self._tree
+        label_ids = tree.label_ids
+        for index in range(self._index, tree.ends[self._index]):
+            if label_ids[index] >= 0:
+                node = tree.node(index)
+                if filter is None or filter(node):
+                    yield node
+
+    def child_trees(self):
+        """Devuelve los hijos que no son hojas."""
+        tree = self._tree
+        label_ids = tree.label_ids
+        return [tree.node(child) for child in tree.children(self._index) if label_ids[child] >= 0]
+
+    def leaves(self):
+        return self._tree.leaves(self._index)
+
+    def to_nltk(self):
+        """Convierte el subarbol en un nltk.Tree."""
+        return self._tree.to_nltk(self._index)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactNode):
+            return self is other or self.to_nltk() == other.to_nltk()
+        if isinstance(other, nltk.Tree):
+            return self.to_nltk() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = object.__hash__
+
+    def __reduce__(self):
+        return _node_from_tree, (self._tree, self._index)
+
+    def __repr__(self):
+        return repr(self.to_nltk())
+
+    def __str__(self):
+        return str(self.to_nltk())
+
+    def pformat(self, *args, **kwargs):
+        return self.to_nltk().pformat(*args, **kwargs)
+
+
+def _node_from_tree(tree, index):
+    return tree.node(index)
+
+
+# Tipos de los nodos que no son hojas, para comprobarlos con isinstance
+TREE_TYPES = (nltk.Tree, CompactNode)
+
+
+def leaves(tree):
+    """Devuelve las hojas de un arbol como tree.leaves(), pero sin recursividad en los nltk.Tree, para que no dependa del
+    limite de recursividad de Python aunque el arbol sea muy profundo."""
+    if isinstance(tree, CompactNode):
+        return tree.leaves()
+
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, nltk.Tree):
+            stack.extend(reversed(node))
+        else:
+            result.append(node)
+
+    return result
+
+
+def compact(tree):
+    """Convierte un nltk.Tree en un CompactTree y devuelve la vista de su raiz. Si ya es un CompactNode, lo devuelve
+    tal cual."""
+    if tree is None or isinstance(tree, CompactNode):
+        return tree
+    return CompactTree.from_nltk(tree).root
+
+
+def _pack_array(values):
+    """Empaqueta enteros no negativos en el tipo de array mas pequeño en el que caben, precedido de su tipo."""
+    top = max(values, default=0)
+    typecode = 'B' if top < 1 << 8 else 'H' if top < 1 << 16 else 'I'
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return typecode.encode('ascii') + values.tobytes()
+
+
+def _unpack_array(data, offset, length):
+    """Desempaqueta un array de _pack_array con length elementos. Devuelve el array y la posicion siguiente."""
+    values = array(chr(data[offset]))
+    end = offset + 1 + length * values.itemsize
+    values.frombytes(data[offset + 1:end])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, end
+
+
+def _pack_strings(strings):
+    """Empaqueta cadenas separadas por el caracter nulo, precedidas de su longitud en bytes."""
+    data = '\0'.join(strings)
+    if data.count('\0') != max(len(strings) - 1, 0):
+        raise ValueError('Los nodos y las hojas del arbol no pueden contener el caracter nulo')
+    data = data.encode('utf-8')
+    return struct.pack('<I', len(data)) + data
+
+
+def _unpack_strings(data, offset, length):
+    """Desempaqueta length cadenas de _pack_strings. Devuelve la lista y la posicion siguiente."""
+    size, = struct.unpack_from('<I', data, offset)
+    end = offset + 4 + size
+    return (bytes(data[offset + 4:end]).decode('utf-8').split('\0') if length else []), end
+
+
+def encode(tree):
+    """Codifica un arbol, nltk.Tree o CompactNode, en un formato binario compacto para guardarlo en la cache o enviarlo
+    a otro proceso: un diccionario de etiquetas, un diccionario de tokens y, en preorden, la etiqueta de cada nodo (0 en
+    las hojas), el numero de hijos de cada nodo que no es una hoja y el token de cada hoja. Cada array se guarda con el
+    tipo de entero mas pequeño posible. El recorrido no es recursivo, de forma que se pueden codificar arboles de
+    cualquier profundidad.
+
+    Parameters
+    ----------
+    tree: nltk.Tree or CompactNode
+        Arbol.
+
+    Returns
+    -------
+    bytes
+        Arbol codificado. Ver decode.
+    """
+    labels, label_dict = [], {}
+    tokens, token_dict = [], {}
+    node_labels = []
+    child_counts = []
+    leaf_tokens = []
+    if isinstance(tree, CompactNode):
+        # Se recorren directamente los arrays, sin crear las vistas de los nodos
+        compact_tree = tree._tree
+        label_ids, token_index, leaf_texts = compact_tree.label_ids, compact_tree.token_index, compact_tree.tokens
+        for index in range(tree._index, compact_tree.ends[tree._index]):
+            label_id = label_ids[index]
+            if label_id == -1:
+                token = leaf_texts[token_index[index]]
+                token_id = token_dict.get(token)
+                if token_id is None:
+                    token_id = token_dict[token] = len(tokens)
+                    tokens.append(token)
+                node_labels.append(0)
+                leaf_tokens.append(token_id)
+            elif label_id >= 0:
+                label = compact_tree.labels[label_id]
+                label_id = label_dict.get(label)
+                if label_id is None:
+                    label_id = label_dict[label] = len(labels)
+                    labels.append(label)
+                node_labels.append(label_id + 1)
+                child_counts.append(len(compact_tree.children(index)))
+    else:
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, nltk.Tree):
+                label = node.label()
+                label_id = label_dict.get(label)
+                if label_id is None:
+                    label_id = label_dict[label] = len(labels)
+                    labels.append(label)
+                node_labels.append(label_id + 1)
+                child_counts.append(len(node))
+                stack.extend(reversed(node))
+            else:
+                token_id = token_dict.get(node)
+                if token_id is None:
+                    token_id = token_dict[node] = len(tokens)
+                    tokens.append(node)
+                node_labels.append(0)
+                leaf_tokens.append(token_id)
+
+    return b''.join([_HEADER.pack(_MAGIC, len(labels), len(tokens), len(node_labels), len(leaf_tokens)),
+                     _pack_strings(labels), _pack_strings(tokens), _pack_array(node_labels),
+                     _pack_array(child_counts), _pack_array(leaf_tokens)])
+
+
+def decode(data, tree_format='nltk'):
+    """Decodifica un arbol codificado con encode.
+
+    Parameters
+    ----------
+    data: bytes
+        Arbol codificado.
+    tree_format: str
+        'nltk' para obtener un nltk.Tree o 'compact' para obtener la vista de la raiz de un CompactTree.
+
+    Returns
+    -------
+    nltk.Tree or CompactNode
+        Arbol.
+    """
+    data = memoryview(data)
+    magic, label_count, token_count, node_count, leaf_count = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError('El arbol no esta codificado con la version {} del formato'.format(ENCODING_VERSION))
+
+    labels, offset = _unpack_strings(data, _HEADER.size, label_count)
+    tokens, offset = _unpack_strings(data, offset, token_count)
+    node_labels, offset = _unpack_array(data, offset, node_count)
+    child_counts, offset = _unpack_array(data, offset, node_count - leaf_count)
+    leaf_tokens, offset = _unpack_array(data, offset, leaf_count)
+
+    # Se recorren los nodos en preorden inverso, de forma que los hijos de cada nodo se han visto justo antes que el y
+    # estan al final de la pila, del ultimo al primero
+    node_labels = node_labels.tolist()
+    counts = iter(reversed(child_counts))
+    leaf_texts = [tokens[token] for token in leaf_tokens]
+    stack = []
+    if tree_format == 'nltk':
+        leaves = reversed(leaf_texts)
+        make_tree = nltk.Tree
+        for label_id in reversed(node_labels):
+            if not label_id:
+                stack.append(next(leaves))
+                continue
+
+            count = next(counts)
+            if count:
+                children = stack[:-count - 1:-1]
+                del stack[-count:]
+            else:
+                children = []
+            stack.append(make_tree(labels[label_id - 1], children))
+        return stack[0]
+
+    # Cada nodo ocupa en el preorden el tamaño de su subarbol
+    ends = [0] * node_count
+    index = node_count
+    for label_id in reversed(node_labels):
+        index -= 1
+        count = next(counts) if label_id else 0
+        if count:
+            size = 1 + sum(stack[-count:])
+            del stack[-count:]
+        else:
+            size = 1
+        stack.append(size)
+        ends[index] = index + size
+
+    label_ids = array('i', [label_id - 1 for label_id in node_labels])
+    token_index = array('i', accumulate((not label_id for label_id in node_labels[:-1]), initial=0))
+    return CompactTree(labels, label_ids, array('i', ends), token_index, leaf_texts).root
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+
+
+class OutputWriter(object):
+    """Escribe los ficheros de salida con un solo descriptor con buffer por fichero, en lugar de abrir y cerrar el
+    fichero en cada escritura. Cada fichero se escribe en un fichero temporal oculto en el mismo directorio, que se
+    renombra de forma atomica al confirmarlo. Si hay un error antes, los temporales se eliminan y los ficheros de salida
+    quedan como estaban.
+
+    Se puede usar como context manager: al salir se confirman todos los ficheros, o se descartan si hay una excepcion.
+
+    Parameters
+    ----------
+    path: str
+        Directorio de los ficheros de salida.
+    append: boolean
+        Agregar el contenido al final de los ficheros existentes en lugar de sobreescribirlos.
+    flush_every: int
+        Numero de escrituras tras las que se vacia el buffer de un fichero. Si es 0, solo se vacia cuando se llena
+        o al confirmar el fichero.
+    buffer_size: int
+        Tamaño del buffer de cada fichero, en bytes. Si es -1, se usa el tamaño por defecto.
+    """
+
+    def __init__(self, path, append=False, flush_every=0, buffer_size=-1):
+        self._path = path
+        self._append = append
+        self._flush_every = flush_every
+        self._buffer_size = buffer_size
+        self._files = {}
+        self._writes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def _tmp_path(self, name):
+        return os.path.join(self._path, '.{}.tmp'.format(name))
+
+    def _open(self, name):
+        """Abre el fichero temporal de un fichero de salida. Si se agrega al final, se copia antes el contenido
+        actual."""
+        tmp_path = self._tmp_path(name)
+        target = os.path.join(self._path, name)
+        if self._append and os.path.exists(target):
+            shutil.copyfile(target, tmp_path)
+            handle = io.open(tmp_path, 'a', buffering=self._buffer_size)
+        else:
+            handle = io.open(tmp_path, 'w', buffering=self._buffer_size)
+
+        self._files[name] = handle
+        self._writes[name] = 0
+        return handle
+
+    def write(self, name, text):
+        """Escribe un texto en un fichero de salida.
+
+        Parameters
+        ----------
+        name: str
+            Nombre del fichero, relativo al directorio de salida.
+        text: str
+            Texto.
+        """
+        handle = self._files.get(name) or self._open(name)
+        handle.write(text)
+        self._writes[name] += 1
+        if self._flush_every and not self._writes[name] % self._flush_every:
+            handle.flush()
+
+    def commit(self, name=None):
+        """Confirma un fichero, o todos si no se indica ninguno: cierra el temporal y lo renombra al fichero de
+        salida.
+
+        Parameters
+        ----------
+        name: str
+            Nombre del fichero.
+        """
+        for name in [name] if name is not None else list(self._files):
+            handle = self._files.pop(name, None)
+            if handle is None:
+                continue
+            handle.close()
+            os.replace(self._tmp_path(name), os.path.join(self._path, name))
+
+    def abort(self):
+        """Descarta todos los ficheros sin confirmar."""
+        for name, handle in list(self._files.items()):
+            handle.close()
+            os.remove(self._tmp_path(name))
+        self._files = {}